@@ -0,0 +1,262 @@
+import asyncio, hashlib, json, math, os, sqlite3, threading, time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterable, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from .metrics import REGISTRY, Counter, Gauges, Histogram
+from .config import (
+    ADMISSION_QUEUE_TIMEOUT, CHECKOUT_CONCURRENCY, CHECKOUT_QUEUE, CHECKOUT_RATE, CHECKOUT_BURST,
+    QUOTE_CONCURRENCY, QUOTE_QUEUE, QUOTE_RATE, QUOTE_BURST, RATE_LIMIT_BACKEND, RATE_LIMIT_DB,
+    RATE_LIMIT_MAX_KEYS, RATE_LIMIT_TRUST_PROXY, RATE_LIMIT_KEY_HEADER, RATE_LIMIT_API_KEYS, METRICS,
+)
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class Bulkhead:
+    """Cupo de `limit` requests a la vez para un grupo de rutas. Los que no
+    entran esperan en una cola FIFO de hasta `queue` lugares y `timeout`
+    segundos; con la cola llena se rechaza al instante (load shedding)."""
+
+    def __init__(self, limit: int, queue: int, timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = self.shed = self.timeouts = 0
+        self.service_ewma = 0.0  # segundos por request, para estimar Retry-After
+
+    def retry_after(self) -> float:
+        # lo que tardaría en vaciarse lo que ya está adelante
+        return max(1.0, self.service_ewma * (len(self._waiters) + 1) / max(1, self.limit))
+
+    async def acquire(self):
+        if self.inflight < self.limit and not self._waiters:
+            self.inflight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue:
+            self.shed += 1
+            raise Overloaded("queue_full", self.retry_after())
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.timeout)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():  # el cupo llegó justo al vencer: se devuelve
+                self.release(0.0)
+            else:
+                fut.cancel()
+            self.timeouts += 1
+            raise Overloaded("queue_timeout", self.retry_after())
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                self.release(0.0)
+            else:
+                fut.cancel()
+            raise
+        finally:
+            try:
+                self._waiters.remove(fut)
+            except ValueError:
+                pass
+        self.admitted += 1
+
+    def release(self, seconds: float):
+        if seconds:
+            self.service_ewma = seconds if not self.service_ewma else 0.9 * self.service_ewma + 0.1 * seconds
+        # el cupo pasa directo al primero de la cola que siga esperando
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.inflight -= 1
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "queue": self.queue, "inflight": self.inflight,
+                "waiting": len(self._waiters), "admitted": self.admitted, "shed": self.shed,
+                "timeouts": self.timeouts, "service_ms": round(self.service_ewma * 1000, 3)}
+
+class MemoryBuckets:
+    """Token buckets de un solo proceso; LRU acotado en `max_keys` clientes."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # clave -> (tokens, cuándo)
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """0 si hay token; si no, segundos hasta el próximo."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, at = self._data.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - at) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            self._data[key] = (tokens - 1 if not wait else tokens, now)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_keys:
+                self._data.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._data)
+
+class SQLiteBuckets:
+    """Token buckets compartidos entre workers del mismo host (SQLite en WAL)."""
+
+    def __init__(self, path: str = RATE_LIMIT_DB, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.path = path
+        self.max_keys = max_keys
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().execute("create table if not exists buckets (key text primary key, tokens real not null, "
+                             "at real not null)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=off")  # perder buckets en un corte solo los rellena
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.time()
+        c = self._conn()
+        c.execute("begin immediate")
+        try:
+            row = c.execute("select tokens, at from buckets where key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            c.execute("insert or replace into buckets (key, tokens, at) values (?, ?, ?)",
+                      (key, tokens - 1 if not wait else tokens, now))
+        finally:
+            c.execute("commit")
+        return wait
+
+    def purge(self) -> int:
+        """Borra los buckets llenos hace rato (equivalen a no tener fila)."""
+        return self._conn().execute("delete from buckets where at < ?", (time.time() - 3600,)).rowcount
+
+    def __len__(self):
+        return self._conn().execute("select count(*) from buckets").fetchone()[0]
+
+def make_buckets():
+    if RATE_LIMIT_BACKEND.lower() == "sqlite":
+        return SQLiteBuckets()
+    return MemoryBuckets()
+
+class Policy:
+    __slots__ = ("name", "bulkhead", "rate", "burst")
+
+    def __init__(self, name: str, concurrency: int, queue: int, rate: float, burst: float):
+        self.name = name
+        self.bulkhead = Bulkhead(concurrency, queue) if concurrency > 0 else None
+        self.rate = rate
+        self.burst = max(1.0, burst)
+
+ADMISSION_WAIT = REGISTRY.register(Histogram(
+    "admission_wait_seconds", "Espera en la cola de admisión por grupo de rutas", ("group",)))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "admission_rejected_total", "Requests rechazados: queue_full, queue_timeout (503) o rate_limited (429)",
+    ("group", "reason")))
+
+class Admission:
+    """Políticas por ruta exacta: token bucket por cliente y luego bulkhead."""
+
+    def __init__(self, routes: Dict[str, Policy], buckets=None):
+        self.routes = routes
+        self.policies = {p.name: p for p in routes.values()}
+        self.buckets = buckets if buckets is not None else make_buckets()
+        REGISTRY.register(Gauges("admission", "Control de admisión: inflight, waiting, limit por grupo",
+                                 ("group", "field"), self._gauges))
+
+    def _gauges(self) -> Iterable[Tuple[Tuple[str, ...], float]]:
+        for p in self.policies.values():
+            if p.bulkhead:
+                stats = p.bulkhead.stats()
+                for k in ("inflight", "waiting", "limit"):
+                    yield (p.name, k), stats[k]
+
+    async def rate_limited(self, policy: Policy, client: str) -> float:
+        key = f"{policy.name}:{client}"
+        if isinstance(self.buckets, MemoryBuckets):
+            return self.buckets.take(key, policy.rate, policy.burst)
+        return await run_in_threadpool(self.buckets.take, key, policy.rate, policy.burst)
+
+    def stats(self) -> dict:
+        return {"backend": type(self.buckets).__name__, "clients": len(self.buckets),
+                "groups": {p.name: {"rate": p.rate, "burst": p.burst,
+                                    **(p.bulkhead.stats() if p.bulkhead else {"limit": None})}
+                           for p in self.policies.values()}}
+
+def default_admission() -> Admission:
+    checkout = Policy("checkout", CHECKOUT_CONCURRENCY, CHECKOUT_QUEUE, CHECKOUT_RATE, CHECKOUT_BURST)
+    quote = Policy("quote", QUOTE_CONCURRENCY, QUOTE_QUEUE, QUOTE_RATE, QUOTE_BURST)
+    return Admission({"/v1/checkout/start": checkout,
+                      "/v1/pricing/quote": quote, "/v1/pricing/quote:batch": quote})
+
+_API_KEYS = {k.strip() for k in RATE_LIMIT_API_KEYS.split(",") if k.strip()}
+
+def client_key(scope) -> str:
+    """API key conocida (RATE_LIMIT_API_KEYS) o IP; X-Forwarded-For solo detrás
+    de un proxy propio (RATE_LIMIT_TRUST_PROXY=1), si no cualquiera la falsifica."""
+    headers = dict(scope.get("headers") or ())
+    key = headers.get(RATE_LIMIT_KEY_HEADER.lower().encode())
+    if key and key.decode("latin-1") in _API_KEYS:
+        return "key:" + hashlib.sha256(key).hexdigest()[:16]
+    if RATE_LIMIT_TRUST_PROXY:
+        fwd = headers.get(b"x-forwarded-for")
+        if fwd:
+            return "ip:" + fwd.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+async def _reject(send, status: int, retry_after: float, detail: str):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                            (b"retry-after", str(max(1, math.ceil(retry_after))).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+class AdmissionMiddleware:
+    """ASGI puro, por dentro de CORS (los rechazos llevan sus headers) y sin
+    tocar las rutas que no tienen política: el catálogo no comparte cupo con
+    checkout ni cotizaciones. El cupo se libera al terminar de enviar el body."""
+
+    def __init__(self, app, admission: Admission):
+        self.app = app
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        policy = self.admission.routes.get(scope.get("path")) if scope["type"] == "http" else None
+        if policy is None or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        if policy.rate > 0:
+            wait = await self.admission.rate_limited(policy, client_key(scope))
+            if wait:
+                if METRICS:
+                    ADMISSION_REJECTED.inc(policy.name, "rate_limited")
+                return await _reject(send, 429, wait, "Demasiadas peticiones; reintentar más tarde")
+        bulkhead = policy.bulkhead
+        if bulkhead is None:
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        try:
+            await bulkhead.acquire()
+        except Overloaded as e:
+            if METRICS:
+                ADMISSION_REJECTED.inc(policy.name, e.reason)
+            return await _reject(send, 503, e.retry_after, "Servicio saturado; reintentar más tarde")
+        t1 = time.perf_counter()
+        if METRICS:
+            ADMISSION_WAIT.observe(t1 - t0, policy.name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            bulkhead.release(time.perf_counter() - t1)
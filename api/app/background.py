@@ -0,0 +1,39 @@
+import asyncio, logging
+from typing import Awaitable, Callable, List
+
+log = logging.getLogger(__name__)
+
+async def every(interval: float, fn: Callable[[], Awaitable[None]], name: str):
+    """Ejecuta `fn` cada `interval` segundos; un error se registra y no detiene el ciclo."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await fn()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("tarea periódica %s falló", name)
+
+class Tasks:
+    """Tareas en segundo plano que viven lo mismo que la app (lifespan)."""
+
+    def __init__(self):
+        self._tasks: List[asyncio.Task] = []
+
+    def spawn(self, coro, name: str) -> asyncio.Task:
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.append(task)
+        return task
+
+    def periodic(self, interval: float, fn: Callable[[], Awaitable[None]], name: str):
+        if interval > 0:
+            self.spawn(every(interval, fn, name), name)
+
+    async def cancel_all(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def names(self) -> List[str]:
+        return [t.get_name() for t in self._tasks if not t.done()]
@@ -0,0 +1,100 @@
+import threading, time
+from collections import deque
+from typing import Deque, Optional, Tuple
+from .config import BREAKER_FAILURES, BREAKER_ERROR_RATE, BREAKER_MIN_CALLS, BREAKER_WINDOW, BREAKER_RESET
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitOpen(Exception):
+    """El upstream está marcado como caído: se falla sin esperar el timeout."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"circuito abierto; reintentar en {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """closed → open tras `failures` fallos seguidos o una tasa de error de
+    `error_rate` en la ventana (con al menos `min_calls`). Abierto, cada llamada
+    falla al instante; pasado `reset` deja pasar una sola de prueba (half_open)
+    y según cómo le vaya cierra o vuelve a abrir. Fallo = error de transporte o 5xx."""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, error_rate: float = BREAKER_ERROR_RATE,
+                 min_calls: int = BREAKER_MIN_CALLS, window: float = BREAKER_WINDOW, reset: float = BREAKER_RESET):
+        self.failures = failures
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset = reset
+        self._lock = threading.Lock()
+        self._calls: Deque[Tuple[float, float, bool]] = deque(maxlen=4096)  # (cuándo, segundos, ok)
+        self.state = CLOSED
+        self.consecutive = 0
+        self.opened_at: Optional[float] = None
+        self._probe_at: Optional[float] = None
+        self.trips = 0
+        self.rejected = 0
+
+    def _prune(self, now: float):
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+    def before(self):
+        """Llamar antes de cada petición; lanza CircuitOpen si no debe salir."""
+        if self.state == CLOSED:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and now - self.opened_at >= self.reset:
+                self.state, self._probe_at = HALF_OPEN, now
+                return
+            # half_open: una prueba a la vez; si quedó colgada (cancelada) se libera tras `reset`
+            if self.state == HALF_OPEN and now - self._probe_at >= self.reset:
+                self._probe_at = now
+                return
+            self.rejected += 1
+            raise CircuitOpen(max(0.0, self.reset - (now - self.opened_at)))
+
+    def record(self, ok: bool, seconds: float):
+        now = time.monotonic()
+        with self._lock:
+            self._calls.append((now, seconds, ok))
+            if ok:
+                self.consecutive = 0
+                if self.state == HALF_OPEN:
+                    self.state, self.opened_at = CLOSED, None
+                    self._calls.clear()  # los errores de antes de la caída no cuentan para volver a abrir
+                return
+            self.consecutive += 1
+            if self.state == HALF_OPEN:
+                self._trip(now)
+                return
+            if self.state == CLOSED:
+                self._prune(now)
+                errors = sum(1 for c in self._calls if not c[2])
+                if self.consecutive >= self.failures or (
+                        len(self._calls) >= self.min_calls and errors / len(self._calls) >= self.error_rate):
+                    self._trip(now)
+
+    def _trip(self, now: float):
+        self.state, self.opened_at = OPEN, now
+        self.trips += 1
+
+    @property
+    def is_open(self) -> bool:
+        return self.state != CLOSED
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            calls = list(self._calls)
+        lat = sorted(c[1] for c in calls)
+        pick = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 3) if lat else None
+        return {"state": self.state, "consecutive_failures": self.consecutive, "trips": self.trips,
+                "rejected": self.rejected,
+                "open_for": round(now - self.opened_at, 3) if self.opened_at is not None else None,
+                "recent": {"window": self.window, "calls": len(calls),
+                           "error_rate": round(sum(1 for c in calls if not c[2]) / len(calls), 4) if calls else None,
+                           "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}}
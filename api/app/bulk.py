@@ -0,0 +1,99 @@
+import codecs, json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from .models import Product
+
+_WS = " \t\r\n"
+
+class BadBody(ValueError):
+    pass
+
+class _ArrayScanner:
+    """Decodifica un arreglo JSON elemento por elemento a medida que llega el texto."""
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.text = ""
+        self.started = False
+        self.done = False
+
+    def feed(self, text: str, final: bool = False) -> List[Any]:
+        self.text += text
+        docs: List[Any] = []
+        t, pos, n = self.text, 0, len(self.text)
+        while not self.done:
+            while pos < n and (t[pos] in _WS or (t[pos] == "," and self.started)):
+                pos += 1
+            if pos >= n:
+                break
+            if not self.started:
+                if t[pos] != "[":
+                    raise BadBody("Se espera un arreglo JSON de productos")
+                self.started, pos = True, pos + 1
+            elif t[pos] == "]":
+                self.done, pos = True, pos + 1
+            else:
+                try:
+                    doc, end = self.decoder.raw_decode(t, pos)
+                except ValueError as e:
+                    if final:
+                        raise BadBody(f"JSON inválido: {e}")
+                    break  # elemento incompleto: esperar más datos
+                if end >= n and not final and t[pos] not in "{[\"":
+                    break  # un número podría continuar en el próximo chunk
+                docs.append(doc)
+                pos = end
+        self.text = t[pos:]
+        if self.done and self.text.strip(_WS):
+            raise BadBody("Contenido después del arreglo JSON")
+        return docs
+
+    def finish(self) -> List[Any]:
+        docs = self.feed("", final=True)
+        if not self.done:
+            raise BadBody("Se espera un arreglo JSON de productos")
+        return docs
+
+def _loads(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return BadBody(f"JSON inválido: {e}")
+
+async def iter_documents(chunks: AsyncIterator[bytes], ndjson: bool) -> AsyncIterator[Any]:
+    """Documentos del body a medida que llegan, sin cargarlo completo: NDJSON
+    (una línea inválida se entrega como BadBody y no corta la importación) o un
+    arreglo JSON (si está mal formado se lanza BadBody)."""
+    if ndjson:
+        buf = b""
+        async for chunk in chunks:
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield _loads(line)
+        if buf.strip():
+            yield _loads(buf)
+        return
+
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    scanner = _ArrayScanner()
+    try:
+        async for chunk in chunks:
+            for doc in scanner.feed(utf8.decode(chunk)):
+                yield doc
+        tail = utf8.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise BadBody("El body no es UTF-8 válido")
+    for doc in scanner.feed(tail) + scanner.finish():
+        yield doc
+
+def validate(index: int, doc: Any) -> Tuple[Optional[Product], Optional[Dict[str, Any]]]:
+    """-> (producto, None) o (None, error de la fila)"""
+    if isinstance(doc, BadBody):
+        return None, {"index": index, "id": None, "error": str(doc)}
+    try:
+        return Product.model_validate(doc), None
+    except ValidationError as e:
+        pid = doc.get("id") if isinstance(doc, dict) else None
+        return None, {"index": index, "id": pid, "error": e.errors(include_url=False, include_context=False)}
@@ -0,0 +1,133 @@
+import asyncio, logging, time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+FRESH, STALE = "fresh", "stale"
+_background: set = set()
+
+Token = Tuple[int, int]
+
+class TTLCache:
+    """LRU acotado con TTL y ventana stale-while-revalidate. Una carga toma
+    `token(key)` al empezar y `set` la descarta si la clave se invalidó entre
+    medio: `generation` sube al vaciar todo y cada clave invalidada lleva su
+    propia marca, así una escritura no tira las cargas de otras claves."""
+
+    def __init__(self, max_entries: int, ttl: float, stale: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale = stale
+        self.generation = 0
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._stamps: "OrderedDict[Hashable, int]" = OrderedDict()  # clave -> marca de su última invalidación
+        self._stamp = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Tuple[Any, Optional[str]]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None, None
+        value, stored = item
+        age = time.monotonic() - stored
+        if age <= self.ttl:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value, FRESH
+        if age <= self.ttl + self.stale:
+            self.stale_hits += 1
+            return value, STALE
+        del self._data[key]
+        self.misses += 1
+        return None, None
+
+    def token(self, key: Hashable) -> Token:
+        return self.generation, self._stamps.get(key, 0)
+
+    def set(self, key: Hashable, value: Any, token: Optional[Token] = None):
+        if token is not None and token != self.token(key):
+            return
+        self._data[key] = (value, time.monotonic())
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        if key is None:
+            self.generation += 1
+            self._data.clear()
+            self._stamps.clear()
+            return
+        self._data.pop(key, None)
+        self._stamp += 1
+        self._stamps[key] = self._stamp
+        self._stamps.move_to_end(key)
+        if len(self._stamps) > self.max_entries:
+            # sin la marca no se sabría si una carga en vuelo es vieja: se descartan todas
+            self._stamps.popitem(last=False)
+            self.generation += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.stale_hits + self.misses
+        return {"entries": len(self._data), "max_entries": self.max_entries,
+                "ttl": self.ttl, "stale": self.stale,
+                "hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses,
+                "hit_ratio": round((self.hits + self.stale_hits) / total, 4) if total else None}
+
+class SingleFlight:
+    """Une las cargas concurrentes de la misma clave en una sola llamada."""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    def running(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            return await asyncio.shield(fut)
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            value = await fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # evita "exception was never retrieved" si nadie más esperaba
+            raise
+        else:
+            fut.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+async def read_through(cache: TTLCache, flight: SingleFlight, key: Hashable,
+                       fetch: Callable[[], Awaitable[Any]]) -> Any:
+    value, state = cache.get(key)
+    if state == FRESH:
+        return value
+
+    async def load():
+        token = cache.token(key)
+        fresh = await fetch()
+        cache.set(key, fresh, token)
+        return fresh
+
+    if state == STALE:
+        if not flight.running(key):
+            task = asyncio.create_task(flight.do(key, load))
+            _background.add(task)
+            task.add_done_callback(_background.discard)
+            task.add_done_callback(_log_refresh_error)
+        return value
+    return await flight.do(key, load)
+
+def _log_refresh_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        log.warning("refresh en segundo plano falló: %r", task.exception())
@@ -0,0 +1,143 @@
+import json, hashlib, os, tempfile, threading, time
+from typing import Any, Dict, List, Optional, Tuple
+from .models import Product
+from .search import SearchIndex
+from .reloader import FileReloader, next_version
+from .metrics import observe_stage, stage
+from .config import PRODUCTS_FILE, CATALOG_WATCH_INTERVAL, CATALOG_FORMAT
+
+def write_atomic(path: str, data: bytes):
+    """Archivo temporal en el mismo directorio + rename: un lector (o el hilo de
+    recarga) ve el archivo viejo completo o el nuevo completo, nunca uno a medias."""
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp, os.stat(path).st_mode & 0o777)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+class CatalogSnapshot:
+    __slots__ = ("version", "etag", "products", "by_id", "index", "loaded_at", "load_ms",
+                 "base_version", "changed", "deleted")
+
+    def __init__(self, version: int, etag: str, products: List[Product], load_ms: float,
+                 prev: Optional["CatalogSnapshot"] = None):
+        self.version = version
+        self.etag = etag
+        self.products = products
+        self.by_id: Dict[str, Product] = {p.id: p for p in products}
+        self.index = SearchIndex(products)
+        self.loaded_at = time.time()
+        self.load_ms = load_ms
+        # versión en la que cambió cada producto y en la que se borró cada id,
+        # desde la primera carga de este proceso (`base_version`); las versiones
+        # son marcas de tiempo, así que una de antes del arranque queda por debajo
+        if prev is None:
+            self.base_version = version
+            self.changed = {p.id: version for p in products}
+            self.deleted: Dict[str, int] = {}
+        else:
+            self.base_version = prev.base_version
+            old = prev.by_id
+            self.changed = {p.id: prev.changed[p.id] if old.get(p.id) == p else version for p in products}
+            self.deleted = {pid: v for pid, v in prev.deleted.items() if pid not in self.by_id}
+            self.deleted.update((pid, version) for pid in old if pid not in self.by_id)
+
+    def changes_since(self, since: int) -> Optional[Tuple[List[Product], List[str]]]:
+        """Productos cambiados e ids borrados después de `since`; None (export
+        completo) si esa versión es anterior a la primera carga de este proceso
+        o posterior a la actual (de otro worker que recargó antes)."""
+        if since < self.base_version or since > self.version:
+            return None
+        changed = [p for p in self.products if self.changed[p.id] > since]
+        return changed, [pid for pid, v in self.deleted.items() if v > since]
+
+class Catalog(FileReloader):
+    """Catálogo compartido por todo el proceso: se carga una vez y se recarga
+    cuando cambia el archivo. Los lectores toman `snapshot` y trabajan sobre
+    esa referencia inmutable."""
+
+    thread_name = "catalog-watch"
+
+    def __init__(self, path: str = PRODUCTS_FILE, interval: float = CATALOG_WATCH_INTERVAL,
+                 format: str = CATALOG_FORMAT):
+        self._snap: Optional[CatalogSnapshot] = None
+        self._write_lock = threading.Lock()
+        self.format = format
+        self.built = 0  # snapshots binarios construidos por este proceso (modo mmap)
+        super().__init__(path, interval)
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        return self._snap
+
+    def _build(self):
+        if self.format == "mmap":
+            return self._map()
+        t0, at = time.perf_counter(), time.time()
+        with stage("catalog_parse"):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            products = [Product(**p) for p in data]
+        with stage("catalog_etag"):
+            canon = json.dumps(data, ensure_ascii=False, sort_keys=True).encode()
+            etag = hashlib.md5(canon).hexdigest()
+        version = next_version(self._snap.version if self._snap else 0, at)
+        with stage("catalog_index"):
+            snap = CatalogSnapshot(version, etag, products, 0.0, self._snap)
+        snap.load_ms = (time.perf_counter() - t0) * 1000
+        observe_stage("catalog_load", snap.load_ms / 1000)
+        # el swap de la referencia es atómico: un request ve el snapshot viejo o el nuevo
+        self._snap = snap
+
+    def _map(self):
+        # uno de los workers construye el .fscat; el resto (y los que arrancan después) solo lo mapea
+        from .catalog_mmap import MappedSnapshot, ensure_built
+        t0 = time.perf_counter()
+        with stage("catalog_mmap_build"):
+            path, built = ensure_built(self.path)
+        snap = MappedSnapshot(path)
+        snap.load_ms = (time.perf_counter() - t0) * 1000
+        observe_stage("catalog_load", snap.load_ms / 1000)
+        self.built += built
+        self._snap = snap
+
+    def upsert(self, rows: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """Mezcla `rows` por id sobre el archivo (los campos enviados reemplazan
+        a los existentes), lo reescribe de forma atómica y recarga. -> (nuevos, actualizados)"""
+        with self._write_lock:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            pos = {d["id"]: i for i, d in enumerate(data)}
+            inserted = updated = 0
+            for row in rows:
+                i = pos.get(row["id"])
+                if i is None:
+                    pos[row["id"]] = len(data)
+                    data.append(row)
+                    inserted += 1
+                else:
+                    data[i] = {**data[i], **row}
+                    updated += 1
+            write_atomic(self.path, json.dumps(data, ensure_ascii=False, indent=2).encode())
+            self.reload(force=True)
+        return inserted, updated
+
+    def stats(self) -> dict:
+        snap = self._snap
+        return {
+            "version": snap.version,
+            "etag": snap.etag,
+            "products": len(snap.products),
+            "loaded_at": snap.loaded_at,
+            "reload_ms": round(snap.load_ms, 3),
+            "format": self.format,
+            **({"file": snap.path, "bytes": snap.size, "built": self.built} if self.format == "mmap" else {}),
+            **self.reload_stats(),
+        }
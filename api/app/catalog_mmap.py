@@ -0,0 +1,459 @@
+"""Snapshot binario del catálogo para varios workers.
+
+Un archivo (`<products.json>.fscat`) con columnas de ancho fijo, los registros
+en JSON compacto y el índice de búsqueda ya construido. Cada worker lo abre con
+mmap de solo lectura: las páginas viven en el page cache del sistema y se
+comparten entre procesos, los `Product` se decodifican recién cuando se piden y
+los bitsets del índice se convierten a `int` al consultarlos. Abrirlo cuesta
+milisegundos; construirlo lo hace un solo worker (lock de archivo) cuando cambia
+la fuente, y el reemplazo es atómico (archivo temporal + rename): un lector
+sigue con el mapeo viejo hasta que suelta la referencia. La imagen de Docker lo
+trae construido (y validado contra `Product`) desde el build: el arranque no
+vuelve a parsear ni validar el JSON.
+
+    cd api && python -m app.catalog_mmap data/products.json   # -> data/products.json.fscat
+"""
+import array, hashlib, json, marshal, mmap, os, struct, subprocess, sys, time, zlib
+from collections import OrderedDict
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from .models import Product
+from .reloader import file_sig, next_version
+from .search import FACETS, SORTS, SearchIndex, _RangeIndex, _bits, _mask, normalize
+from .config import CATALOG_MMAP_CACHE, CATALOG_MMAP_MASKS
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock, en el peor caso dos workers construyen el mismo archivo
+    fcntl = None
+
+MAGIC = b"FSCAT\x00\x01\x00"
+_HEADER = struct.Struct("<8sII")  # magic, largo de la metadata, reservado
+_ALIGN = 8
+
+def bin_path(source: str) -> str:
+    return source + ".fscat"
+
+def _etag(data: Any) -> str:
+    # mismo ETag que el catálogo de objetos (catalog.Catalog._build)
+    return hashlib.md5(json.dumps(data, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+def _runtime() -> Tuple[Any, ...]:
+    # marshal y los arreglos nativos dependen de la versión de Python y del endianness
+    return (sys.version_info[:2], sys.byteorder, array.array("I").itemsize)
+
+class _Writer:
+    def __init__(self):
+        self.buf = bytearray()
+        self.sections: Dict[str, Tuple[int, int, str]] = {}
+
+    def add(self, name: str, typecode: str, values):
+        self.add_bytes(name, typecode, array.array(typecode, values).tobytes())
+
+    def add_bytes(self, name: str, typecode: str, data: bytes):
+        self.buf.extend(b"\x00" * (-len(self.buf) % _ALIGN))
+        self.sections[name] = (len(self.buf), len(data), typecode)
+        self.buf.extend(data)
+
+    def add_strings(self, name: str, values: List[str]):
+        self.add_blobs(name, [v.encode() for v in values])
+
+    def add_blobs(self, name: str, blobs: List[bytes]):
+        offsets, pos = [0], 0
+        for b in blobs:
+            pos += len(b)
+            offsets.append(pos)
+        self.add(name + ".off", "Q", offsets)
+        self.add_bytes(name, "B", b"".join(blobs))
+
+_BITSET, _IDS = 0, 1
+_EMPTY = 0xFFFFFFFF
+
+def _id_table(ids: List[str]) -> List[int]:
+    """Tabla hash abierta (sondeo lineal, crc32) id -> posición, al menos 2n casillas."""
+    size = 1 << max(3, (2 * len(ids) - 1).bit_length())
+    table = [_EMPTY] * size
+    for i, pid in enumerate(ids):
+        h = zlib.crc32(pid.encode()) & (size - 1)
+        while table[h] != _EMPTY:
+            h = (h + 1) & (size - 1)
+        table[h] = i
+    return table
+
+def _pack_mask(m: int, nbytes: int) -> bytes:
+    # tokens raros (sku, nombres únicos): la lista de documentos ocupa mucho menos que el bitset
+    raw = m.to_bytes((m.bit_length() + 7) // 8, "little")
+    if m.bit_count() * 4 < len(raw):
+        return bytes([_IDS]) + array.array("I", _bits(m, nbytes)).tobytes()
+    return bytes([_BITSET]) + raw
+
+def build(data: List[Dict[str, Any]], path: str, generation: int = 1,
+          source: Optional[Tuple[int, int, int]] = None, source_sha256: Optional[str] = None) -> int:
+    """Escribe el snapshot de `data` (filas de products.json o de Supabase) en
+    `path` de forma atómica. -> bytes escritos"""
+    from .catalog import write_atomic  # catalog importa este módulo
+    products = [Product(**p) for p in data]
+    idx = SearchIndex(products)
+    n = len(products)
+    w = _Writer()
+    masks: List[int] = []
+
+    def table(values: List[int]) -> int:
+        base = len(masks)
+        masks.extend(values)
+        return base
+
+    meta: Dict[str, Any] = {
+        "runtime": _runtime(), "n": n, "nbytes": idx.nbytes, "generation": generation,
+        "etag": _etag(data), "source": tuple(source) if source else None, "source_sha256": source_sha256,
+        "built_at": time.time(),
+        "vocab": idx.vocab, "tokens": table([idx.tokens[t] for t in idx.vocab]),
+        "facets": {f: (list(idx.facets[f]), table(list(idx.facets[f].values()))) for f in FACETS},
+        "labels": idx.labels, "in_stock": table([idx.in_stock]),
+        "price": (idx.price.step, table(idx.price.cum)), "names": (idx.names.step, table(idx.names.cum)),
+    }
+    w.add_strings("ids", [p.id for p in products])
+    w.add("ids.table", "I", _id_table([p.id for p in products]))
+    w.add_strings("records", [p.model_dump_json() for p in products])
+    w.add_strings("names", [normalize(p.name) for p in products])
+    for s in idx.order:
+        w.add(f"order.{s}", "I", idx.order[s])
+        w.add(f"rank.{s}", "I", idx.rank[s])
+    w.add("price.values", "q", idx.price.sorted_values)
+    w.add("price.order", "I", idx.price.order)
+    w.add("names.order", "I", idx.names.order)
+    w.add_blobs("masks", [_pack_mask(m, idx.nbytes) for m in masks])
+    for f in FACETS:
+        pos = {k: i for i, k in enumerate(idx.facets[f])}
+        docs = idx.doc_facets[f]
+        if all(len(keys) <= 1 for keys in docs):  # club, liga, temporada...: una columna fija
+            w.add(f"docs.{f}", "I", [pos[keys[0]] if keys else _EMPTY for keys in docs])
+        else:
+            w.add_blobs(f"docs.{f}", [array.array("I", (pos[k] for k in keys)).tobytes() for keys in docs])
+    meta["sections"] = w.sections
+
+    head = marshal.dumps(meta)
+    pad = -(_HEADER.size + len(head)) % _ALIGN
+    out = _HEADER.pack(MAGIC, len(head) + pad, 0) + head + b"\x00" * pad + bytes(w.buf)
+    write_atomic(path, out)
+    return len(out)
+
+def read_meta(path: str) -> Optional[Dict[str, Any]]:
+    """Metadata del archivo o None si no existe, está truncado o es de otro runtime."""
+    try:
+        with open(path, "rb") as f:
+            magic, size, _ = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC:
+                return None
+            meta = marshal.loads(f.read(size))
+    except (OSError, ValueError, EOFError, struct.error):
+        return None
+    return meta if meta.get("runtime") == _runtime() else None
+
+class _Masks:
+    """Bitsets guardados en el archivo, que `load` convierte a `int` al pedirlos.
+    Como tabla (`keys`) responde `get`/`items` igual que un dict; sin `keys`, por posición."""
+    __slots__ = ("_load", "_base", "_keys", "_n")
+
+    def __init__(self, load: Callable[[int], int], base: int, keys: Optional[List[str]] = None, n: int = 0):
+        self._load, self._base = load, base
+        self._keys = {k: i for i, k in enumerate(keys)} if keys is not None else None
+        self._n = len(keys) if keys is not None else n
+
+    def mask(self, i: int) -> int:
+        return self._load(self._base + i)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, key) -> int:
+        return self.mask(self._keys[key] if self._keys is not None else key)
+
+    def get(self, key: str, default: int = 0) -> int:
+        i = self._keys.get(key)
+        return default if i is None else self.mask(i)
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        for k, i in self._keys.items():
+            yield k, self.mask(i)
+
+class _Strings:
+    __slots__ = ("_blob", "_off")
+
+    def __init__(self, blob: memoryview, off: memoryview):
+        self._blob, self._off = blob, off
+
+    def raw(self, i: int) -> memoryview:
+        return self._blob[self._off[i]:self._off[i + 1]]
+
+    def __getitem__(self, i: int) -> str:
+        return str(self.raw(i), "utf-8")
+
+    def __len__(self) -> int:
+        return len(self._off) - 1
+
+class MappedProducts(Sequence):
+    """Secuencia de `Product` sobre el archivo. Lo que usan la búsqueda y los
+    lookups (ids, nombres, precios ordenados, órdenes) son columnas de ancho
+    fijo; el producto completo se decodifica a pedido, con un LRU por worker
+    para los más consultados."""
+
+    def __init__(self, view: "_View", cache: int = CATALOG_MMAP_CACHE):
+        self.ids = view.strings("ids")
+        self.records = view.strings("records")
+        self._n = len(self.ids)
+        records = self.records
+
+        def decode(i: int) -> Product:
+            return Product.model_validate_json(bytes(records.raw(i)))
+        # closures sin referencia a self: sin ciclos, el snapshot viejo (y su mmap)
+        # se libera por conteo de referencias apenas termina el último request que lo usa
+        self._decode = decode
+        self._cached = lru_cache(maxsize=cache)(decode)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._cached(j) for j in range(*i.indices(self._n))]
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return self._cached(i)
+
+    def __iter__(self) -> Iterator[Product]:
+        # recorridos completos (export): sin pasar por el LRU para no desalojar lo caliente
+        for i in range(self._n):
+            yield self._decode(i)
+
+class MappedIds:
+    """id -> Product con la tabla hash del archivo (sin dict por worker)."""
+
+    def __init__(self, products: MappedProducts, view: "_View"):
+        self.products = products
+        self._table = view.array("ids.table")
+        self._ids = products.ids
+
+    def _find(self, pid: str) -> int:
+        key = pid.encode()
+        table, ids = self._table, self._ids
+        last = len(table) - 1
+        h = zlib.crc32(key) & last
+        while True:
+            i = table[h]
+            if i == _EMPTY:
+                return -1
+            if ids.raw(i) == key:
+                return i
+            h = (h + 1) & last
+
+    def get(self, pid: str, default: Optional[Product] = None) -> Optional[Product]:
+        i = self._find(pid)
+        return default if i < 0 else self.products[i]
+
+    def __contains__(self, pid: str) -> bool:
+        return self._find(pid) >= 0
+
+    def __getitem__(self, pid: str) -> Product:
+        i = self._find(pid)
+        if i < 0:
+            raise KeyError(pid)
+        return self.products[i]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._ids[i] for i in range(len(self._ids)))
+
+class _NameKeys:
+    """`_RangeIndex.sorted_values` de nombres: (nombre normalizado, id) por rango."""
+    __slots__ = ("_order", "_names", "_ids")
+
+    def __init__(self, order: memoryview, names: _Strings, ids: _Strings):
+        self._order, self._names, self._ids = order, names, ids
+
+    def __getitem__(self, r: int) -> Tuple[str, str]:
+        i = self._order[r]
+        return self._names[i], self._ids[i]
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+class _DocFacets:
+    """Claves de una faceta por documento (posiciones en la lista de claves)."""
+    __slots__ = ("_blob", "_off", "_keys")
+
+    def __init__(self, blob: memoryview, off: memoryview, keys: List[str]):
+        self._blob, self._off, self._keys = blob, off, keys
+
+    def __getitem__(self, i: int) -> Tuple[str, ...]:
+        keys = self._keys
+        return tuple(keys[k] for k in self._blob[self._off[i]:self._off[i + 1]].cast("I"))
+
+class _DocFacet:
+    """Faceta de a lo sumo un valor por documento: columna de posiciones."""
+    __slots__ = ("_col", "_one")
+
+    def __init__(self, col: memoryview, keys: List[str]):
+        self._col = col
+        self._one = [(k,) for k in keys]
+
+    def __getitem__(self, i: int) -> Tuple[str, ...]:
+        k = self._col[i]
+        return () if k == _EMPTY else self._one[k]
+
+class _View:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size, _ = _HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} no es un snapshot de catálogo")
+        self.meta = marshal.loads(self.mm[_HEADER.size:_HEADER.size + size])
+        if self.meta["runtime"] != _runtime():
+            raise ValueError(f"{path} fue construido por otro runtime de Python")
+        self.data = memoryview(self.mm)[_HEADER.size + size:]
+
+    def array(self, name: str) -> memoryview:
+        off, length, typecode = self.meta["sections"][name]
+        return self.data[off:off + length].cast(typecode)
+
+    def strings(self, name: str) -> _Strings:
+        return _Strings(self.array(name), self.array(name + ".off"))
+
+def _mask_loader(blob: memoryview, off: memoryview, nbytes: int) -> Callable[[int], int]:
+    def load(j: int) -> int:
+        raw = blob[off[j]:off[j + 1]]
+        if raw[0] == _BITSET:
+            return int.from_bytes(raw[1:], "little")
+        ids = array.array("I")
+        ids.frombytes(raw[1:])
+        return _mask(ids, nbytes)
+    return load
+
+class MappedSearchIndex(SearchIndex):
+    """El mismo `SearchIndex` con sus estructuras leídas del archivo en lugar
+    de construidas: mismos métodos de búsqueda, mismos resultados."""
+
+    def __init__(self, products: MappedProducts, view: _View, cache: int = CATALOG_MMAP_MASKS):
+        meta = view.meta
+        self.nbytes = meta["nbytes"]
+        self._load = lru_cache(maxsize=cache)(_mask_loader(view.array("masks"), view.array("masks.off"), self.nbytes))
+        table = lambda base, keys=None, n=0: _Masks(self._load, base, keys, n)
+        self.products = products
+        n = meta["n"]
+        self.all = (1 << n) - 1
+        self.vocab = meta["vocab"]
+        self.tokens = table(meta["tokens"], self.vocab)
+        self.facets = {f: table(base, keys) for f, (keys, base) in meta["facets"].items()}
+        self.labels = meta["labels"]
+        self.doc_facets = {f: _DocFacets(view.array(f"docs.{f}"), view.array(f"docs.{f}.off"), keys)
+                           if f"docs.{f}.off" in meta["sections"] else _DocFacet(view.array(f"docs.{f}"), keys)
+                           for f, (keys, _) in meta["facets"].items()}
+        self.in_stock = table(meta["in_stock"], n=1)[0]
+        self.price = self._range(view.array("price.values"), view.array("price.order"), *meta["price"], table)
+        names = _NameKeys(view.array("names.order"), view.strings("names"), products.ids)
+        self.names = self._range(names, view.array("names.order"), *meta["names"], table)
+        self.order = {s: view.array(f"order.{s}") for s in SORTS}
+        self.rank = {s: view.array(f"rank.{s}") for s in SORTS}
+        self._prefix_cache = OrderedDict()
+        self._facet_totals = {}
+
+    def _range(self, values, order, step: int, base: int, table) -> _RangeIndex:
+        r = _RangeIndex.__new__(_RangeIndex)
+        r.nbytes, r.sorted_values, r.order, r.step = self.nbytes, values, order, step
+        r.cum = table(base, n=(len(order) + step - 1) // step + 1)
+        return r
+
+class MappedSnapshot:
+    """Misma interfaz que `catalog.CatalogSnapshot`. `version` es la generación
+    del archivo (marca de tiempo del build), igual en todos los workers. Sin historial de cambios: un
+    `since` distinto de la versión actual se responde con export completo."""
+
+    def __init__(self, path: str):
+        t0 = time.perf_counter()
+        view = _View(path)
+        meta = view.meta
+        self.path = path
+        self.version = meta["generation"]
+        self.base_version = self.version
+        self.etag = meta["etag"]
+        self.products = MappedProducts(view)
+        self.by_id = MappedIds(self.products, view)
+        self.index = MappedSearchIndex(self.products, view)
+        self.size = len(view.mm)
+        self.loaded_at = time.time()
+        self.load_ms = (time.perf_counter() - t0) * 1000
+
+    def changes_since(self, since: int) -> Optional[Tuple[List[Product], List[str]]]:
+        return ([], []) if since == self.version else None
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def build_file(source: str, path: str, generation: int):
+    sig = tuple(file_sig(source))
+    with open(source, "rb") as f:
+        raw = f.read()
+    build(json.loads(raw), path, generation, sig, hashlib.sha256(raw).hexdigest())
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _fresh(meta: Optional[Dict[str, Any]], source: str) -> bool:
+    """¿`meta` es de la versión actual de `source`? Primero por inode/mtime/tamaño;
+    si solo cambió el inode o el mtime (archivo copiado a una imagen, volumen montado)
+    vale el sha256 del contenido, y el snapshot construido en el build se usa tal cual."""
+    if not meta:
+        return False
+    sig = tuple(file_sig(source))
+    if meta["source"] == sig:
+        return True
+    return bool(meta.get("source_sha256")) and meta["source"] is not None and meta["source"][2] == sig[2] \
+        and _sha256(source) == meta["source_sha256"]
+
+def ensure_built(source: str, path: Optional[str] = None) -> Tuple[str, bool]:
+    """Reconstruye `path` si no corresponde a la versión actual de `source`.
+    Un solo proceso construye; los demás esperan el lock y reutilizan el
+    archivo. La construcción corre en un proceso aparte: arma todos los
+    `Product` y el índice completo, y esa memoria no vuelve al sistema si se
+    hace dentro del worker. -> (path, construido por este proceso)"""
+    source = os.path.abspath(source)
+    path = os.path.abspath(path or bin_path(source))
+    if _fresh(read_meta(path), source):
+        return path, False
+    with open(path + ".lock", "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            meta = read_meta(path)
+            if _fresh(meta, source):
+                return path, False
+            generation = next_version(meta["generation"] if meta else 0, time.time())
+            r = subprocess.run([sys.executable, "-m", "app.catalog_mmap", "--build", source, path, str(generation)],
+                               cwd=_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if r.returncode:
+                raise ValueError(f"no se pudo construir {path}: {r.stderr.decode(errors='replace').strip()[-500:]}")
+            return path, True
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--build"]:  # usado por ensure_built, con el lock ya tomado
+        build_file(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        sys.exit(0)
+    src = sys.argv[1] if len(sys.argv) > 1 else "data/products.json"
+    t0 = time.perf_counter()
+    out, built = ensure_built(src, sys.argv[2] if len(sys.argv) > 2 else None)
+    t1 = time.perf_counter()
+    snap = MappedSnapshot(out)
+    print(f"{out}: {len(snap.products)} productos, {snap.size} bytes, versión {snap.version}, "
+          f"{'construido' if built else 'vigente'} en {(t1 - t0) * 1000:.1f} ms, abierto en {snap.load_ms:.1f} ms")
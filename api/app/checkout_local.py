@@ -0,0 +1,111 @@
+import threading, uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from .models import Product
+from .reservations import OrderClosed, ReservationStore
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _wanted(items: List[Dict[str, Any]]) -> Dict[str, int]:
+    wanted: Dict[str, int] = {}
+    for it in items:
+        wanted[it["product_id"]] = wanted.get(it["product_id"], 0) + it["qty"]
+    return {pid: qty for pid, qty in wanted.items() if qty > 0}  # como checkout_create.sql
+
+class LocalCheckoutStore:
+    """Implementación en memoria de las RPC de sql/checkout_create.sql y
+    sql/stock_holds.sql: misma entrada, misma respuesta y mismas reglas de
+    reserva. Se usa en modo JSON y en pruebas sin Supabase."""
+
+    def __init__(self, product_of: Callable[[str], Optional[Product]]):
+        self.product_of = product_of
+        self.stock = ReservationStore(self._stock_of)
+        self._lock = threading.Lock()
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self.items: Dict[str, List[Dict[str, Any]]] = {}
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+
+    def _stock_of(self, pid: str) -> Optional[int]:
+        p = self.product_of(pid)
+        if p is None:
+            return 0
+        return p.stock
+
+    def available(self, pid: str) -> Optional[int]:
+        """Stock disponible; None si el producto no controla stock."""
+        return self.stock.available(pid)
+
+    def checkout_create(self, order: Dict[str, Any], items: List[Dict[str, Any]],
+                        return_url: str) -> Dict[str, Any]:
+        order_id = str(uuid.uuid4())
+        self.stock.reserve(order_id, _wanted(items))
+
+        row = {"id": order_id, "created_at": _now(), **order, "status": order.get("status") or "pending"}
+        sess = {"id": str(uuid.uuid4()), "created_at": _now(), "order_id": order_id,
+                "amount": row["total"], "return_url": return_url, "status": "pending"}
+        with self._lock:
+            self.orders[order_id] = row
+            self.items[order_id] = [{**it, "order_id": order_id} for it in items]
+            self.sessions[sess["id"]] = sess
+        return {"order": row, "session": sess}
+
+    def stock_holds_commit(self, order_id: str) -> List[str]:
+        """Reserva -> venta y la orden queda `paid` en el mismo paso: un segundo
+        aprobado (otra clave, otro worker, el estado aún en la cola) ve la orden
+        cerrada y no vende dos veces. Solo una orden `expired` vuelve a tomar stock."""
+        with self._lock:
+            row = self.orders.get(order_id)
+            if row is None or row["status"] not in ("pending", "expired"):
+                raise OrderClosed(order_id, row["status"] if row else "missing")
+            wanted = _wanted(self.items[order_id]) if row["status"] == "expired" else None
+            sold = self.stock.commit(order_id, wanted)
+            row["status"] = "paid"
+        return sorted(sold)
+
+    def stock_holds_release(self, order_id: str, status: str = "rejected"):
+        with self._lock:
+            row = self.orders.get(order_id)
+            if row is not None and row["status"] not in ("pending", "expired"):
+                raise OrderClosed(order_id, row["status"])
+            self.stock.release(order_id)
+            if row is not None:
+                row["status"] = status
+
+    def stock_holds_reap(self) -> int:
+        released = 0
+        for oid in self.stock.due():
+            with self._lock:  # mismo lock que commit: una orden no vence a mitad del pago
+                if self.stock.release(oid):
+                    released += 1
+                    if self.orders[oid]["status"] == "pending":
+                        self.orders[oid]["status"] = "expired"
+        self.stock.expired += released
+        return released
+
+    def payment_session_update(self, session_id: str, status: str):
+        with self._lock:
+            if session_id in self.sessions:
+                self.sessions[session_id]["status"] = status
+
+    def order_update_status(self, order_id: str, status: str, receipt_code: Optional[str] = None,
+                            paid_at: Optional[str] = None):
+        with self._lock:
+            row = self.orders.get(order_id)
+            if row is None:
+                return
+            row["status"] = status
+            if receipt_code is not None:
+                row["receipt_code"] = receipt_code
+            if paid_at is not None:
+                row["paid_at"] = paid_at
+
+    def order_with_items(self, order_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.orders.get(order_id)
+            return {**row, "order_items": list(self.items[order_id])} if row else None
+
+    def orders_with_items(self, ids) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{**self.orders[oid], "order_items": list(self.items[oid])}
+                    for oid in sorted(set(ids)) if oid in self.orders]
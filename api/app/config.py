@@ -3,6 +3,11 @@ from dotenv import load_dotenv
 load_dotenv()
 
 PRODUCTS_FILE = os.getenv("PRODUCTS_FILE", "data/products.json")
+CATALOG_WATCH_INTERVAL = float(os.getenv("CATALOG_WATCH_INTERVAL", "2"))  # segundos; 0 desactiva
+# objects: Product en memoria por worker; mmap: snapshot binario compartido (<PRODUCTS_FILE>.fscat)
+CATALOG_FORMAT = os.getenv("CATALOG_FORMAT", "objects")
+CATALOG_MMAP_CACHE = int(os.getenv("CATALOG_MMAP_CACHE", "4096"))  # productos decodificados por worker
+CATALOG_MMAP_MASKS = int(os.getenv("CATALOG_MMAP_MASKS", "1024"))  # bitsets del índice convertidos por worker
 SHIPPING_TABLE = {
     "bogota": {"standard": 9000, "express": 16000},
     "medellin": {"standard": 10000, "express": 18000},
@@ -18,4 +23,143 @@ DATA_MODE = os.getenv("DATA_MODE", "JSON")
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_SERVICE_ROLE = os.getenv("SUPABASE_SERVICE_ROLE", "")
 API_PUBLIC_URL = os.getenv("API_PUBLIC_URL", "http://localhost:8000")
-FRONT_RETURN_URL = os.getenv("FRONT_RETURN_URL", "http://localhost:5173/checkout/return")
\ No newline at end of file
+FRONT_RETURN_URL = os.getenv("FRONT_RETURN_URL", "http://localhost:5173/checkout/return")
+# Pool HTTP compartido hacia Supabase (PostgREST)
+SUPABASE_POOL_MAX = int(os.getenv("SUPABASE_POOL_MAX", "50"))
+SUPABASE_POOL_KEEPALIVE = int(os.getenv("SUPABASE_POOL_KEEPALIVE", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "1") == "1"
+SUPABASE_READ_TIMEOUT = float(os.getenv("SUPABASE_READ_TIMEOUT", "5"))
+SUPABASE_WRITE_TIMEOUT = float(os.getenv("SUPABASE_WRITE_TIMEOUT", "10"))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "2"))  # host caído: fallar rápido
+SUPABASE_RETRIES = int(os.getenv("SUPABASE_RETRIES", "2"))  # solo lecturas (GET)
+SUPABASE_RETRY_BACKOFF = float(os.getenv("SUPABASE_RETRY_BACKOFF", "0.1"))
+
+# Cache de respuestas de /v1/products (bytes ya codificados y comprimidos)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL_SUPABASE = float(os.getenv("RESPONSE_CACHE_TTL_SUPABASE", "30"))
+PRODUCTS_CACHE_CONTROL = os.getenv("PRODUCTS_CACHE_CONTROL", "public, max-age=300, stale-while-revalidate=120")
+
+# Derivados de imágenes (/v1/img/...): anchos y formatos fijos, generados una vez en un
+# cache en disco direccionado por contenido. Requiere Pillow; sin él no hay srcset.
+IMAGES_DIR = os.getenv("IMAGES_DIR", "../frontend/public")  # raíz de los `img` del catálogo
+IMAGES_CACHE_DIR = os.getenv("IMAGES_CACHE_DIR", "var/img")
+IMAGES_WIDTHS = os.getenv("IMAGES_WIDTHS", "160,320,640,1024")
+IMAGES_FORMATS = os.getenv("IMAGES_FORMATS", "avif,webp")  # los que el Pillow instalado no codifica se omiten
+IMAGES_PRESET = os.getenv("IMAGES_PRESET", "std")  # calidad de los srcset: low | std | high
+IMAGES_SRCSET = os.getenv("IMAGES_SRCSET", "1") == "1"  # agrega img_srcset a los productos
+
+# Cache read-through de productos en modo SUPABASE
+SUPABASE_CACHE = os.getenv("SUPABASE_CACHE", "1") == "1"
+SUPABASE_CACHE_SIZE = int(os.getenv("SUPABASE_CACHE_SIZE", "1024"))
+SUPABASE_CACHE_TTL = float(os.getenv("SUPABASE_CACHE_TTL", "60"))
+SUPABASE_CACHE_STALE = float(os.getenv("SUPABASE_CACHE_STALE", "300"))  # ventana stale-while-revalidate
+
+# Lecturas de órdenes: cache corto (se invalida con order_update_status en este worker),
+# lote GET /v1/orders?ids= y espera del cambio de estado (long-poll ?wait= y SSE)
+ORDER_CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", "2"))  # segundos; 0 desactiva
+ORDER_CACHE_SIZE = int(os.getenv("ORDER_CACHE_SIZE", "4096"))
+ORDERS_BATCH_MAX = int(os.getenv("ORDERS_BATCH_MAX", "500"))  # ids por petición
+ORDER_WAIT_MAX = float(os.getenv("ORDER_WAIT_MAX", "30"))  # tope de ?wait= en segundos
+ORDER_WAIT_POLL = float(os.getenv("ORDER_WAIT_POLL", "1"))  # relectura mientras espera (cambios de otros workers)
+ORDER_EVENTS_MAX = float(os.getenv("ORDER_EVENTS_MAX", "300"))  # duración máxima de un stream SSE
+ORDER_EVENTS_HEARTBEAT = float(os.getenv("ORDER_EVENTS_HEARTBEAT", "15"))
+
+# Idempotency-Key en checkout y mockpay: "memory" (un proceso) o "sqlite" (varios workers)
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+IDEMPOTENCY_DB = os.getenv("IDEMPOTENCY_DB", "var/idempotency.sqlite3")
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_LEASE = float(os.getenv("IDEMPOTENCY_LEASE", "60"))  # máximo que una clave queda "en curso"
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "100000"))
+
+# Write-behind del estado de pago: mockpay encola en SQLite y redirige; una tarea lo
+# aplica en Supabase en lotes, en orden por orden y con reintentos
+PAYMENT_WRITE_BEHIND = os.getenv("PAYMENT_WRITE_BEHIND", "0") == "1"
+PAYMENT_OUTBOX_DB = os.getenv("PAYMENT_OUTBOX_DB", "var/payment_outbox.sqlite3")
+PAYMENT_OUTBOX_BATCH = int(os.getenv("PAYMENT_OUTBOX_BATCH", "100"))  # filas por ronda
+PAYMENT_OUTBOX_CONCURRENCY = int(os.getenv("PAYMENT_OUTBOX_CONCURRENCY", "8"))  # órdenes en paralelo
+PAYMENT_OUTBOX_POLL = float(os.getenv("PAYMENT_OUTBOX_POLL", "1"))  # segundos; ve lo encolado por otros workers
+PAYMENT_OUTBOX_LEASE = float(os.getenv("PAYMENT_OUTBOX_LEASE", "30"))  # una fila tomada y no resuelta se reintenta tras esto
+PAYMENT_OUTBOX_RETRY_BASE = float(os.getenv("PAYMENT_OUTBOX_RETRY_BASE", "0.5"))  # backoff exponencial...
+PAYMENT_OUTBOX_RETRY_MAX = float(os.getenv("PAYMENT_OUTBOX_RETRY_MAX", "60"))  # ...con este tope
+PAYMENT_OUTBOX_DRAIN = float(os.getenv("PAYMENT_OUTBOX_DRAIN", "5"))  # segundos para vaciar la cola al apagar
+
+# Control de admisión de checkout y cotizaciones: cupo de concurrencia con cola acotada
+# (503 + Retry-After al llenarse) y token bucket por cliente (429). 0 desactiva cada límite.
+CHECKOUT_CONCURRENCY = int(os.getenv("CHECKOUT_CONCURRENCY", "16"))
+CHECKOUT_QUEUE = int(os.getenv("CHECKOUT_QUEUE", "64"))
+# El rate limit viene apagado: detrás de un proxy todos los clientes llegan con la IP
+# del proxy; al activarlo ahí va también RATE_LIMIT_TRUST_PROXY=1.
+CHECKOUT_RATE = float(os.getenv("CHECKOUT_RATE", "0"))  # tokens por segundo y cliente; sugerido 1
+CHECKOUT_BURST = float(os.getenv("CHECKOUT_BURST", "10"))
+QUOTE_CONCURRENCY = int(os.getenv("QUOTE_CONCURRENCY", "32"))  # /v1/pricing/quote y quote:batch
+QUOTE_QUEUE = int(os.getenv("QUOTE_QUEUE", "128"))
+QUOTE_RATE = float(os.getenv("QUOTE_RATE", "0"))  # sugerido 10
+QUOTE_BURST = float(os.getenv("QUOTE_BURST", "40"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))  # espera máxima en la cola
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # "sqlite" comparte los buckets entre workers
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "var/ratelimit.sqlite3")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))  # clientes recordados (memory)
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "0") == "1"  # cliente = primera IP de X-Forwarded-For
+RATE_LIMIT_KEY_HEADER = os.getenv("RATE_LIMIT_KEY_HEADER", "X-API-Key")
+RATE_LIMIT_API_KEYS = os.getenv("RATE_LIMIT_API_KEYS", "")  # claves conocidas (coma); el resto se limita por IP
+
+# /v1/pricing/quote:batch
+BATCH_QUOTE_MAX = int(os.getenv("BATCH_QUOTE_MAX", "10000"))
+GET_MANY_CHUNK = int(os.getenv("GET_MANY_CHUNK", "200"))  # ids por consulta id=in.(...) en SUPABASE
+
+# Memo de /v1/pricing/quote por carrito normalizado + versión del catálogo + reglas.
+# Solo con catálogo versionado (JSON o CATALOG_SYNC=1); 0 desactiva.
+QUOTE_CACHE_SIZE = int(os.getenv("QUOTE_CACHE_SIZE", "4096"))
+QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL", "300"))  # tope por si acaso; las versiones ya invalidan
+
+# Motor de reglas de precios: "file" (PRICING_RULES_FILE, recarga en caliente) o "supabase"
+# (tablas coupons y shipping_rates). Sin archivo ni Supabase se usan COUPONS/SHIPPING_TABLE.
+PRICING_RULES_SOURCE = os.getenv("PRICING_RULES_SOURCE", "file")
+PRICING_RULES_FILE = os.getenv("PRICING_RULES_FILE", "data/pricing_rules.json")
+PRICING_RULES_WATCH_INTERVAL = float(os.getenv("PRICING_RULES_WATCH_INTERVAL", "2"))
+PRICING_RULES_REFRESH = float(os.getenv("PRICING_RULES_REFRESH", "60"))  # segundos, fuente supabase
+
+# Reservas de stock: el checkout aparta unidades por STOCK_HOLD_TTL segundos; el pago
+# aprobado las convierte en venta y el rechazo o el vencimiento las libera.
+STOCK_HOLD_TTL = float(os.getenv("STOCK_HOLD_TTL", "900"))
+STOCK_REAP_INTERVAL = float(os.getenv("STOCK_REAP_INTERVAL", "30"))
+STOCK_LOCK_STRIPES = int(os.getenv("STOCK_LOCK_STRIPES", "64"))  # modo JSON
+
+# Exportación del catálogo (/v1/products/export): productos por bloque del generador
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK", "500"))
+EXPORT_PAGE = int(os.getenv("EXPORT_PAGE", "1000"))  # filas por página keyset en SUPABASE
+
+# Importación masiva (/v1/products:bulk)
+PRODUCTS_BULK_BATCH = int(os.getenv("PRODUCTS_BULK_BATCH", "500"))  # filas por upsert a Supabase
+PRODUCTS_BULK_MAX_ERRORS = int(os.getenv("PRODUCTS_BULK_MAX_ERRORS", "1000"))  # errores listados en la respuesta
+
+# Métricas Prometheus en /metrics; con METRICS=0 no se registra nada (costo ~cero)
+METRICS = os.getenv("METRICS", "1") == "1"
+
+# Circuit breaker hacia Supabase y modo degradado (solo lectura)
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))  # fallos seguidos que abren el circuito
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))  # o esta tasa de error en la ventana...
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "20"))  # ...con al menos estas llamadas
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "30"))  # segundos
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "10"))  # segundos abierto antes de probar de nuevo
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "5"))  # 0 desactiva la sonda activa
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "2"))
+CATALOG_SNAPSHOT_FILE = os.getenv("CATALOG_SNAPSHOT_FILE", "var/catalog_snapshot.json")  # último catálogo bueno
+CATALOG_SNAPSHOT_REFRESH = float(os.getenv("CATALOG_SNAPSHOT_REFRESH", "300"))  # segundos; 0 desactiva
+READY_WHEN_DEGRADED = os.getenv("READY_WHEN_DEGRADED", "1") == "1"  # /health/ready responde 200 en modo degradado
+
+# Sincronización incremental del catálogo de Supabase (sql/catalog_sync.sql): las lecturas
+# salen de una copia en memoria que se pone al día con lo cambiado desde la última marca
+CATALOG_SYNC = os.getenv("CATALOG_SYNC", "0") == "1"
+CATALOG_SYNC_INTERVAL = float(os.getenv("CATALOG_SYNC_INTERVAL", "5"))  # segundos entre rondas
+CATALOG_SYNC_PAGE = int(os.getenv("CATALOG_SYNC_PAGE", "1000"))  # filas por página
+CATALOG_SYNC_COLUMN = os.getenv("CATALOG_SYNC_COLUMN", "updated_at")  # marca de cambio (creciente)
+CATALOG_SYNC_DELETES = os.getenv("CATALOG_SYNC_DELETES", "products_deleted")  # tabla de lápidas; vacío = sin borrados
+CATALOG_SYNC_OVERLAP = float(os.getenv("CATALOG_SYNC_OVERLAP", "5"))  # segundos que se releen hacia atrás
+CATALOG_SYNC_PERSIST = float(os.getenv("CATALOG_SYNC_PERSIST", "60"))  # cada cuánto se guarda en disco
+
+# Arranque: GETs internos (separados por espacio; vacío desactiva) que calientan los caches
+# en el lifespan, antes de aceptar tráfico, con un tope para no demorarlo si Supabase no responde
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "/v1/products")
+STARTUP_WARMUP_TIMEOUT = float(os.getenv("STARTUP_WARMUP_TIMEOUT", "5"))
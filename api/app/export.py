@@ -0,0 +1,85 @@
+import base64, csv, io, json
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from .config import EXPORT_CHUNK
+
+CSV_FIELDS = ("id", "name", "price", "img", "category", "club", "league", "season",
+              "variant", "sizes", "stock", "tags", "rating", "sku")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+def encode_cursor(name: str, pid: str) -> str:
+    raw = json.dumps([name, pid], ensure_ascii=False, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Cursor opaco -> (nombre, id) del último producto entregado. ValueError si no es válido."""
+    try:
+        name, pid = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("cursor inválido")
+    if not isinstance(name, str) or not isinstance(pid, str):
+        raise ValueError("cursor inválido")
+    return name, pid
+
+def _cell(v: Any) -> Any:
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, (list, dict)):
+        return json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+    return "" if v is None else v
+
+class _Encoder:
+    def __init__(self, fmt: str, with_deleted: bool):
+        self.fmt = fmt
+        self.fields = CSV_FIELDS + (("deleted",) if with_deleted else ())
+        self.buf = io.StringIO()
+        self.writer = csv.writer(self.buf, lineterminator="\n") if fmt == "csv" else None
+
+    def header(self) -> bytes:
+        if self.writer is None:
+            return b""
+        self.writer.writerow(self.fields)
+        return self.flush()
+
+    def row(self, d: Dict[str, Any]):
+        if self.writer is None:
+            self.buf.write(json.dumps(d, ensure_ascii=False, separators=(",", ":")))
+            self.buf.write("\n")
+        else:
+            self.writer.writerow([_cell(d.get(f)) for f in self.fields])
+
+    def flush(self) -> bytes:
+        out = self.buf.getvalue().encode()
+        self.buf.seek(0)
+        self.buf.truncate()
+        return out
+
+def export_rows(rows: Iterable[Dict[str, Any]], fmt: str, deleted: Iterable[str] = (),
+                with_deleted: bool = False, chunk: int = EXPORT_CHUNK) -> Iterator[bytes]:
+    """Genera el cuerpo por bloques de `chunk` filas: la memoria no depende del
+    tamaño del catálogo. Los borrados van al final como {"id", "deleted": true}."""
+    enc = _Encoder(fmt, with_deleted)
+    head = enc.header()
+    if head:
+        yield head
+    n = 0
+    for d in rows:
+        enc.row(d)
+        n += 1
+        if n % chunk == 0:
+            yield enc.flush()
+    for pid in deleted:
+        enc.row({"id": pid, "deleted": True})
+    tail = enc.flush()
+    if tail:
+        yield tail
+
+async def export_pages(pages, fmt: str):
+    """Versión async para las páginas por cursor de Supabase (listas de filas)."""
+    enc = _Encoder(fmt, False)
+    head = enc.header()
+    if head:
+        yield head
+    async for page in pages:
+        for d in page:
+            enc.row(d)
+        yield enc.flush()
@@ -0,0 +1,109 @@
+import json, logging, os, time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from starlette.concurrency import run_in_threadpool
+from .catalog import Catalog, write_atomic
+from .repository import ProductsRepoJSON
+from .breaker import CLOSED, OPEN
+from .config import CATALOG_SNAPSHOT_FILE, EXPORT_PAGE, HEALTH_PROBE_TIMEOUT
+
+log = logging.getLogger(__name__)
+
+OK, DEGRADED, UNAVAILABLE = "ok", "degraded", "unavailable"
+
+class CatalogFallback:
+    """Último catálogo bueno leído de Supabase, guardado en disco (sobrevive a un
+    reinicio) y servido como ProductsRepoJSON cuando el circuito está abierto:
+    modo degradado, solo lectura."""
+
+    def __init__(self, path: str = CATALOG_SNAPSHOT_FILE):
+        self.path = path
+        self.repo: Optional[ProductsRepoJSON] = None
+        self.refreshes = 0
+        self.refresh_ms = 0.0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        if os.path.exists(path):
+            try:
+                self._load()
+            except Exception as e:  # snapshot corrupto: se reemplaza en la próxima descarga
+                self.last_error = repr(e)
+
+    def _load(self):
+        if self.repo is None:
+            self.repo = ProductsRepoJSON(Catalog(self.path, interval=0))
+        else:
+            self.repo.catalog.reload(force=True)
+
+    def _store(self, rows: List[Dict[str, Any]]):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        write_atomic(self.path, json.dumps(rows, ensure_ascii=False).encode())
+        self._load()
+
+    async def refresh(self, source, page_size: int = EXPORT_PAGE) -> bool:
+        """Descarga el catálogo completo de `source` (AsyncSupabaseRepo) y lo
+        publica. Un error o un catálogo vacío conservan el snapshot anterior."""
+        t0 = time.perf_counter()
+        try:
+            rows: List[Dict[str, Any]] = []
+            async for page in source.products_pages(page_size):
+                rows.extend(page)
+            if not rows:
+                raise ValueError("Supabase devolvió un catálogo vacío")
+            await run_in_threadpool(self._store, rows)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = repr(e)
+            log.warning("no se pudo actualizar el snapshot del catálogo: %r", e)
+            return False
+        self.refreshes += 1
+        self.refresh_ms = (time.perf_counter() - t0) * 1000
+        return True
+
+    def stats(self) -> dict:
+        out = {"path": self.path, "available": self.repo is not None, "refreshes": self.refreshes,
+               "refresh_ms": round(self.refresh_ms, 3), "errors": self.errors, "last_error": self.last_error}
+        if self.repo is not None:
+            snap = self.repo.catalog.snapshot
+            out.update(version=snap.version, products=len(snap.products),
+                       age_seconds=round(time.time() - snap.loaded_at, 3))
+        return out
+
+class Probe:
+    """Sonda activa de una dependencia, corrida por una tarea periódica; la
+    readiness lee el último resultado en vez de salir a la red en cada chequeo."""
+
+    def __init__(self, fn: Callable[[float], Awaitable[Any]], timeout: float = HEALTH_PROBE_TIMEOUT):
+        self.fn = fn
+        self.timeout = timeout
+        self.last: Optional[Dict[str, Any]] = None
+
+    async def run(self):
+        t0 = time.perf_counter()
+        try:
+            await self.fn(self.timeout)
+            ok, error = True, None
+        except Exception as e:
+            ok, error = False, str(e) or repr(e)
+        self.last = {"ok": ok, "latency_ms": round((time.perf_counter() - t0) * 1000, 3),
+                     "at": time.time(), "error": error}
+
+def catalog_check(catalog: Catalog) -> dict:
+    """`stale`: el archivo cambió y no se pudo cargar; se sirve la versión anterior."""
+    snap = catalog.snapshot
+    stats = catalog.reload_stats()
+    stale = catalog.last_error_at is not None and catalog.last_error_at > snap.loaded_at
+    return {"ok": True, "stale": stale, "version": snap.version, "products": len(snap.products),
+            "age_seconds": round(time.time() - snap.loaded_at, 3), "reload_errors": stats["reload_errors"],
+            "last_error": stats["last_error"] if stale else None}
+
+def supabase_check(repo, probe: Optional[Probe]) -> dict:
+    breaker = repo.breaker.stats()
+    return {"ok": breaker["state"] != OPEN, "breaker": breaker, "pool": repo.pool_stats(),
+            "probe": probe.last if probe else None}
+
+def status_of(checks: Dict[str, dict]) -> str:
+    if "catalog" in checks:
+        return DEGRADED if checks["catalog"]["stale"] else OK
+    if checks["supabase"]["breaker"]["state"] == CLOSED:
+        return OK
+    return DEGRADED if checks["snapshot"]["available"] else UNAVAILABLE
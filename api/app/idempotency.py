@@ -0,0 +1,163 @@
+import hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException, Response
+from starlette.concurrency import run_in_threadpool
+from .config import IDEMPOTENCY_BACKEND, IDEMPOTENCY_DB, IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_LEASE
+
+NEW, REPLAY, IN_PROGRESS, MISMATCH = "new", "replay", "in_progress", "mismatch"
+_SKIP_HEADERS = {"content-length"}
+
+class StoredResponse:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @classmethod
+    def from_response(cls, r: Response) -> "StoredResponse":
+        headers = {k: v for k, v in r.headers.items() if k.lower() not in _SKIP_HEADERS}
+        return cls(r.status_code, headers, bytes(r.body))
+
+    def to_response(self) -> Response:
+        r = Response(self.body, status_code=self.status, headers=self.headers)
+        r.headers["Idempotent-Replayed"] = "true"
+        return r
+
+def fingerprint(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+class MemoryIdempotencyStore:
+    """Un solo proceso: TTL por clave y desalojo LRU al superar `max_entries`."""
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_entries: int = IDEMPOTENCY_MAX_ENTRIES,
+                 lease: float = IDEMPOTENCY_LEASE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lease = lease
+        self._lock = threading.Lock()
+        # clave -> (fingerprint, respuesta o None si está en curso, vence)
+        self._data: "OrderedDict[str, Tuple[str, Optional[StoredResponse], float]]" = OrderedDict()
+
+    def begin(self, key: str, fp: str) -> Tuple[str, Optional[StoredResponse]]:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[2] < now:
+                del self._data[key]
+                item = None
+            if item is None:
+                self._data[key] = (fp, None, now + self.lease)
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+                return NEW, None
+            if item[0] != fp:
+                return MISMATCH, None
+            if item[1] is None:
+                return IN_PROGRESS, None
+            return REPLAY, item[1]
+
+    def complete(self, key: str, fp: str, resp: StoredResponse):
+        with self._lock:
+            self._data[key] = (fp, resp, time.time() + self.ttl)
+            self._data.move_to_end(key)
+
+    def release(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def purge(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [k for k, item in self._data.items() if item[2] < now]
+            for k in expired:
+                del self._data[k]
+        return len(expired)
+
+class SQLiteIdempotencyStore:
+    """Compartido entre workers del mismo host (archivo SQLite en modo WAL)."""
+
+    def __init__(self, path: str = IDEMPOTENCY_DB, ttl: float = IDEMPOTENCY_TTL,
+                 lease: float = IDEMPOTENCY_LEASE):
+        self.path = path
+        self.ttl = ttl
+        self.lease = lease
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as c:
+            c.execute("""create table if not exists idempotency (
+                key text primary key, fingerprint text not null, status integer,
+                headers text, body blob, expires_at real not null)""")
+            c.execute("create index if not exists idempotency_expires on idempotency(expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            self._local.conn = conn
+        return conn
+
+    def begin(self, key: str, fp: str) -> Tuple[str, Optional[StoredResponse]]:
+        now = time.time()
+        c = self._conn()
+        c.execute("begin immediate")
+        try:
+            c.execute("delete from idempotency where key = ? and expires_at < ?", (key, now))
+            row = c.execute("select fingerprint, status, headers, body from idempotency where key = ?",
+                            (key,)).fetchone()
+            if row is None:
+                c.execute("insert into idempotency (key, fingerprint, expires_at) values (?, ?, ?)",
+                          (key, fp, now + self.lease))
+                return NEW, None
+            if row[0] != fp:
+                return MISMATCH, None
+            if row[1] is None:
+                return IN_PROGRESS, None
+            return REPLAY, StoredResponse(row[1], json.loads(row[2]), row[3])
+        finally:
+            c.execute("commit")
+
+    def complete(self, key: str, fp: str, resp: StoredResponse):
+        self._conn().execute(
+            "insert or replace into idempotency (key, fingerprint, status, headers, body, expires_at) "
+            "values (?, ?, ?, ?, ?, ?)",
+            (key, fp, resp.status, json.dumps(resp.headers), resp.body, time.time() + self.ttl))
+
+    def release(self, key: str):
+        self._conn().execute("delete from idempotency where key = ? and status is null", (key,))
+
+    def purge(self) -> int:
+        return self._conn().execute("delete from idempotency where expires_at < ?", (time.time(),)).rowcount
+
+def make_store():
+    if IDEMPOTENCY_BACKEND.lower() == "sqlite":
+        return SQLiteIdempotencyStore()
+    return MemoryIdempotencyStore()
+
+async def run_idempotent(store, key: Optional[str], fp: str,
+                         handler: Callable[[], Awaitable[Response]]) -> Response:
+    """Ejecuta `handler` una sola vez por clave. Las repeticiones devuelven la
+    respuesta guardada sin tocar el repositorio; los errores liberan la clave."""
+    if not key:
+        return await handler()
+    state, stored = await run_in_threadpool(store.begin, key, fp)
+    if state == REPLAY:
+        return stored.to_response()
+    if state == IN_PROGRESS:
+        raise HTTPException(status_code=409, detail="Ya hay una petición en curso con esta Idempotency-Key")
+    if state == MISMATCH:
+        raise HTTPException(status_code=422, detail="Idempotency-Key reutilizada con otro contenido")
+    try:
+        resp = await handler()
+    except BaseException:
+        await run_in_threadpool(store.release, key)
+        raise
+    if resp.status_code < 500:
+        await run_in_threadpool(store.complete, key, fp, StoredResponse.from_response(resp))
+    else:
+        await run_in_threadpool(store.release, key)
+    return resp
@@ -0,0 +1,182 @@
+import hashlib, io, json, os, re, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from fastapi import Response
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+from .cache import SingleFlight
+from .catalog import write_atomic
+from .metrics import observe_stage
+from .response_cache import etag_matches
+from .config import (API_PUBLIC_URL, IMAGES_DIR, IMAGES_CACHE_DIR, IMAGES_WIDTHS, IMAGES_FORMATS, IMAGES_PRESET,
+                     PRODUCTS_FILE)
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # opcional: sin Pillow no hay derivados y los productos salen sin srcset
+    Image = None
+
+PREFIX = "/v1/img/"
+CACHE_CONTROL = "public, max-age=31536000, immutable"  # la URL lleva el hash del original
+MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+# calidad por formato: AVIF se ve igual con números más bajos que WebP
+PRESETS = {"low": {"avif": 35, "webp": 50}, "std": {"avif": 50, "webp": 75}, "high": {"avif": 70, "webp": 88}}
+WIDTHS = tuple(sorted({int(w) for w in IMAGES_WIDTHS.split(",") if w.strip()}))
+FORMATS = tuple(f for f in (x.strip() for x in IMAGES_FORMATS.split(","))
+                if f in MEDIA_TYPES and Image is not None and features.check(f))
+_VARIANT = re.compile(r"^(\d+)-(\w+)\.(\w+)$")
+
+class Source(NamedTuple):
+    path: str
+    stat: Tuple[int, int]  # (mtime_ns, size): si cambia se vuelve a calcular el hash
+    digest: str            # sha256 del archivo original
+    width: int
+
+class Variant(NamedTuple):
+    source: Source
+    img: str
+    width: int
+    preset: str
+    format: str
+
+    @property
+    def key(self) -> str:
+        quality = PRESETS[self.preset][self.format]
+        return hashlib.sha256(f"{self.source.digest}|{self.width}|{self.format}|{quality}".encode()).hexdigest()
+
+    @property
+    def file(self) -> str:
+        return os.path.join(IMAGES_CACHE_DIR, self.key[:2], f"{self.key}.{self.format}")
+
+    @property
+    def url(self) -> str:
+        return f"{API_PUBLIC_URL}{PREFIX}{self.source.digest[:16]}/{self.img.lstrip('/')}/" \
+               f"{self.width}-{self.preset}.{self.format}"
+
+_sources: Dict[str, Source] = {}
+
+def source(img: Optional[str], root: str = IMAGES_DIR) -> Optional[Source]:
+    """Original de un `img` del catálogo dentro de `root`; None si no existe o no es imagen."""
+    if not img or Image is None:
+        return None
+    base = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(base, img.lstrip("/")))
+    if not path.startswith(base + os.sep):
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stat = (st.st_mtime_ns, st.st_size)
+    cached = _sources.get(path)
+    if cached is not None and cached.stat == stat:
+        return cached
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        with Image.open(io.BytesIO(data)) as im:  # solo lee el encabezado
+            width = im.width
+    except (OSError, ValueError):
+        return None
+    src = _sources[path] = Source(path, stat, hashlib.sha256(data).hexdigest(), width)
+    return src
+
+def widths_for(src: Source) -> List[int]:
+    """Anchos que no agrandan el original (al menos el más chico)."""
+    return [w for w in WIDTHS if w <= src.width] or list(WIDTHS[:1])
+
+def srcset(img: Optional[str], preset: str = IMAGES_PRESET) -> Optional[Dict[str, str]]:
+    """`{formato: "url 160w, url 320w, ..."}` listo para <source srcset>."""
+    src = source(img)
+    if src is None or not FORMATS:
+        return None
+    return {fmt: ", ".join(f"{Variant(src, img, w, preset, fmt).url} {w}w" for w in widths_for(src))
+            for fmt in FORMATS}
+
+def with_srcset(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Copia de `items` con `img_srcset` en los que tienen original (las filas
+    pueden venir del cache del repositorio: no se modifican)."""
+    out = []
+    for item in items:
+        sets = srcset(item.get("img"))
+        out.append({**item, "img_srcset": sets} if sets else item)
+    return out
+
+def render(path: str, width: int, fmt: str, quality: int) -> bytes:
+    """Reescala sin agrandar y recodifica; corre en el threadpool o en el pool de procesos."""
+    with Image.open(path) as im:
+        im = ImageOps.exif_transpose(im)
+        if im.width > width:
+            im = im.resize((width, max(1, round(im.height * width / im.width))), Image.LANCZOS)
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+        out = io.BytesIO()
+        im.save(out, fmt.upper(), quality=quality)
+        return out.getvalue()
+
+def build(v: Variant) -> bool:
+    """Escribe el derivado si falta. -> True si lo generó."""
+    if os.path.exists(v.file):
+        return False
+    data = render(v.source.path, v.width, v.format, PRESETS[v.preset][v.format])
+    os.makedirs(os.path.dirname(v.file), exist_ok=True)
+    write_atomic(v.file, data)
+    return True
+
+def parse(digest: str, rest: str) -> Tuple[Optional[Variant], bool]:
+    """`<img>/<ancho>-<preset>.<formato>` -> (variante, vigente). Una variante
+    no vigente es de un original que ya cambió: se redirige a la URL nueva."""
+    img, _, name = rest.rpartition("/")
+    m = _VARIANT.match(name)
+    if not m or int(m.group(1)) not in WIDTHS or m.group(2) not in PRESETS or m.group(3) not in FORMATS:
+        return None, False
+    src = source(img)
+    if src is None:
+        return None, False
+    return Variant(src, "/" + img, int(m.group(1)), m.group(2), m.group(3)), src.digest.startswith(digest)
+
+_flight = SingleFlight()
+
+async def serve(digest: str, rest: str, if_none_match: Optional[str]) -> Optional[Response]:
+    v, current = parse(digest, rest)
+    if v is None:
+        return None
+    if not current:
+        return Response(status_code=308, headers={"Location": v.url, "Cache-Control": "no-cache"})
+    headers = {"ETag": f'"{v.key[:32]}"', "Cache-Control": CACHE_CONTROL}
+    if etag_matches(headers["ETag"], if_none_match):
+        return Response(status_code=304, headers=headers)
+    if not os.path.exists(v.file):
+        t0 = time.perf_counter()
+        await _flight.do(v.key, lambda: run_in_threadpool(build, v))
+        observe_stage("image_render", time.perf_counter() - t0)
+    return FileResponse(v.file, media_type=MEDIA_TYPES[v.format], headers=headers)
+
+def variants(imgs: Iterable[Optional[str]], presets: Iterable[str] = (IMAGES_PRESET,)) -> List[Variant]:
+    out, seen = [], set()
+    for img in imgs:
+        src = source(img)
+        if src is None or src.path in seen:
+            continue
+        seen.add(src.path)
+        out += [Variant(src, img, w, p, fmt) for w in widths_for(src) for p in presets for fmt in FORMATS]
+    return out
+
+def prewarm(catalog: str = PRODUCTS_FILE, workers: Optional[int] = None,
+            presets: Iterable[str] = (IMAGES_PRESET,)) -> Tuple[int, int]:
+    """Genera todos los derivados del catálogo en un pool de procesos. -> (generados, total)"""
+    with open(catalog, "r", encoding="utf-8") as f:
+        todo = [v for v in variants((p.get("img") for p in json.load(f)), presets) if not os.path.exists(v.file)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        built = sum(pool.map(build, todo, chunksize=4))
+    return built, len(todo)
+
+if __name__ == "__main__":
+    if Image is None:
+        sys.exit("falta Pillow: pip install pillow")
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    presets = tuple(PRESETS) if "--all-presets" in sys.argv else (IMAGES_PRESET,)
+    t0 = time.perf_counter()
+    built, total = prewarm(args[0] if args else PRODUCTS_FILE, int(args[1]) if len(args) > 1 else None, presets)
+    print(f"{built} derivados generados de {total} pendientes ({', '.join(FORMATS)}; anchos "
+          f"{', '.join(map(str, WIDTHS))}) en {time.perf_counter() - t0:.1f} s -> {IMAGES_CACHE_DIR}")
@@ -1,82 +1,533 @@
-from fastapi import FastAPI, Depends, Query, Response, Header, Form, HTTPException
+import time
+_imports_t0 = time.perf_counter()  # antes del resto: mide lo que cuesta importar la app
+import asyncio, inspect, json, logging, math
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Query, Request, Response, Header, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, List
-from .config import DATA_MODE, SUPABASE_URL, SUPABASE_SERVICE_ROLE, API_PUBLIC_URL, FRONT_RETURN_URL
+from .config import (
+    DATA_MODE, SUPABASE_URL, SUPABASE_SERVICE_ROLE, API_PUBLIC_URL, FRONT_RETURN_URL,
+    RESPONSE_CACHE_TTL_SUPABASE, PRODUCTS_CACHE_CONTROL, SUPABASE_CACHE,
+    BATCH_QUOTE_MAX, GET_MANY_CHUNK, PRICING_RULES_SOURCE, PRICING_RULES_REFRESH,
+    STOCK_REAP_INTERVAL, EXPORT_PAGE, PRODUCTS_BULK_BATCH, PRODUCTS_BULK_MAX_ERRORS, METRICS,
+    HEALTH_PROBE_INTERVAL, CATALOG_SNAPSHOT_REFRESH, READY_WHEN_DEGRADED, PAYMENT_WRITE_BEHIND,
+    PAYMENT_OUTBOX_DRAIN, ORDERS_BATCH_MAX, ORDER_WAIT_MAX, CATALOG_SYNC, IMAGES_SRCSET,
+)
+from .catalog import Catalog
 from .repository import ProductsRepoJSON
-from .repository_supabase import SupabaseRepo
-from .models import QuoteIn, Product
-from .services import make_quote
+from .search import FACETS
+from .response_cache import ResponseCache, respond
+from .reservations import OrderClosed, OutOfStock
+from .idempotency import make_store, run_idempotent, fingerprint
+from .models import QuoteIn
+from .services import QuoteCache, make_quote, make_quotes, normalized
+from .pricing_rules import RulesEngine, RulesFile, load_supabase_rules, rules_file_exists
+from .background import Tasks
+from .bulk import BadBody, iter_documents, validate
+from .metrics import REGISTRY, Gauges, MetricsMiddleware, observe_stage
+from .export import MEDIA_TYPES, decode_cursor, encode_cursor, export_pages, export_rows
+from .breaker import CircuitOpen
+from .sync import CatalogSync
+from .health import CatalogFallback, Probe, UNAVAILABLE, DEGRADED, catalog_check, status_of, supabase_check
+from .outbox import PaymentOutbox
+from . import images, mockpay
+from .orders import OrderWatch
+from .admission import AdmissionMiddleware, SQLiteBuckets, default_admission
+from .startup import STARTUP, warmup
+
+if DATA_MODE.upper() == "SUPABASE":
+    # el cliente (httpx, httpcore y sus backends) se importa solo si se usa: en modo JSON es lo más caro después de FastAPI
+    import httpx
+    from .repository_supabase import AsyncSupabaseRepo, CachedSupabaseRepo
+
+STARTUP.imported(time.perf_counter() - _imports_t0)
+log = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    catalog = rules_file = app.state.fallback = app.state.probe = None
+    tasks = app.state.tasks = Tasks()
+    idempotency = app.state.idempotency = make_store()
+    with STARTUP.phase("catalog"):
+        if DATA_MODE.upper() == "SUPABASE":
+            repo_cls = CachedSupabaseRepo if SUPABASE_CACHE else AsyncSupabaseRepo
+            supabase = app.state.supabase_repo = repo_cls(SUPABASE_URL, SUPABASE_SERVICE_ROLE)
+            probe = app.state.probe = Probe(supabase.ping)
+            tasks.periodic(HEALTH_PROBE_INTERVAL, probe.run, "supabase-probe")
+            fallback = app.state.fallback = CatalogSync() if CATALOG_SYNC else CatalogFallback()
+
+            async def refresh_snapshot():
+                if not supabase.breaker.is_open:
+                    await fallback.refresh(supabase)
+            if CATALOG_SYNC:
+                tasks.spawn(fallback.run(supabase), "catalog-sync")
+            elif CATALOG_SNAPSHOT_REFRESH > 0:
+                tasks.spawn(refresh_snapshot(), "catalog-snapshot-initial")  # sin bloquear el arranque
+                tasks.periodic(CATALOG_SNAPSHOT_REFRESH, refresh_snapshot, "catalog-snapshot-refresh")
+        else:
+            catalog = Catalog()
+            catalog.start()
+            app.state.json_repo = ProductsRepoJSON(catalog)
+
+    with STARTUP.phase("rules"):
+        rules = app.state.rules = RulesEngine()
+        if PRICING_RULES_SOURCE == "supabase" and DATA_MODE.upper() == "SUPABASE":
+            async def refresh_rules():
+                rules.install(await load_supabase_rules(app.state.supabase_repo), "supabase")
+            try:
+                await refresh_rules()
+            except Exception as e:
+                # Supabase caído no frena el arranque: quedan las reglas por defecto y reintenta el periódico
+                log.warning("reglas de precios no cargadas, uso las por defecto: %r", e)
+            tasks.periodic(PRICING_RULES_REFRESH, refresh_rules, "pricing-rules-refresh")
+        elif rules_file_exists():
+            rules_file = RulesFile(rules)
+            rules_file.start()
+    app.state.rules_file = rules_file
 
-app = FastAPI(title="Football Shop API", version="1.1.0")
+    async def reap_holds():
+        if DATA_MODE.upper() == "SUPABASE":
+            await app.state.supabase_repo.stock_holds_reap()
+        else:
+            app.state.json_repo.orders.stock_holds_reap()
+    tasks.periodic(STOCK_REAP_INTERVAL, reap_holds, "stock-holds-reaper")
+    if isinstance(admission.buckets, SQLiteBuckets):
+        tasks.periodic(600, lambda: run_in_threadpool(admission.buckets.purge), "rate-limit-purge")
+    # las claves vencidas solo se borran al repetirse: sin esto la tabla crece sin tope
+    tasks.periodic(600, lambda: run_in_threadpool(idempotency.purge), "idempotency-purge")
 
+    watch = app.state.order_watch = OrderWatch()
+    outbox = app.state.outbox = PaymentOutbox() if PAYMENT_WRITE_BEHIND else None
+    orders_of = lambda: app.state.supabase_repo if DATA_MODE.upper() == "SUPABASE" else app.state.json_repo.orders
+    if outbox:
+        outbox.on_applied = watch.notify
+        tasks.spawn(outbox.run(orders_of), "payment-outbox")
+    with STARTUP.phase("warmup"):
+        await warmup(app)
+    STARTUP.ready()
+    yield
+    await tasks.cancel_all()
+    if outbox:
+        await outbox.drain(orders_of(), PAYMENT_OUTBOX_DRAIN)
+    if catalog:
+        catalog.stop()
+    if rules_file:
+        rules_file.stop()
+    if isinstance(app.state.fallback, CatalogSync):
+        await run_in_threadpool(app.state.fallback.save)
+    if DATA_MODE.upper() == "SUPABASE":
+        await app.state.supabase_repo.close()
+
+app = FastAPI(title="Football Shop API", version="1.1.0", lifespan=lifespan)
+
+admission = default_admission()
+app.add_middleware(AdmissionMiddleware, admission=admission)  # antes que CORS: queda por dentro
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True,
     allow_methods=["*"], allow_headers=["*"],
 )
 
-def get_repo():
+products_cache = ResponseCache()
+quote_cache = QuoteCache()
+
+if METRICS:
+    app.add_middleware(MetricsMiddleware)
+
+def _ratio(stats: dict):
+    return stats.get("hit_ratio") or 0.0
+
+def _cache_gauges():
+    yield ("products_response",), _ratio(products_cache.stats())
+    yield ("quotes",), _ratio(quote_cache.stats())
+    repo = getattr(app.state, "supabase_repo", None)
+    if hasattr(repo, "cache_stats"):
+        stats = repo.cache_stats()
+        yield ("supabase_lists",), _ratio(stats["lists"])
+        yield ("supabase_rows",), _ratio(stats["rows"])
+        yield ("supabase_orders",), _ratio(stats["orders"])
+
+def _pool_gauges():
+    repo = getattr(app.state, "supabase_repo", None)
+    if repo is not None:
+        for state, n in repo.pool_stats().items():
+            yield (state,), n
+
+def _breaker_gauges():
+    repo = getattr(app.state, "supabase_repo", None)
+    if repo is not None:
+        b = repo.breaker
+        yield ("open",), int(b.is_open)
+        yield ("trips",), b.trips
+        yield ("rejected",), b.rejected
+
+def _catalog_gauges():
+    repo = getattr(app.state, "json_repo", None)
+    if repo is not None:
+        snap = repo.catalog.snapshot
+        yield ("version",), snap.version
+        yield ("products",), len(snap.products)
+        yield ("load_seconds",), snap.load_ms / 1000
+
+def _stock_gauges():
+    repo = getattr(app.state, "json_repo", None)
+    if repo is not None:
+        stats = repo.orders.stock.stats()
+        for k in ("holds", "held_units", "sold_units", "expired"):
+            yield (k,), stats[k]
+
+def _outbox_gauges():
+    outbox = getattr(app.state, "outbox", None)
+    if outbox is not None:
+        stats = outbox.stats()
+        for k in ("depth", "lag_seconds", "retrying", "dead"):
+            yield (k,), stats[k]
+
+REGISTRY.register(Gauges("cache_hit_ratio", "Proporción de aciertos por cache", ("cache",), _cache_gauges))
+REGISTRY.register(Gauges("supabase_pool_connections",
+                         "Pool hacia Supabase: inflight, max, open, idle, queued", ("state",), _pool_gauges))
+REGISTRY.register(Gauges("supabase_breaker", "Circuit breaker hacia Supabase: open (0/1), trips, rejected",
+                         ("field",), _breaker_gauges))
+REGISTRY.register(Gauges("catalog_info", "Catálogo en memoria (modo JSON)", ("field",), _catalog_gauges))
+REGISTRY.register(Gauges("stock_reservations", "Reservas de stock en memoria (modo JSON)", ("field",),
+                         _stock_gauges))
+REGISTRY.register(Gauges("payment_outbox", "Cola write-behind de estados de pago: depth, lag_seconds, retrying, dead",
+                         ("field",), _outbox_gauges))
+
+def get_idempotency_store(request: Request):
+    return request.app.state.idempotency
+
+def get_outbox(request: Request) -> Optional[PaymentOutbox]:
+    return request.app.state.outbox
+
+def get_order_watch(request: Request) -> OrderWatch:
+    return request.app.state.order_watch
+
+async def _maybe_await(value):
+    # ProductsRepoJSON.orders es síncrono; AsyncSupabaseRepo devuelve corrutinas
+    return await value if inspect.isawaitable(value) else value
+
+def get_rules(request: Request) -> RulesEngine:
+    return request.app.state.rules
+
+def get_repo(request: Request):
     if DATA_MODE.upper() == "SUPABASE":
-        return SupabaseRepo(SUPABASE_URL, SUPABASE_SERVICE_ROLE)
-    return ProductsRepoJSON()
+        return request.app.state.supabase_repo
+    return request.app.state.json_repo
+
+def get_catalog_repo(request: Request):
+    """Lecturas de catálogo: con el circuito hacia Supabase abierto salen del
+    último snapshot bueno (modo degradado), y con CATALOG_SYNC=1 siempre de la
+    copia sincronizada. Las escrituras siguen en get_repo y fallan rápido con 503."""
+    repo = get_repo(request)
+    fallback = request.app.state.fallback
+    if repo.remote and fallback and fallback.repo and (CATALOG_SYNC or repo.breaker.is_open):
+        return fallback.repo
+    return repo
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open(request: Request, exc: CircuitOpen):
+    return JSONResponse({"detail": "Supabase no disponible: modo degradado, solo lectura"}, status_code=503,
+                        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))})
+
+async def upstream_down(request: Request, exc: Exception):
+    return JSONResponse({"detail": f"Supabase no responde ({type(exc).__name__})"}, status_code=503,
+                        headers={"Retry-After": "1"})
+
+if DATA_MODE.upper() == "SUPABASE":
+    app.add_exception_handler(httpx.TransportError, upstream_down)
 
 @app.get("/health")
+@app.get("/health/live")
 def health():
+    """Liveness: el proceso responde. No mira dependencias."""
     return {"ok": True}
 
+@app.get("/health/ready")
+def health_ready(request: Request):
+    """Readiness: catálogo (versión/edad) en JSON; breaker, pool, sonda y
+    snapshot en SUPABASE. 503 si no se puede servir (o si está degradado y
+    READY_WHEN_DEGRADED=0)."""
+    state = request.app.state
+    if DATA_MODE.upper() == "SUPABASE":
+        checks = {"supabase": supabase_check(state.supabase_repo, state.probe), "snapshot": state.fallback.stats()}
+    else:
+        checks = {"catalog": catalog_check(state.json_repo.catalog)}
+    status = status_of(checks)
+    ready = status != UNAVAILABLE and (READY_WHEN_DEGRADED or status != DEGRADED)
+    return JSONResponse({"status": status, "ready": ready, "mode": DATA_MODE.upper(), "checks": checks},
+                        status_code=200 if ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    if not METRICS:
+        raise HTTPException(status_code=404, detail="Métricas desactivadas (METRICS=0)")
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/admin/catalog")
+def admin_catalog(request: Request):
+    if isinstance(request.app.state.fallback, CatalogSync):
+        return request.app.state.fallback.stats()
+    if DATA_MODE.upper() == "SUPABASE":
+        raise HTTPException(status_code=400, detail="Catálogo local solo disponible en modo JSON")
+    return request.app.state.json_repo.catalog.stats()
+
 @app.get("/v1/products")
-def products_list(
-    response: Response,
+async def products_list(
     q: Optional[str] = Query(None), category: Optional[str] = Query(None),
+    club: Optional[str] = Query(None), league: Optional[str] = Query(None),
+    season: Optional[str] = Query(None),
+    tag: Optional[List[str]] = Query(None), size: Optional[List[str]] = Query(None),
+    min_price: Optional[int] = Query(None, ge=0), max_price: Optional[int] = Query(None, ge=0),
+    in_stock: bool = Query(False),
+    sort: Optional[str] = Query(None, pattern=r"^-?(name|price|rating)$"),
+    facets: Optional[str] = Query(None, description="Facetas separadas por coma: " + ",".join(FACETS)),
     limit: int = Query(50, ge=1, le=200), offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior (orden por nombre)"),
     if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
-    repo = Depends(get_repo)
+    accept_encoding: Optional[str] = Header(None, alias="Accept-Encoding"),
+    repo = Depends(get_catalog_repo)
 ):
+    facet_names = [f for f in (facets or "").split(",") if f]
+    unknown = set(facet_names) - set(FACETS)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Facetas desconocidas: {', '.join(sorted(unknown))}")
+    after = None
+    if cursor:
+        if sort not in (None, "name") or offset:
+            raise HTTPException(status_code=400, detail="cursor solo admite sort=name y sin offset")
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        sort = "name"
+    filters = {"club": [club] if club else None, "league": [league] if league else None,
+               "season": [season] if season else None, "tags": tag, "sizes": size}
+    params = (q, category, club, league, season, tuple(tag or ()), tuple(size or ()),
+              min_price, max_price, in_stock, sort, tuple(facet_names), limit, offset, after)
+    # keyset: en orden por nombre cada página completa trae el cursor de la siguiente
+    keyset = sort == "name" or (sort is None and not isinstance(repo, ProductsRepoJSON))
+
+    def page(items: List[dict], **extra) -> dict:
+        if IMAGES_SRCSET:
+            items = images.with_srcset(items)
+        body = {"items": items, "count": len(items), **extra}
+        if keyset and len(items) == limit:
+            body["next_cursor"] = encode_cursor(items[-1]["name"], items[-1]["id"])
+        return body
+
     if isinstance(repo, ProductsRepoJSON):
-        etag = repo.etag()
-        if if_none_match == etag:
-            response.status_code = 304
-            return
-        items = repo.list(q=q, category=category, limit=limit, offset=offset)
-        response.headers["ETag"] = etag
-        response.headers["Cache-Control"] = "public, max-age=300, stale-while-revalidate=120"
-        return {"items": [i.dict() for i in items], "count": len(items)}
+        key = ("json", repo.catalog.snapshot.version) + params
+        entry = products_cache.get(key)
+        if entry is None:
+            items, total, facet_counts = repo.search(
+                q=q, filters={**filters, "category": [category] if category else None},
+                min_price=min_price, max_price=max_price, in_stock=in_stock, sort=sort,
+                limit=limit, offset=offset, facets=facet_names, after=after)
+            entry = products_cache.put(key, page([i.model_dump() for i in items], total=total, facets=facet_counts))
     else:
-        items = repo.products_list(q, category, limit, offset)
-        return {"items": items, "count": len(items)}
+        if facet_names:
+            raise HTTPException(status_code=400, detail="Facetas solo disponibles en modo JSON")
+        key = ("supabase",) + params
+        entry = products_cache.get(key)
+        if entry is None:
+            items = await repo.products_list(q, category, limit, offset, filters=filters,
+                                             min_price=min_price, max_price=max_price,
+                                             in_stock=in_stock, sort=sort, after=after)
+            entry = products_cache.put(key, page(items), ttl=RESPONSE_CACHE_TTL_SUPABASE)
+    return respond(entry, accept_encoding, if_none_match, PRODUCTS_CACHE_CONTROL)
+
+@app.get("/v1/products/export")
+async def products_export(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    since: Optional[int] = Query(None, ge=0, description="versión del catálogo (X-Catalog-Version) ya sincronizada"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    repo = Depends(get_catalog_repo)
+):
+    """Catálogo completo en streaming (NDJSON o CSV) generado por bloques; con
+    `since` solo lo que cambió y los ids borrados desde esa versión."""
+    media_type = MEDIA_TYPES[format]
+    if not isinstance(repo, ProductsRepoJSON):
+        if since is not None:
+            raise HTTPException(status_code=400, detail="since solo disponible en modo JSON o con CATALOG_SYNC=1")
+        return StreamingResponse(export_pages(repo.products_pages(EXPORT_PAGE), format), media_type=media_type)
+
+    snap = repo.catalog.snapshot
+    delta = snap.changes_since(since) if since is not None else None
+    headers = {"X-Catalog-Version": str(snap.version), "X-Export-Mode": "delta" if delta else "full",
+               "ETag": f'"{snap.etag}-{snap.version}-{format}-{since if delta else "full"}"'}
+    if if_none_match and if_none_match.strip() in (headers["ETag"], "*"):
+        return Response(status_code=304, headers=headers)
+    products, deleted = delta if delta else (snap.products, [])
+    body = export_rows((p.model_dump() for p in products), format, deleted, with_deleted=since is not None)
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+@app.get("/admin/pricing")
+def admin_pricing(request: Request, rules: RulesEngine = Depends(get_rules)):
+    watcher = request.app.state.rules_file
+    return {**rules.stats(), **(watcher.reload_stats() if watcher else {})}
+
+@app.get("/admin/outbox")
+def admin_outbox(outbox: Optional[PaymentOutbox] = Depends(get_outbox)):
+    if outbox is None:
+        raise HTTPException(status_code=404, detail="Write-behind de pagos desactivado (PAYMENT_WRITE_BEHIND=0)")
+    return outbox.stats()
+
+@app.get("/admin/admission")
+def admin_admission():
+    return admission.stats()
+
+@app.get("/admin/startup")
+def admin_startup():
+    """Tiempos del arranque de este worker (intérprete, imports, fases del lifespan)."""
+    return STARTUP.stats()
+
+@app.get("/admin/cache")
+def admin_cache(repo = Depends(get_repo)):
+    out = {"products": products_cache.stats(), "quotes": quote_cache.stats()}
+    if hasattr(repo, "cache_stats"):
+        out["supabase"] = repo.cache_stats()
+    return out
+
+def _products_changed(request: Request):
+    """Tras una escritura: fuera el cache de respuestas y, con CATALOG_SYNC=1,
+    sincronización inmediata para leer lo propio en este worker."""
+    products_cache.clear()
+    if isinstance(request.app.state.fallback, CatalogSync):
+        request.app.state.fallback.poke()
 
 @app.post("/v1/products")
-def product_create(payload: dict, repo = Depends(get_repo)):
-    assert isinstance(repo, SupabaseRepo), "CRUD sólo disponible en SUPABASE"
-    return repo.product_create(payload)
+async def product_create(request: Request, payload: dict, repo = Depends(get_repo)):
+    assert repo.remote, "CRUD sólo disponible en SUPABASE"
+    row = await repo.product_create(payload)
+    _products_changed(request)
+    return row
+
+@app.post("/v1/products:bulk")
+async def products_bulk(request: Request, repo = Depends(get_repo)):
+    """Upsert masivo: arreglo JSON o NDJSON (`Content-Type: application/x-ndjson`),
+    leído en streaming y validado contra `Product` por lotes de PRODUCTS_BULK_BATCH.
+    Las filas inválidas se reportan por índice y no detienen el resto."""
+    ndjson = request.headers.get("content-type", "").startswith("application/x-ndjson")
+    supabase = repo.remote
+    received = upserted = batches = inserted = updated = 0
+    errors: List[dict] = []
+    failed = 0
+    batch: List[tuple] = []   # (índice, fila)
+    pending: List[dict] = []  # modo JSON: se escribe una sola vez al final
+
+    def fail(err: dict):
+        nonlocal failed
+        failed += 1
+        if len(errors) < PRODUCTS_BULK_MAX_ERRORS:
+            errors.append(err)
+
+    async def flush():
+        nonlocal upserted, batches
+        if not batch:
+            return
+        batches += 1
+        if not supabase:
+            pending.extend(row for _, row in batch)
+            batch.clear()
+            return
+        # un id repetido en el lote se combina (Postgres no actualiza la misma fila dos veces)
+        # y cada conjunto de columnas va en su propio POST para no pisar con null lo no enviado
+        merged: dict = {}
+        for index, row in batch:
+            prev = merged.get(row["id"])
+            merged[row["id"]] = (prev[0] + [index], {**prev[1], **row}) if prev else ([index], row)
+        groups: dict = {}
+        for indexes, row in merged.values():
+            groups.setdefault(tuple(sorted(row)), []).append((indexes, row))
+        for columns, group in groups.items():
+            try:
+                await repo.products_upsert([row for _, row in group], columns)
+                upserted += sum(len(indexes) for indexes, _ in group)
+            except httpx.HTTPError as e:
+                detail = e.response.text[:500] if isinstance(e, httpx.HTTPStatusError) else repr(e)
+                for indexes, row in group:
+                    for index in indexes:
+                        fail({"index": index, "id": row["id"], "error": f"Lote rechazado: {detail}"})
+        batch.clear()
+
+    try:
+        async for doc in iter_documents(request.stream(), ndjson):
+            product, err = validate(received, doc)
+            if err is not None:
+                fail(err)
+            else:
+                batch.append((received, product.model_dump(exclude_unset=True)))
+                if len(batch) >= PRODUCTS_BULK_BATCH:
+                    await flush()
+            received += 1
+        await flush()
+    except BadBody as e:
+        raise HTTPException(status_code=400, detail=f"{e} (filas procesadas: {received}, enviadas: {upserted})")
+    finally:
+        if upserted or pending:
+            _products_changed(request)
+
+    if pending:
+        inserted, updated = await run_in_threadpool(repo.catalog.upsert, pending)
+        upserted = len(pending)
+    out = {"received": received, "upserted": upserted, "failed": failed, "batches": batches,
+           "errors": errors, "errors_truncated": failed > len(errors)}
+    if not supabase:
+        out.update(inserted=inserted, updated=updated, version=repo.catalog.snapshot.version)
+    return out
 
 @app.patch("/v1/products/{pid}")
-def product_update(pid: str, payload: dict, repo = Depends(get_repo)):
-    assert isinstance(repo, SupabaseRepo), "CRUD sólo disponible en SUPABASE"
-    return repo.product_update(pid, payload)
+async def product_update(request: Request, pid: str, payload: dict, repo = Depends(get_repo)):
+    assert repo.remote, "CRUD sólo disponible en SUPABASE"
+    row = await repo.product_update(pid, payload)
+    _products_changed(request)
+    return row
 
 @app.delete("/v1/products/{pid}", status_code=204)
-def product_delete(pid: str, repo = Depends(get_repo)):
-  if not isinstance(repo, SupabaseRepo):
+async def product_delete(request: Request, pid: str, repo = Depends(get_repo)):
+  if not repo.remote:
     raise HTTPException(status_code=400, detail="CRUD solo disponible en SUPABASE")
-  repo.product_delete(pid)
+  await repo.product_delete(pid)
+  _products_changed(request)
   return Response(status_code=204)
 
-@app.post("/v1/checkout/start")
-def checkout_start(payload: QuoteIn, repo = Depends(get_repo)):
+async def _resolve(ids, repo) -> dict:
     if isinstance(repo, ProductsRepoJSON):
-        products = repo.list(limit=9999)  
-    else:
-        rows = repo.products_list(None, None, 1000, 0) 
-        products = [Product(**row) for row in rows]     
+        return repo.get_many(ids)
+    ids = sorted(set(ids))
+    chunks = [ids[i:i + GET_MANY_CHUNK] for i in range(0, len(ids), GET_MANY_CHUNK)]
+    id_map = {}
+    for part in await asyncio.gather(*(repo.get_many(c) for c in chunks)):
+        id_map.update(part)
+    return id_map
+
+async def _quote(payload: QuoteIn, repo, rules: RulesEngine):
+    id_map = await _resolve([i.id for i in payload.items], repo)
+    return make_quote([i.model_dump() for i in payload.items], id_map, payload, rules.current)
+
+@app.post("/v1/checkout/start")
+async def checkout_start(
+    payload: QuoteIn, repo = Depends(get_repo),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    store = Depends(get_idempotency_store), rules: RulesEngine = Depends(get_rules)
+):
+    async def run():
+        return JSONResponse(await _checkout(payload, repo, rules))
+    key = f"checkout:{idempotency_key}" if idempotency_key else None
+    return await run_idempotent(store, key, fingerprint(payload.model_dump()), run)
 
-    quote = make_quote([i.dict() for i in payload.items], products, payload)
+async def _checkout(payload: QuoteIn, repo, rules: RulesEngine) -> dict:
+    quote = await _quote(payload, repo, rules)
 
     order = {
       "email": None,
       "delivery_city": payload.delivery_city,
       "delivery_method": payload.delivery_method,
-      "coupon": payload.coupon,
+      "coupon": quote.applied_coupon,  # el que se canjea al aprobar el pago
       "subtotal": quote.subtotal,
       "discount": quote.discount,
       "shipping": quote.shipping,
@@ -90,295 +541,244 @@ def checkout_start(payload: QuoteIn, repo = Depends(get_repo)):
       "qty": it["qty"],
       "line": it["line"]
     } for it in quote.items]
+    short = next((it["product_id"] for it in items if it["qty"] <= 0), None)
+    if short is not None:
+        # sin stock la cotización deja el renglón en 0: no se crea una orden que no se puede reservar
+        raise HTTPException(status_code=409, detail=str(OutOfStock(short)))
 
-    if isinstance(repo, SupabaseRepo):
-        row = repo.order_create(order, items)
-        order_id = row["id"]
-    else:
-        import uuid
-        order_id = str(uuid.uuid4())
-
-    if isinstance(repo, SupabaseRepo):
-        sess = repo.payment_session_create(order_id, quote.total, FRONT_RETURN_URL)
-        session_id = sess["id"]
-    else:
-        import uuid
-        session_id = str(uuid.uuid4())
+    try:
+        # siempre con reserva: sin ella el pago aprobado no descontaría stock
+        created = await _maybe_await(repo.checkout_create(order, items, FRONT_RETURN_URL))
+    except OutOfStock as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    order_id = created["order"]["id"]
+    session_id = created["session"]["id"]
 
     payment_url = f"{API_PUBLIC_URL}/mockpay/{session_id}?order_id={order_id}&return={FRONT_RETURN_URL}"
     return {"order_id": order_id, "session_id": session_id, "payment_url": payment_url}
 
 
-from fastapi.responses import HTMLResponse
-
 @app.get("/mockpay/{session_id}")
 def mockpay_page(
     session_id: str,
     order_id: Optional[str] = None,
-    return_: Optional[str] = Query(None, alias="return")
+    return_: Optional[str] = Query(None, alias="return"),
+    if_none_match: Optional[str] = Header(None)
 ):
-    ret = return_ or FRONT_RETURN_URL
-
-    html = f"""
-    <!doctype html>
-    <html lang="es">
-    <head>
-      <meta charset="utf-8" />
-      <title>MockPay · Pasarela de pruebas</title>
-      <meta name="viewport" content="width=device-width, initial-scale=1" />
-      <style>
-        :root {{
-          --bg: #050807;
-          --card: #0f1814;
-          --accent: #1db954;
-          --accent-soft: rgba(29,185,84,0.15);
-          --danger: #e53935;
-          --text: #f5fff7;
-          --muted: #9fb0a4;
-          --border: #1f2a24;
-          --radius: 16px;
-          --shadow: 0 18px 45px rgba(0,0,0,0.65);
-          --font: system-ui, -apple-system, BlinkMacSystemFont, "SF Pro Text",
-                   "Segoe UI", sans-serif;
-        }}
-        * {{ box-sizing: border-box; }}
-        body {{
-          margin: 0;
-          min-height: 100vh;
-          display: flex;
-          align-items: center;
-          justify-content: center;
-          font-family: var(--font);
-          background: radial-gradient(circle at top, #11251a 0, #050807 55%);
-          color: var(--text);
-        }}
-        .shell {{
-          width: 100%;
-          max-width: 460px;
-          padding: 24px;
-        }}
-        .card {{
-          background: var(--card);
-          border-radius: var(--radius);
-          border: 1px solid var(--border);
-          box-shadow: var(--shadow);
-          padding: 24px 22px 20px;
-          position: relative;
-          overflow: hidden;
-        }}
-        .badge-env {{
-          position: absolute;
-          top: 14px;
-          right: 18px;
-          font-size: 11px;
-          letter-spacing: .12em;
-          text-transform: uppercase;
-          color: var(--accent);
-          background: rgba(0,0,0,0.45);
-          border-radius: 999px;
-          padding: 4px 9px;
-          border: 1px solid rgba(29,185,84,0.35);
-        }}
-        h1 {{
-          margin: 0 0 8px;
-          font-size: 22px;
-          display: flex;
-          align-items: center;
-          gap: 8px;
-        }}
-        h1 span.logo {{
-          width: 26px;
-          height: 26px;
-          border-radius: 9px;
-          background: radial-gradient(circle at 20% 0, #4cff9a 0, #1db954 35%, #0a381c 80%);
-          display: inline-flex;
-          align-items: center;
-          justify-content: center;
-          font-size: 15px;
-          box-shadow: 0 0 0 2px rgba(0,0,0,0.45);
-        }}
-        .subtitle {{
-          margin: 0 0 10px;
-          font-size: 13px;
-          color: var(--muted);
-        }}
-        .warning {{
-          background: #271414;
-          border-radius: 10px;
-          border: 1px solid rgba(229,57,53,0.4);
-          padding: 10px 11px;
-          font-size: 12px;
-          color: #ffcdd2;
-          display: flex;
-          gap: 8px;
-          align-items: flex-start;
-          margin-bottom: 12px;
-        }}
-        .warning strong {{ display: block; font-size: 12px; }}
-        .meta {{
-          font-size: 13px;
-          color: var(--muted);
-          display: grid;
-          gap: 4px;
-          margin-bottom: 14px;
-        }}
-        .meta span.label {{ color: #6f8377; }}
-        .meta-code {{
-          font-family: "JetBrains Mono", ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, "Liberation Mono", "Courier New", monospace;
-          font-size: 12px;
-          padding: 4px 8px;
-          border-radius: 7px;
-          background: rgba(0,0,0,0.45);
-          border: 1px solid var(--border);
-          color: #c5f2d7;
-          max-width: 100%;
-          overflow-wrap: anywhere;
-        }}
-        form {{
-          margin-top: 16px;
-          display: flex;
-          gap: 10px;
-        }}
-        button {{
-          cursor: pointer;
-          border-radius: 999px;
-          border: none;
-          font-size: 14px;
-          padding: 9px 16px;
-          font-weight: 500;
-          display: inline-flex;
-          align-items: center;
-          justify-content: center;
-        }}
-        button.primary {{
-          background: var(--accent);
-          color: #041007;
-        }}
-        button.primary:hover {{
-          background: #1ee666;
-        }}
-        button.ghost {{
-          background: transparent;
-          color: #ffb3b1;
-          border: 1px solid rgba(229,57,53,0.55);
-        }}
-        button.ghost:hover {{
-          background: rgba(229,57,53,0.08);
-        }}
-        .footer-note {{
-          margin-top: 14px;
-          font-size: 11px;
-          color: var(--muted);
-          line-height: 1.5;
-        }}
-        .footer-note strong {{ color: #e0f2e9; }}
-        @media (max-width: 520px) {{
-          .shell {{ padding: 16px; }}
-          .card {{ padding: 20px 16px 16px; }}
-          form {{ flex-direction: column; }}
-          button {{ width: 100%; }}
-        }}
-      </style>
-    </head>
-    <body>
-      <div class="shell">
-        <div class="card">
-          <div class="badge-env">Sandbox</div>
-          <h1>
-            <span class="logo">⚽</span>
-            MockPay · Pasarela de pruebas
-          </h1>
-          <p class="subtitle">
-            Estás simulando un pago para <strong>The Football Shop</strong>.
-          </p>
-
-          <div class="warning">
-            <span>⚠️</span>
-            <div>
-              <strong>Pasarela ficticia solo para uso académico.</strong>
-              No ingreses datos reales de tarjetas ni información sensible. El resultado de este flujo
-              es únicamente una simulación de pago para pruebas.
-            </div>
-          </div>
-
-          <div class="meta">
-            <div>
-              <span class="label">ID de sesión</span>
-              <div class="meta-code">{session_id}</div>
-            </div>
-            <div>
-              <span class="label">ID de orden</span>
-              <div class="meta-code">{order_id or 'No disponible'}</div>
-            </div>
-          </div>
-
-          <form method="POST" action="/v1/payment/mock/submit">
-            <input type="hidden" name="session_id" value="{session_id}" />
-            <input type="hidden" name="order_id" value="{order_id or ''}" />
-            <input type="hidden" name="return" value="{ret}" />
-            <button class="primary" name="action" value="approve">
-              Aprobar pago
-            </button>
-            <button class="ghost" name="action" value="reject">
-              Rechazar pago
-            </button>
-          </form>
-
-          <p class="footer-note">
-            Esta pantalla emula el comportamiento de una pasarela de pago real (aprobado / rechazado),
-            pero <strong>no procesa cobros reales</strong>. Al continuar, serás redirigido de vuelta a la aplicación.
-          </p>
-        </div>
-      </div>
-    </body>
-    </html>
-    """
-    return HTMLResponse(html)
+    t0 = time.perf_counter()
+    resp = mockpay.page(session_id, order_id, return_ or FRONT_RETURN_URL, if_none_match)
+    observe_stage("mockpay_render", time.perf_counter() - t0)
+    return resp
+
+@app.get(images.PREFIX + "{digest}/{rest:path}", include_in_schema=False)
+async def image_variant(digest: str, rest: str, if_none_match: Optional[str] = Header(None)):
+    """Derivado de una imagen del catálogo (`img_srcset` de los productos)."""
+    resp = await images.serve(digest, rest, if_none_match)
+    if resp is None:
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+    return resp
+
+@app.get(mockpay.STATIC_PREFIX + "{name}", include_in_schema=False)
+def static_asset(name: str, accept_encoding: Optional[str] = Header(None),
+                 if_none_match: Optional[str] = Header(None)):
+    resp = mockpay.asset(name, accept_encoding, if_none_match)
+    if resp is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return resp
 
 from datetime import datetime
 from uuid import uuid4
 from fastapi.responses import RedirectResponse
 
 @app.post("/v1/payment/mock/submit")
-def mockpay_submit(
+async def mockpay_submit(
     session_id: str = Form(...),
     order_id: Optional[str] = Form(None),
     action: str = Form(...),
     return_: str = Form(..., alias="return"),
-    repo = Depends(get_repo)
+    repo = Depends(get_repo),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    store = Depends(get_idempotency_store),
+    outbox: Optional[PaymentOutbox] = Depends(get_outbox),
+    watch: OrderWatch = Depends(get_order_watch),
+    rules: RulesEngine = Depends(get_rules)
 ):
+    # un formulario HTML no puede mandar headers: la sesión de pago es la clave natural
+    key = f"mockpay:{idempotency_key or session_id}"
+    return await run_idempotent(store, key, fingerprint(session_id, order_id, action),
+                                lambda: _mockpay_submit(session_id, order_id, action, return_, repo, outbox, watch,
+                                                        rules))
+
+async def _redeem_coupon(orders, order_id: str, rules: RulesEngine):
+    """El cupo de un cupón con max_uses se gasta al cobrar: un carrito abandonado,
+    rechazado o vencido no lo consume. La venta ya está hecha: si la lectura
+    falla solo se pierde la cuenta de ese uso."""
+    try:
+        order = await _maybe_await(orders.order_with_items(order_id))
+    except Exception as e:
+        log.warning("no se pudo contar el cupón de la orden %s: %r", order_id, e)
+        return
+    rules.redeem((order or {}).get("coupon"))
+
+async def _mockpay_submit(session_id: str, order_id: Optional[str], action: str, return_: str, repo,
+                          outbox: Optional[PaymentOutbox] = None, watch: Optional[OrderWatch] = None,
+                          rules: Optional[RulesEngine] = None):
     status = "approved" if action == "approve" else "rejected"
+    orders = repo if repo.remote else repo.orders
+    expired = closed = False
 
-    if isinstance(repo, SupabaseRepo):
-        repo.payment_session_update(session_id, status)
-        if order_id:
+    if order_id:
+        try:
+            # la reserva pasa a venta (o se libera) y la orden cambia de estado en el mismo paso;
+            # si venció y el stock ya no alcanza, no se cobra
             if status == "approved":
-                receipt = f"FS-{datetime.utcnow().strftime('%Y%m%d')}-{str(uuid4())[:8]}"
-                paid_at = datetime.utcnow().isoformat()
-                repo.order_update_status(order_id, "paid",
-                                         receipt_code=receipt,
-                                         paid_at=paid_at)
+                await _maybe_await(orders.stock_holds_commit(order_id))
             else:
-                repo.order_update_status(order_id, "rejected")
+                await _maybe_await(orders.stock_holds_release(order_id))
+        except OutOfStock:
+            status, expired = "rejected", True
+        except OrderClosed as e:
+            # otro submit ya la resolvió: se informa ese resultado y no se pisa su estado
+            status, closed = "approved" if e.status == "paid" else "rejected", True
+        if status == "approved" and not closed and rules is not None:
+            await _redeem_coupon(orders, order_id, rules)
+
+    writes = [("payment_session_update", {"session_id": session_id, "status": status})]
+    if order_id and not closed:
+        if status == "approved":
+            receipt = f"FS-{datetime.utcnow().strftime('%Y%m%d')}-{str(uuid4())[:8]}"
+            paid_at = datetime.utcnow().isoformat()
+            writes.append(("order_update_status", {"order_id": order_id, "status": "paid",
+                                                   "receipt_code": receipt, "paid_at": paid_at}))
+        else:
+            writes.append(("order_update_status", {"order_id": order_id,
+                                                   "status": "expired" if expired else "rejected"}))
+    if outbox:
+        # la reserva y el estado de la orden ya quedaron en la RPC de arriba: en segundo plano
+        # van la sesión, el recibo y paid_at (el estado repetido no cambia nada): esperar la cola
+        # no abre una ventana para vender dos veces
+        await run_in_threadpool(outbox.enqueue, order_id or f"session:{session_id}", writes)
+        outbox.notify()
+    else:
+        for op, args in writes:
+            await _maybe_await(getattr(orders, op)(**args))
+    if watch:
+        watch.notify(order_id)  # ?wait= y /events responden ya, sin esperar a releer
 
     url = f"{return_}?status={'success' if status=='approved' else 'failed'}&order_id={order_id or ''}"
     return RedirectResponse(url, status_code=302)
 
 @app.post("/v1/pricing/quote")
-def pricing_quote(payload: QuoteIn, repo = Depends(get_repo)):
-    if isinstance(repo, ProductsRepoJSON):
-        products = repo.list(limit=9999)  
+async def pricing_quote(payload: QuoteIn, response: Response, repo = Depends(get_catalog_repo),
+                        rules: RulesEngine = Depends(get_rules)):
+    """El front recotiza el mismo carrito muchas veces: con catálogo versionado
+    el resultado se memoiza (`X-Quote-Cache: HIT|MISS|BYPASS`)."""
+    cart = normalized(payload)
+    version = repo.catalog.snapshot.version if isinstance(repo, ProductsRepoJSON) else None
+    key = quote_cache.key(cart, version, rules.current)
+    quote = quote_cache.get(key) if key is not None else None
+    response.headers["X-Quote-Cache"] = "BYPASS" if key is None else "HIT" if quote is not None else "MISS"
+    if quote is None:
+        quote = await _quote(payload, repo, rules)
+        if key is not None:
+            quote_cache.put(key, quote)
+    return quote
+
+@app.post("/v1/pricing/quote:batch")
+async def pricing_quote_batch(request: Request, repo = Depends(get_catalog_repo), rules: RulesEngine = Depends(get_rules)):
+    """Cotiza muchos carritos: body JSON (arreglo de QuoteIn) o NDJSON (un QuoteIn
+    por línea). Responde NDJSON en el mismo orden: {"index", "quote"} o {"index", "error"}."""
+    raw = await request.body()
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        docs = [line for line in raw.splitlines() if line.strip()]
     else:
-        rows = repo.products_list(None, None, 1000, 0)   
-        products = [Product(**row) for row in rows]       
+        try:
+            docs = json.loads(raw or b"[]")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body JSON inválido")
+        if not isinstance(docs, list):
+            raise HTTPException(status_code=400, detail="Se espera un arreglo de cotizaciones")
+    if len(docs) > BATCH_QUOTE_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo {BATCH_QUOTE_MAX} carritos por lote")
+
+    parsed: List = []
+    for doc in docs:
+        try:
+            parsed.append(QuoteIn.model_validate_json(doc) if isinstance(doc, bytes) else QuoteIn.model_validate(doc))
+        except ValidationError as e:
+            parsed.append(e.errors(include_url=False, include_context=False))
+    valid = [p for p in parsed if isinstance(p, QuoteIn)]
+    id_map = await _resolve({i.id for p in valid for i in p.items}, repo)
+
+    def lines():
+        quotes = make_quotes(valid, id_map, rules.current)
+        for index, p in enumerate(parsed):
+            if isinstance(p, QuoteIn):
+                row = {"index": index, "quote": next(quotes).model_dump()}
+            else:
+                row = {"index": index, "error": p}
+            yield json.dumps(row, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-    return make_quote([i.dict() for i in payload.items], products, payload)
+async def _with_pending(rows: List[dict], outbox: Optional[PaymentOutbox]) -> List[dict]:
+    """Aplica encima el estado aún encolado en el write-behind de pagos: el front
+    consulta la orden apenas vuelve de mockpay y debe ver lo que eligió."""
+    if not outbox or not rows:
+        return rows
+    pending = await run_in_threadpool(outbox.pending, [r["id"] for r in rows])
+    out = []
+    for row in rows:
+        for op, args in pending.get(row["id"], ()):
+            if op == "order_update_status":  # copia: `row` puede venir del cache
+                row = {**row, **{k: v for k, v in args.items() if k != "order_id" and v is not None}}
+        out.append(row)
+    return out
+
+def _order_reader(repo, outbox: Optional[PaymentOutbox], order_id: str):
+    async def read():
+        if repo.remote:
+            data = await repo.order_with_items(order_id)
+        else:
+            data = repo.orders.order_with_items(order_id)
+        return (await _with_pending([data], outbox))[0] if data else None
+    return read
+
+@app.get("/v1/orders")
+async def orders_batch(ids: str = Query(..., description="ids separados por coma"), repo = Depends(get_repo),
+                       outbox: Optional[PaymentOutbox] = Depends(get_outbox)):
+    """Varias órdenes con sus ítems (back office): una consulta id=in.(...) por
+    bloque de GET_MANY_CHUNK. Respuesta en el orden pedido más los ids que no existen."""
+    wanted = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if len(wanted) > ORDERS_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo {ORDERS_BATCH_MAX} órdenes por petición")
+    if repo.remote:
+        chunks = [wanted[i:i + GET_MANY_CHUNK] for i in range(0, len(wanted), GET_MANY_CHUNK)]
+        rows = [r for part in await asyncio.gather(*(repo.orders_with_items(c) for c in chunks)) for r in part]
+    else:
+        rows = repo.orders.orders_with_items(wanted)
+    by_id = {r["id"]: r for r in await _with_pending(rows, outbox)}
+    return {"orders": [by_id[i] for i in wanted if i in by_id], "missing": [i for i in wanted if i not in by_id]}
 
 @app.get("/v1/orders/{order_id}")
-def get_order(order_id: str, repo = Depends(get_repo)):
-    if not isinstance(repo, SupabaseRepo):
-        raise HTTPException(status_code=400, detail="Orders solo disponibles en modo SUPABASE")
-    data = repo.order_with_items(order_id)
+async def get_order(order_id: str, wait: float = Query(0, ge=0), status: str = Query("pending"),
+                    repo = Depends(get_repo), outbox: Optional[PaymentOutbox] = Depends(get_outbox),
+                    watch: OrderWatch = Depends(get_order_watch)):
+    """Con `wait` (segundos, hasta ORDER_WAIT_MAX) es un long-poll: responde en
+    cuanto el estado deja de ser `status` o al vencer la espera, con el estado que haya."""
+    read = _order_reader(repo, outbox, order_id)
+    if wait:
+        data = await watch.until_changed(order_id, read, status, min(wait, ORDER_WAIT_MAX))
+    else:
+        data = await read()
     if not data:
         raise HTTPException(status_code=404, detail="Order not found")
-    return data
\ No newline at end of file
+    return data
+
+@app.get("/v1/orders/{order_id}/events")
+async def order_events(order_id: str, repo = Depends(get_repo), outbox: Optional[PaymentOutbox] = Depends(get_outbox),
+                       watch: OrderWatch = Depends(get_order_watch)):
+    """Server-sent events: `order` con la orden completa al conectar y en cada
+    cambio de estado; el stream se cierra en paid, rejected o expired."""
+    return StreamingResponse(watch.events(order_id, _order_reader(repo, outbox, order_id)),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
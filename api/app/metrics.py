@@ -0,0 +1,169 @@
+"""Métricas en formato de exposición de Prometheus, sin dependencias.
+
+Histogramas y contadores con etiquetas, más gauges que se calculan al momento
+del scrape (ratios de cache, saturación del pool). Con METRICS=0 `stage()` es
+un no-op y el middleware no se instala.
+"""
+import functools, threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from .config import METRICS
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(v: object) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, value: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, v in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {v}"
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=BUCKETS):
+        self.name, self.help, self.labelnames = name, help, labels
+        self.buckets = tuple(buckets)
+        # etiquetas -> [conteo por bucket (no acumulado; el último es +Inf), suma]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labelnames + ("le",)
+        with self._lock:
+            series = [(k, list(v[0]), v[1]) for k, v in sorted(self._series.items())]
+        for labels, counts, total in series:
+            acc = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_labels(names, labels + (le,))} {acc}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {acc}"
+
+class Gauges:
+    """Familia de gauges calculada al hacer scrape: `collect()` devuelve
+    [(valores de etiquetas, valor)]."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...],
+                 collect: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]):
+        self.name, self.help, self.labelnames, self.collect = name, help, labels, collect
+
+    def render(self) -> Iterator[str]:
+        try:
+            rows = list(self.collect())
+        except Exception:  # un colector roto no debe tumbar el scrape
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for labels, v in rows:
+            if v is not None:
+                yield f"{self.name}{_labels(self.labelnames, labels)} {float(v)}"
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics.values():
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+HTTP_REQUESTS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Latencia de requests HTTP por ruta, método y status",
+    ("route", "method", "status")))
+STAGES = REGISTRY.register(Histogram(
+    "stage_duration_seconds", "Latencia de etapas internas (carga de catálogo, cotización, render)", ("stage",)))
+SUPABASE_CALLS = REGISTRY.register(Histogram(
+    "supabase_request_duration_seconds", "Latencia de llamadas a PostgREST por método, ruta y status",
+    ("method", "path", "status")))
+
+@contextmanager
+def stage(name: str):
+    if not METRICS:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGES.observe(time.perf_counter() - t0, name)
+
+def timed(name: str):
+    """Decorador de `stage`; sin METRICS devuelve la función tal cual."""
+    def wrap(fn):
+        if not METRICS:
+            return fn
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                STAGES.observe(time.perf_counter() - t0, name)
+        return inner
+    return wrap
+
+def observe_stage(name: str, seconds: float):
+    if METRICS:
+        STAGES.observe(seconds, name)
+
+class MetricsMiddleware:
+    """ASGI puro (sin BaseHTTPMiddleware): mide hasta el último byte del body,
+    incluidas las respuestas en streaming, y etiqueta con la plantilla de la ruta."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUESTS.observe(time.perf_counter() - t0, path, scope["method"], status)
@@ -0,0 +1,72 @@
+import hashlib, html, os, re
+from typing import Dict, List, Optional
+from fastapi import Response
+from .response_cache import EncodedBody, etag_matches, respond
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+_FIELD = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+STATIC_PREFIX = "/static/"
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"  # el nombre cambia con el contenido
+PAGE_CACHE_CONTROL = "private, no-cache"  # el navegador revalida con If-None-Match
+
+def _read(rel: str) -> bytes:
+    with open(os.path.join(_DIR, rel), "rb") as f:
+        return f.read()
+
+class Asset:
+    """Archivo estático con el hash del contenido en el nombre
+    (`mockpay.3f2a…css`), comprimido una sola vez en gzip y brotli."""
+
+    def __init__(self, rel: str, media_type: str):
+        data = _read(rel)
+        stem, ext = os.path.splitext(os.path.basename(rel))
+        self.name = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        self.media_type = media_type
+        self.body = EncodedBody(data)
+
+class Template:
+    """Plantilla con campos `{{ nombre }}`, partida una sola vez en literales y
+    nombres. Los campos de `static` se resuelven al compilar; el resto se
+    escapa como HTML en cada render."""
+
+    def __init__(self, text: str, static: Optional[Dict[str, str]] = None):
+        static = static or {}
+        pieces = _FIELD.split(text)  # literal, campo, literal, campo, ..., literal
+        self.literals: List[str] = [pieces[0]]
+        self.fields: List[str] = []
+        for name, literal in zip(pieces[1::2], pieces[2::2]):
+            if name in static:
+                self.literals[-1] += html.escape(static[name]) + literal
+            else:
+                self.fields.append(name)
+                self.literals.append(literal)
+        self.digest = hashlib.sha256("\0".join(self.literals).encode()).hexdigest()
+
+    def render(self, **values: str) -> bytes:
+        out = [self.literals[0]]
+        for name, literal in zip(self.fields, self.literals[1:]):
+            out.append(html.escape(values[name], quote=True))
+            out.append(literal)
+        return "".join(out).encode()
+
+CSS = Asset("static/mockpay.css", "text/css; charset=utf-8")
+ASSETS = {CSS.name: CSS}
+PAGE = Template(_read("templates/mockpay.html").decode(), {"css_href": STATIC_PREFIX + CSS.name})
+
+def page(session_id: str, order_id: Optional[str], return_url: str, if_none_match: Optional[str]) -> Response:
+    """La página depende solo de la plantilla y de sus tres campos: el ETag
+    fuerte se calcula sin renderizar y una revalidación responde 304."""
+    key = "\0".join((PAGE.digest, session_id, order_id or "", return_url))
+    headers = {"ETag": '"' + hashlib.md5(key.encode()).hexdigest() + '"', "Cache-Control": PAGE_CACHE_CONTROL}
+    if etag_matches(headers["ETag"], if_none_match):
+        return Response(status_code=304, headers=headers)
+    body = PAGE.render(session_id=session_id, order_id=order_id or "",
+                       order_label=order_id or "No disponible", return_url=return_url)
+    return Response(body, media_type="text/html; charset=utf-8", headers=headers)
+
+def asset(name: str, accept_encoding: Optional[str], if_none_match: Optional[str]) -> Optional[Response]:
+    a = ASSETS.get(name)
+    if a is None:
+        return None
+    return respond(a.body, accept_encoding, if_none_match, ASSET_CACHE_CONTROL, a.media_type)
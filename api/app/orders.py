@@ -0,0 +1,78 @@
+import asyncio, json, time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from .config import ORDER_WAIT_POLL, ORDER_EVENTS_MAX, ORDER_EVENTS_HEARTBEAT
+
+# estados que ya no cambian: el stream SSE termina al llegar a uno de ellos
+TERMINAL = ("paid", "rejected", "expired")
+
+Order = Optional[Dict[str, Any]]
+
+class OrderWatch:
+    """Despierta a quienes esperan un cambio de estado de una orden. El aviso
+    es local al worker (mockpay y la cola de pagos llaman a `notify`); los
+    cambios hechos en otro worker se ven al releer cada `poll` segundos."""
+
+    def __init__(self, poll: float = ORDER_WAIT_POLL):
+        self.poll = poll
+        self._waiters: Dict[str, List] = {}  # order_id -> [evento, esperando]
+        self.notified = 0
+
+    def notify(self, order_id: Optional[str]):
+        slot = self._waiters.pop(order_id, None) if order_id else None
+        if slot is not None:
+            self.notified += 1
+            slot[0].set()
+
+    async def sleep(self, order_id: str, timeout: float) -> bool:
+        """Hasta `timeout` segundos o un `notify(order_id)`; True si hubo aviso."""
+        slot = self._waiters.setdefault(order_id, [asyncio.Event(), 0])
+        slot[1] += 1
+        try:
+            await asyncio.wait_for(slot[0].wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            slot[1] -= 1
+            if not slot[1] and self._waiters.get(order_id) is slot:
+                del self._waiters[order_id]
+
+    async def until_changed(self, order_id: str, read: Callable[[], Awaitable[Order]],
+                            status: str, timeout: float) -> Order:
+        """Relee la orden hasta que su estado deje de ser `status` o pase `timeout`."""
+        deadline = time.monotonic() + timeout
+        while True:
+            data = await read()
+            left = deadline - time.monotonic()
+            if data is None or data.get("status") != status or left <= 0:
+                return data
+            await self.sleep(order_id, min(self.poll, left))
+
+    async def events(self, order_id: str, read: Callable[[], Awaitable[Order]],
+                     max_seconds: float = ORDER_EVENTS_MAX,
+                     heartbeat: float = ORDER_EVENTS_HEARTBEAT) -> AsyncIterator[str]:
+        """Stream SSE: un evento `order` al conectar y en cada cambio de estado;
+        termina en un estado final, si la orden no existe o tras `max_seconds`."""
+        deadline = time.monotonic() + max_seconds
+        last: Optional[str] = None
+        quiet = 0.0
+        while time.monotonic() < deadline:
+            data = await read()
+            if data is None:
+                yield "event: missing\ndata: {}\n\n"
+                return
+            if data.get("status") != last:
+                last, quiet = data.get("status"), 0.0
+                yield f"event: order\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+                if last in TERMINAL:
+                    return
+            elif quiet >= heartbeat:
+                quiet = 0.0
+                yield ": keep-alive\n\n"
+            t0 = time.monotonic()
+            await self.sleep(order_id, min(self.poll, max(0.0, deadline - t0)))
+            quiet += time.monotonic() - t0
+
+    def stats(self) -> dict:
+        return {"waiting": sum(s[1] for s in self._waiters.values()), "orders": len(self._waiters),
+                "notified": self.notified, "poll": self.poll}
@@ -0,0 +1,216 @@
+import asyncio, inspect, json, logging, os, sqlite3, sys, threading, time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from .breaker import CircuitOpen
+from .metrics import observe_stage
+from .config import (PAYMENT_OUTBOX_DB, PAYMENT_OUTBOX_BATCH, PAYMENT_OUTBOX_CONCURRENCY, PAYMENT_OUTBOX_POLL,
+                     PAYMENT_OUTBOX_LEASE, PAYMENT_OUTBOX_RETRY_BASE, PAYMENT_OUTBOX_RETRY_MAX)
+
+log = logging.getLogger(__name__)
+
+# métodos del repositorio de órdenes que se pueden encolar (las dos escrituras de mockpay)
+OPS = ("payment_session_update", "order_update_status")
+PENDING, DEAD = "pending", "dead"
+
+def _permanent(e: Exception) -> bool:
+    """4xx de PostgREST (salvo 408/429) o una fila mal formada: reintentar no lo arregla."""
+    httpx = sys.modules.get("httpx")  # sin importarlo: en modo JSON no está cargado y no hay errores HTTP
+    if httpx is not None and isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code < 500 and e.response.status_code not in (408, 429)
+    return isinstance(e, (TypeError, ValueError))
+
+class PaymentOutbox:
+    """Write-behind de los cambios de estado del pago: mockpay los deja en un
+    archivo SQLite (WAL, compartido entre workers) y redirige; una tarea los
+    aplica contra el repositorio en lotes, en orden por orden (`key`) y con
+    reintentos con backoff. Cada escritura es un PATCH idempotente, así que una
+    entrega repetida (lease vencido, worker reiniciado) no cambia el resultado."""
+
+    def __init__(self, path: str = PAYMENT_OUTBOX_DB, batch: int = PAYMENT_OUTBOX_BATCH,
+                 concurrency: int = PAYMENT_OUTBOX_CONCURRENCY, poll: float = PAYMENT_OUTBOX_POLL,
+                 lease: float = PAYMENT_OUTBOX_LEASE, retry_base: float = PAYMENT_OUTBOX_RETRY_BASE,
+                 retry_max: float = PAYMENT_OUTBOX_RETRY_MAX):
+        self.path = path
+        self.batch = batch
+        self.concurrency = concurrency
+        self.poll = poll
+        self.lease = lease
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._local = threading.local()
+        self._wake: Optional[asyncio.Event] = None
+        self.on_applied: Optional[Callable[[str], None]] = None  # clave cuyas escrituras ya se aplicaron
+        self.enqueued = self.flushed = self.retries = self.discarded = 0
+        self.last_error: Optional[str] = None
+        self.last_flush_at: Optional[float] = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as c:
+            c.execute("""create table if not exists outbox (
+                seq integer primary key autoincrement, key text not null, op text not null,
+                args text not null, created_at real not null, state text not null default 'pending',
+                attempts integer not null default 0, next_at real not null, lease_until real not null default 0,
+                last_error text)""")
+            c.execute("create index if not exists outbox_key on outbox(key, seq)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            self._local.conn = conn
+        return conn
+
+    # --- escritura (request) ---
+
+    def enqueue(self, key: str, ops: List[Tuple[str, Dict[str, Any]]]):
+        """Registra las escrituras de una transición, todas o ninguna."""
+        now = time.time()
+        c = self._conn()
+        c.execute("begin immediate")
+        try:
+            c.executemany("insert into outbox (key, op, args, created_at, next_at) values (?, ?, ?, ?, ?)",
+                          [(key, op, json.dumps(args), now, now) for op, args in ops])
+        except BaseException:
+            c.execute("rollback")
+            raise
+        c.execute("commit")
+        self.enqueued += len(ops)
+
+    def notify(self):
+        """Despierta al flusher de este worker (los demás lo ven en su próximo poll)."""
+        if self._wake is not None:
+            self._wake.set()
+
+    def pending(self, keys: Iterable[str]) -> Dict[str, List[Tuple[str, Dict[str, Any]]]]:
+        """Escrituras aún no aplicadas de cada clave, en orden (para leer lo propio)."""
+        keys, out = list(keys), {}
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            for key, op, args in self._conn().execute(
+                    f"select key, op, args from outbox where state = ? and key in ({','.join('?' * len(part))}) "
+                    f"order by seq", (PENDING, *part)):
+                out.setdefault(key, []).append((op, json.loads(args)))
+        return out
+
+    # --- vaciado (tarea en segundo plano) ---
+
+    def _claim(self) -> List[tuple]:
+        """Toma hasta `batch` filas de las claves cuya cabeza está lista y libre;
+        el resto de cada clave espera a que su cabeza se aplique."""
+        now = time.time()
+        c = self._conn()
+        c.execute("begin immediate")
+        try:
+            # en SQLite las columnas sueltas junto a min() salen de la fila del mínimo
+            heads = c.execute("select key, min(seq), next_at, lease_until from outbox where state = ? group by key",
+                              (PENDING,)).fetchall()
+            keys = [k for k, _, next_at, lease_until in sorted(heads, key=lambda h: h[1])
+                    if next_at <= now and lease_until < now][:self.batch]
+            rows: List[tuple] = []
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows += c.execute(f"select seq, key, op, args, attempts, created_at from outbox "
+                                  f"where state = ? and key in ({','.join('?' * len(part))}) order by seq",
+                                  (PENDING, *part)).fetchall()
+            rows = sorted(rows)[:self.batch]
+            c.executemany("update outbox set lease_until = ? where seq = ?", [(now + self.lease, r[0]) for r in rows])
+        finally:
+            c.execute("commit")
+        return rows
+
+    def _done(self, seqs: List[int]):
+        self._conn().executemany("delete from outbox where seq = ?", [(s,) for s in seqs])
+
+    def _failed(self, row: tuple, error: Exception, later: List[int]):
+        seq, attempts = row[0], row[4] + 1
+        c = self._conn()
+        if _permanent(error):
+            c.execute("update outbox set state = ?, attempts = ?, last_error = ? where seq = ?",
+                      (DEAD, attempts, repr(error), seq))
+        else:
+            delay = error.retry_after if isinstance(error, CircuitOpen) else \
+                min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+            c.execute("update outbox set attempts = ?, next_at = ?, lease_until = 0, last_error = ? where seq = ?",
+                      (attempts, time.time() + delay, repr(error), seq))
+        # lo que venía detrás de la misma clave se suelta sin contar intento
+        c.executemany("update outbox set lease_until = 0 where seq = ?", [(s,) for s in later])
+
+    async def _apply(self, target, rows: List[tuple]):
+        done: List[int] = []
+        try:
+            for i, (seq, key, op, args, attempts, created_at) in enumerate(rows):
+                try:
+                    if op not in OPS:
+                        raise ValueError(f"operación desconocida en la cola: {op}")
+                    out = getattr(target, op)(**json.loads(args))
+                    if inspect.isawaitable(out):
+                        await out
+                except Exception as e:
+                    self.last_error = repr(e)
+                    if _permanent(e):
+                        self.discarded += 1
+                        log.error("escritura %s de %s descartada: %r", op, key, e)
+                    else:
+                        self.retries += 1
+                    await run_in_threadpool(self._failed, rows[i], e, [r[0] for r in rows[i + 1:]])
+                    return
+                done.append(seq)
+                observe_stage("payment_outbox_lag", time.time() - created_at)
+        finally:
+            if done:
+                await run_in_threadpool(self._done, done)
+                self.flushed += len(done)
+                if self.on_applied:
+                    self.on_applied(rows[0][1])
+
+    async def flush(self, target) -> int:
+        """Una ronda: reclama un lote y lo aplica, claves en paralelo y cada una
+        en orden. Devuelve cuántas filas tomó (0 = nada listo)."""
+        rows = await run_in_threadpool(self._claim)
+        if not rows:
+            return 0
+        by_key: Dict[str, List[tuple]] = {}
+        for r in rows:
+            by_key.setdefault(r[1], []).append(r)
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def one(key_rows):
+            async with sem:
+                await self._apply(target, key_rows)
+        await asyncio.gather(*(one(v) for v in by_key.values()))
+        self.last_flush_at = time.time()
+        return len(rows)
+
+    async def run(self, target_of: Callable[[], Any]):
+        """Bucle del flusher: corre al ser avisado o cada `poll` segundos."""
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                while await self.flush(target_of()):
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("no se pudo vaciar la cola de pagos")
+
+    async def drain(self, target, timeout: float):
+        """Al apagar: intenta dejar la cola vacía; lo que quede se aplica al volver."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and await self.flush(target):
+            pass
+
+    def stats(self) -> dict:
+        now = time.time()
+        depth, oldest, retrying = self._conn().execute(
+            "select count(*), min(created_at), sum(attempts > 0) from outbox where state = ?", (PENDING,)).fetchone()
+        dead = self._conn().execute("select count(*) from outbox where state = ?", (DEAD,)).fetchone()[0]
+        return {"path": self.path, "depth": depth, "retrying": retrying or 0, "dead": dead,
+                "lag_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+                "enqueued": self.enqueued, "flushed": self.flushed, "retries": self.retries,
+                "discarded": self.discarded, "last_error": self.last_error, "last_flush_at": self.last_flush_at}
@@ -0,0 +1,186 @@
+import json, os, threading, time
+from datetime import datetime, timezone
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+from .models import Product
+from .reloader import FileReloader
+from .search import normalize
+from .config import COUPONS, SHIPPING_TABLE, PRICING_RULES_FILE, PRICING_RULES_WATCH_INTERVAL
+
+COUPON_TYPES = ("percent", "amount", "shipping_free")
+
+def _epoch(v: Any) -> Optional[float]:
+    if v in (None, ""):
+        return None
+    if isinstance(v, (int, float)):
+        return float(v)
+    dt = datetime.fromisoformat(str(v).replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def _keys(values: Optional[Iterable[str]]) -> FrozenSet[str]:
+    return frozenset(normalize(v) for v in values or () if v)
+
+class CompiledCoupon:
+    __slots__ = ("code", "kind", "value", "max_discount", "min_subtotal", "categories", "clubs",
+                 "valid_from", "valid_until", "max_uses", "used")
+
+    def __init__(self, raw: Dict[str, Any]):
+        self.code = str(raw["code"]).upper()
+        self.kind = raw["type"]
+        if self.kind not in COUPON_TYPES:
+            raise ValueError(f"Tipo de cupón desconocido para {self.code}: {self.kind}")
+        self.value = int(raw.get("value") or 0)
+        self.max_discount = raw.get("max_discount")
+        self.min_subtotal = int(raw.get("min_subtotal") or 0)
+        self.categories = _keys(raw.get("categories"))
+        self.clubs = _keys(raw.get("clubs"))
+        self.valid_from = _epoch(raw.get("valid_from"))
+        self.valid_until = _epoch(raw.get("valid_until"))
+        self.max_uses = raw.get("max_uses")
+        self.used = int(raw.get("used") or 0)
+
+    def eligible(self, p: Product) -> bool:
+        if self.categories and normalize(p.category or "") not in self.categories:
+            return False
+        if self.clubs and normalize(p.club or "") not in self.clubs:
+            return False
+        return True
+
+class PricingRules:
+    """Reglas compiladas e inmutables: tarifas por ciudad y cupones por código."""
+
+    def __init__(self, raw: Dict[str, Any], version: int, source: str, uses: Dict[str, int]):
+        shipping = {normalize(city): {m: int(c) for m, c in methods.items()}
+                    for city, methods in raw.get("shipping", {}).items()}
+        self.default_shipping = shipping.pop("_default", None) or {"standard": 0}
+        if "standard" not in self.default_shipping:
+            raise ValueError("La tarifa _default de envío necesita el método standard")
+        self.shipping = shipping
+        self.coupons = {c.code: c for c in map(CompiledCoupon, (c for c in raw.get("coupons", [])
+                                                                if c.get("active", True)))}
+        self.version = version
+        self.source = source
+        self.loaded_at = time.time()
+        self._uses = uses
+
+    def shipping_cost(self, city: str, method: str) -> int:
+        table = self.shipping.get(normalize(city), self.default_shipping)
+        cost = table.get(method, table.get("standard"))
+        if cost is None:  # ciudad sin ese método ni standard: la tarifa por defecto
+            cost = self.default_shipping.get(method, self.default_shipping["standard"])
+        return cost
+
+    def coupon_state(self, code: Optional[str]) -> tuple:
+        """Lo que, además de `version`, cambia el resultado de apply_coupon para
+        `code`: si está en su ventana de vigencia y, con tope, los usos canjeados."""
+        c = self.coupons.get(code.upper()) if code else None
+        if c is None:
+            return ()
+        now = time.time()
+        live = (c.valid_from is None or now >= c.valid_from) and (c.valid_until is None or now <= c.valid_until)
+        return live, self._uses.get(c.code, 0) if c.max_uses is not None else None
+
+    def apply_coupon(self, code: Optional[str], lines: List[Tuple[Product, int]], subtotal: int,
+                     shipping: int, now: Optional[float] = None) -> Tuple[int, int, Optional[str], Optional[str]]:
+        """-> (descuento, envío, cupón aplicado, motivo si no aplicó)"""
+        if not code:
+            return 0, shipping, None, None
+        c = self.coupons.get(code.upper())
+        if not c:
+            return 0, shipping, None, None
+        now = time.time() if now is None else now
+        if c.valid_from is not None and now < c.valid_from:
+            return 0, shipping, None, f"El cupón {c.code} aún no está vigente."
+        if c.valid_until is not None and now > c.valid_until:
+            return 0, shipping, None, f"El cupón {c.code} venció."
+        if c.max_uses is not None and c.used + self._uses.get(c.code, 0) >= c.max_uses:
+            return 0, shipping, None, f"El cupón {c.code} se agotó."
+        if subtotal < c.min_subtotal:
+            return 0, shipping, None, f"El cupón {c.code} requiere un subtotal mínimo de {c.min_subtotal}."
+        base = subtotal
+        if c.categories or c.clubs:
+            base = sum(line for p, line in lines if c.eligible(p))
+            if not base:
+                return 0, shipping, None, f"El cupón {c.code} no aplica a los productos del carrito."
+        if c.kind == "percent":
+            discount = int(base * c.value / 100)
+            if c.max_discount is not None:
+                discount = min(discount, int(c.max_discount))
+            return discount, shipping, c.code, None
+        if c.kind == "amount":
+            return min(base, c.value), shipping, c.code, None
+        return 0, 0, c.code, None
+
+def default_raw() -> Dict[str, Any]:
+    return {"shipping": SHIPPING_TABLE,
+            "coupons": [{"code": code, **spec} for code, spec in COUPONS.items()]}
+
+def rows_to_raw(coupons: List[Dict[str, Any]], rates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Filas de las tablas `coupons` y `shipping_rates` (city, method, cost) de Supabase."""
+    shipping: Dict[str, Dict[str, int]] = {}
+    for r in rates:
+        shipping.setdefault(r["city"], {})[r["method"]] = r["cost"]
+    return {"shipping": shipping, "coupons": coupons}
+
+class RulesEngine:
+    """Mantiene las reglas vigentes y las reemplaza en caliente. Los usos de
+    cupones se cuentan aquí para que sobrevivan a cada recarga."""
+
+    def __init__(self, raw: Optional[Dict[str, Any]] = None, source: str = "config"):
+        self._lock = threading.Lock()
+        self.uses: Dict[str, int] = {}
+        self.swaps = 0
+        self.compile_ms = 0.0
+        self.current = PricingRules(raw or default_raw(), 1, source, self.uses)
+
+    def install(self, raw: Dict[str, Any], source: str) -> PricingRules:
+        t0 = time.perf_counter()
+        with self._lock:
+            rules = PricingRules(raw, self.current.version + 1, source, self.uses)
+            self.compile_ms = (time.perf_counter() - t0) * 1000
+            self.current = rules
+            self.swaps += 1
+        return rules
+
+    def redeem(self, code: Optional[str]):
+        """Cuenta un uso al aprobarse el pago. La cuenta vive en este proceso: con varios
+        workers `max_uses` se cumple por worker, sumada al `used` que trae la regla."""
+        if not code:
+            return
+        with self._lock:
+            self.uses[code.upper()] = self.uses.get(code.upper(), 0) + 1
+
+    def stats(self) -> dict:
+        r = self.current
+        return {"version": r.version, "source": r.source, "loaded_at": r.loaded_at,
+                "coupons": len(r.coupons), "cities": len(r.shipping),
+                "compile_ms": round(self.compile_ms, 3), "swaps": self.swaps, "uses": dict(self.uses)}
+
+class RulesFile(FileReloader):
+    thread_name = "pricing-rules-watch"
+
+    def __init__(self, engine: RulesEngine, path: str = PRICING_RULES_FILE,
+                 interval: float = PRICING_RULES_WATCH_INTERVAL):
+        self.engine = engine
+        super().__init__(path, interval)
+
+    def _build(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        self.engine.install(raw, f"file:{self.path}")
+
+async def load_supabase_rules(repo) -> Dict[str, Any]:
+    coupons, rates = await repo.coupons_list(), await repo.shipping_rates_list()
+    return rows_to_raw(coupons, rates)
+
+_default: Optional[PricingRules] = None
+
+def default_rules() -> PricingRules:
+    global _default
+    if _default is None:
+        _default = PricingRules(default_raw(), 0, "config", {})
+    return _default
+
+def rules_file_exists(path: str = PRICING_RULES_FILE) -> bool:
+    return os.path.exists(path)
@@ -0,0 +1,81 @@
+import os, threading, time
+from typing import Optional, Tuple
+
+def file_sig(path: str) -> Tuple[int, int, int]:
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def next_version(prev: int, at: float) -> int:
+    """Versión de catálogo en microsegundos de `at` (cuando se empezó a leer el
+    archivo), siempre creciente: otro worker o el mismo proceso tras reiniciar
+    no reparten los mismos números para contenidos distintos."""
+    return max(prev + 1, int(at * 1_000_000))
+
+class FileReloader:
+    """Recarga un archivo cuando cambia (inode/mtime/tamaño) desde un hilo de
+    sondeo. Las subclases implementan `_build()`, que arma el estado nuevo y lo
+    publica con un swap de referencia; si falla se conserva el último bueno."""
+
+    thread_name = "file-watch"
+
+    def __init__(self, path: str, interval: float):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._sig = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.reloads = 0
+        self.reload_errors = 0
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+        self.reload(force=True)
+
+    def _build(self):
+        raise NotImplementedError
+
+    def reload(self, force: bool = False) -> bool:
+        with self._lock:
+            sig = file_sig(self.path)
+            if not force and sig == self._sig:
+                return False
+            self._build()
+            self._sig = sig
+            self.reloads += 1
+            return True
+
+    def check(self) -> bool:
+        try:
+            return self.reload()
+        except Exception as e:  # archivo a medio escribir o inválido
+            self.reload_errors += 1
+            self.last_error = repr(e)
+            self.last_error_at = time.time()
+            return False
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        if self._thread or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name=self.thread_name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def reload_stats(self) -> dict:
+        return {
+            "path": self.path,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+            "watching": self._thread is not None,
+        }
@@ -1,37 +1,33 @@
-import json, hashlib
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 from .models import Product
-from .config import PRODUCTS_FILE
+from .catalog import Catalog
+from .checkout_local import LocalCheckoutStore
 
 class ProductsRepoJSON:
-    def __init__(self, path: str = PRODUCTS_FILE):
-        self.path = path
-        self._cache = None
-        self._etag = None
-        self._load()
+    remote = False  # catálogo y órdenes en este proceso (modo JSON o copia de CatalogSync)
 
-    def _load(self):
-        with open(self.path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        self._cache = [Product(**p) for p in data]
-        canon = json.dumps(data, ensure_ascii=False, sort_keys=True).encode()
-        self._etag = hashlib.md5(canon).hexdigest()
+    def __init__(self, catalog: Optional[Catalog] = None):
+        self.catalog = catalog or Catalog()
+        self.orders = LocalCheckoutStore(self.get)
 
     def etag(self) -> str:
-        return self._etag
+        return self.catalog.snapshot.etag
 
-    def list(self, q: Optional[str] = None, category: Optional[str] = None,
-             limit: int = 50, offset: int = 0) -> List[Product]:
-        items = self._cache
-        if category:
-            items = [p for p in items if (p.category or "").lower() == category.lower()]
-        if q:
-            ql = q.lower()
-            items = [p for p in items if ql in p.name.lower() or ql in (p.category or "").lower()]
-        return items[offset: offset + limit]
+    def search(self, q: Optional[str] = None, filters: Optional[Dict[str, List[str]]] = None,
+               min_price: Optional[int] = None, max_price: Optional[int] = None,
+               in_stock: bool = False, sort: Optional[str] = None,
+               limit: int = 50, offset: int = 0,
+               facets: Iterable[str] = (),
+               after: Optional[Tuple[str, str]] = None) -> Tuple[List[Product], int, Dict[str, Dict[str, int]]]:
+        return self.catalog.snapshot.index.search(q, filters, min_price, max_price, in_stock,
+                                                  sort, limit, offset, facets, after)
 
     def get(self, pid: str) -> Optional[Product]:
-        for p in self._cache:
-            if p.id == pid:
-                return p
-        return None
+        return self.catalog.snapshot.by_id.get(pid)
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, Product]:
+        by_id = self.catalog.snapshot.by_id
+        return {pid: by_id[pid] for pid in ids if pid in by_id}
+
+    def checkout_create(self, order: Dict, items: List[Dict], return_url: str) -> Dict:
+        return self.orders.checkout_create(order, items, return_url)
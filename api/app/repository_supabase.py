@@ -1,8 +1,91 @@
+import asyncio, random, time
 import httpx
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Iterable, Tuple
+from .models import Product
+from .reservations import OrderClosed, OutOfStock
+from .cache import FRESH, TTLCache, SingleFlight, read_through
+from .breaker import CircuitBreaker
+from .metrics import SUPABASE_CALLS
+from .config import (
+    SUPABASE_POOL_MAX, SUPABASE_POOL_KEEPALIVE, SUPABASE_KEEPALIVE_EXPIRY, SUPABASE_HTTP2,
+    SUPABASE_READ_TIMEOUT, SUPABASE_WRITE_TIMEOUT, SUPABASE_CONNECT_TIMEOUT, SUPABASE_RETRIES, SUPABASE_RETRY_BACKOFF,
+    SUPABASE_CACHE_SIZE, SUPABASE_CACHE_TTL, SUPABASE_CACHE_STALE, STOCK_HOLD_TTL, METRICS,
+    ORDER_CACHE_SIZE, ORDER_CACHE_TTL,
+)
 
-class SupabaseRepo:
-    def __init__(self, url: str, key: str):
+RETRY_STATUS = {429, 502, 503, 504}
+ARRAY_FACETS = {"tags", "sizes"}
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _client_options() -> Dict[str, Any]:
+    return {
+        "limits": httpx.Limits(max_connections=SUPABASE_POOL_MAX,
+                               max_keepalive_connections=SUPABASE_POOL_KEEPALIVE,
+                               keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY),
+        "timeout": httpx.Timeout(SUPABASE_READ_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT),
+        "http2": SUPABASE_HTTP2 and _http2_available(),
+    }
+
+def make_client(**kw) -> httpx.Client:
+    return httpx.Client(**{**_client_options(), **kw})
+
+def make_async_client(**kw) -> httpx.AsyncClient:
+    return httpx.AsyncClient(**{**_client_options(), **kw})
+
+def _backoff(attempt: int) -> float:
+    return SUPABASE_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+def _rows(r: httpx.Response) -> List[Dict[str, Any]]:
+    return r.json()
+
+def _first(r: httpx.Response) -> Optional[Dict[str, Any]]:
+    arr = r.json()
+    return arr[0] if arr else None
+
+def _one(r: httpx.Response) -> Dict[str, Any]:
+    return r.json()[0]
+
+def _nothing(r: httpx.Response) -> None:
+    return None
+
+def _product_map(r: httpx.Response) -> Dict[str, Product]:
+    return {row["id"]: Product(**row) for row in r.json()}
+
+def _json(r: httpx.Response) -> Any:
+    return r.json()
+
+def _rpc_error(e: httpx.HTTPStatusError, order_id: str = "") -> Optional[Exception]:
+    """insufficient_stock:<id> -> OutOfStock, order_closed:<estado> -> OrderClosed."""
+    try:
+        msg = e.response.json().get("message", "")
+    except ValueError:
+        return None
+    if msg.startswith("insufficient_stock:"):
+        return OutOfStock(msg.split(":", 1)[1])
+    if msg.startswith("order_closed:"):
+        return OrderClosed(order_id, msg.split(":", 1)[1])
+    return None
+
+def _quote(v: str) -> str:
+    return '"' + v.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def _in_list(values: Iterable[str]) -> str:
+    return f"in.({','.join(map(_quote, values))})"
+
+class _SupabaseBase:
+    """Métodos de PostgREST compartidos por la variante sync y async: cada
+    método arma la petición y delega en `_call`, que en `SupabaseRepo`
+    devuelve el resultado y en `AsyncSupabaseRepo` una corrutina."""
+
+    def __init__(self, url: str, key: str, client=None, breaker: Optional[CircuitBreaker] = None):
+        self.inflight = 0
+        self.breaker = breaker or CircuitBreaker()
         self.base = f"{url.rstrip('/')}/rest/v1"
         self.headers = {
             "apikey": key,
@@ -11,64 +94,133 @@ class SupabaseRepo:
             "Accept": "application/json",
             "Prefer": "return=representation"
         }
+        self._owns_client = client is None
+        self.client = client if client is not None else self._new_client()
+
+    def _new_client(self):
+        raise NotImplementedError
+
+    def _call(self, method: str, path: str, parse: Callable[[httpx.Response], Any],
+              params: Optional[Dict[str, Any]] = None, json: Any = None, timeout: Optional[float] = None,
+              prefer: Optional[str] = None):
+        raise NotImplementedError
+
+    def _started(self) -> float:
+        self.inflight += 1
+        return time.perf_counter()
+
+    def _finished(self, t0: float, method: str, path: str, r: Optional[httpx.Response]):
+        self.inflight -= 1
+        dt = time.perf_counter() - t0
+        if r is not None:
+            self.breaker.record(r.status_code < 500, dt)
+        if METRICS:
+            SUPABASE_CALLS.observe(dt, method, path, str(r.status_code) if r is not None else "error")
+
+    def _failed(self, t0: float):
+        self.breaker.record(False, time.perf_counter() - t0)
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Conexiones del pool de httpx (API interna de httpcore: best effort)."""
+        out = {"inflight": self.inflight, "max": SUPABASE_POOL_MAX}
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        conns = getattr(pool, "connections", None)
+        if conns is not None:
+            out["open"] = len(conns)
+            out["idle"] = sum(1 for c in conns if c.is_idle())
+            out["queued"] = sum(1 for rq in getattr(pool, "_requests", ()) if rq.is_queued())
+        return out
+
+    def _headers(self, prefer: Optional[str]) -> Dict[str, str]:
+        return self.headers if prefer is None else {**self.headers, "Prefer": prefer}
+
+    def _timeout(self, method: str, timeout: Optional[float]) -> httpx.Timeout:
+        if timeout is None:
+            timeout = SUPABASE_READ_TIMEOUT if method == "GET" else SUPABASE_WRITE_TIMEOUT
+        return httpx.Timeout(timeout, connect=min(timeout, SUPABASE_CONNECT_TIMEOUT))
+
+    def ping(self, timeout: Optional[float] = None):
+        """Consulta mínima para la sonda de salud; pasa por el breaker como cualquier otra."""
+        return self._call("GET", "/products", _nothing, params={"select": "id", "limit": 1}, timeout=timeout)
 
     # ===== PRODUCTS =====
-    def products_list(self, q: Optional[str], category: Optional[str], limit: int, offset: int) -> List[Dict[str, Any]]:
-        params = {"select":"*", "order":"name.asc", "limit":limit, "offset":offset}
+    def products_list(self, q: Optional[str], category: Optional[str], limit: int, offset: int,
+                      filters: Optional[Dict[str, List[str]]] = None,
+                      min_price: Optional[int] = None, max_price: Optional[int] = None,
+                      in_stock: bool = False, sort: Optional[str] = None,
+                      after: Optional[Tuple[str, str]] = None):
+        order = f"{sort.lstrip('-')}.{'desc' if sort.startswith('-') else 'asc'},id.asc" if sort else "name.asc,id.asc"
+        params = {"select":"*", "order":order, "limit":limit, "offset":offset}
         if category: params["category"] = f"eq.{category}"
-        if q: params["or"] = f"(name.ilike.*{q}*,category.ilike.*{q}*)"
-        with httpx.Client(timeout=10.0) as c:
-            r = c.get(f"{self.base}/products", headers=self.headers, params=params)
-            r.raise_for_status()
-            return r.json()
-
-    def product_get(self, pid: str) -> Optional[Dict[str, Any]]:
-        with httpx.Client(timeout=10.0) as c:
-            r = c.get(f"{self.base}/products", headers=self.headers, params={"select":"*","id":f"eq.{pid}"})
-            r.raise_for_status()
-            arr = r.json()
-            return arr[0] if arr else None
-
-    def product_create(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        with httpx.Client(timeout=10.0) as c:
-            r = c.post(f"{self.base}/products", headers=self.headers, json=payload)
-            r.raise_for_status()
-            return r.json()[0]
-
-    def product_update(self, pid: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-        with httpx.Client(timeout=10.0) as c:
-            r = c.patch(f"{self.base}/products", headers=self.headers, params={"id":f"eq.{pid}"}, json=payload)
-            r.raise_for_status()
-            return r.json()[0]
-
-    def product_delete(self, pid: str) -> None:
-        with httpx.Client(timeout=10.0) as c:
-            r = c.delete(f"{self.base}/products", headers=self.headers, params={"id":f"eq.{pid}"})
-            r.raise_for_status()
+        # valores entre comillas: comas, paréntesis o comillas del usuario no cambian el filtro
+        cond = [f"or(name.ilike.{_quote(f'*{q}*')},category.ilike.{_quote(f'*{q}*')})"] if q else []
+        if after is not None:
+            # keyset sobre (name, id): el costo no crece con la página como offset
+            name, pid = _quote(after[0]), _quote(after[1])
+            cond.append(f"or(name.gt.{name},and(name.eq.{name},id.gt.{pid}))")
+        for field, values in (filters or {}).items():
+            if not values:
+                continue
+            if field in ARRAY_FACETS:
+                params[field] = "ov.{" + ",".join(map(_quote, values)) + "}"
+            else:
+                params[field] = _in_list(values)
+        cond += [f"price.gte.{min_price}"] if min_price is not None else []
+        cond += [f"price.lte.{max_price}"] if max_price is not None else []
+        if cond: params["and"] = f"({','.join(cond)})"
+        if in_stock: params["stock"] = "gt.0"
+        return self._call("GET", "/products", _rows, params=params)
+
+    def product_get(self, pid: str):
+        return self._call("GET", "/products", _first, params={"select":"*","id":f"eq.{pid}"})
+
+    def get_many(self, ids: Iterable[str]):
+        return self._call("GET", "/products", _product_map,
+                          params={"select":"*", "id": _in_list(sorted(set(ids)))})
+
+    def product_create(self, payload: Dict[str, Any]):
+        return self._call("POST", "/products", _one, json=payload)
+
+    def product_update(self, pid: str, payload: Dict[str, Any]):
+        return self._call("PATCH", "/products", _one, params={"id":f"eq.{pid}"}, json=payload)
+
+    def product_delete(self, pid: str):
+        return self._call("DELETE", "/products", _nothing, params={"id":f"eq.{pid}"})
+
+    def products_upsert(self, rows: List[Dict[str, Any]], columns: Iterable[str]):
+        """Un solo POST por lote; las filas existentes (mismo id) se actualizan.
+        Solo se escriben `columns`: todas las filas deben traer esas mismas claves."""
+        return self._call("POST", "/products", _nothing,
+                          params={"on_conflict": "id", "columns": ",".join(columns)}, json=rows,
+                          prefer="resolution=merge-duplicates,return=minimal")
+
+    def rows_since(self, table: str, column: str, since: Optional[str], limit: int,
+                   after: Optional[Tuple[str, str]] = None):
+        """Filas de `table` con `column` >= `since`, en orden (column, id); `after`
+        es la última (valor, id) de la página anterior (sql/catalog_sync.sql)."""
+        params = {"select": "*", "order": f"{column}.asc,id.asc", "limit": limit}
+        if after is not None:
+            at, pid = _quote(after[0]), _quote(after[1])
+            params["or"] = f"({column}.gt.{at},and({column}.eq.{at},id.gt.{pid}))"
+        elif since is not None:
+            params[column] = f"gte.{since}"
+        return self._call("GET", f"/{table}", _rows, params=params)
+
+    # ===== PRICING RULES =====
+    def coupons_list(self):
+        return self._call("GET", "/coupons", _rows, params={"select": "*", "active": "is.true"})
+
+    def shipping_rates_list(self):
+        return self._call("GET", "/shipping_rates", _rows, params={"select": "city,method,cost"})
 
     # ===== ORDERS & PAYMENTS =====
-    def order_create(self, order: Dict[str, Any], items: List[Dict[str, Any]]) -> Dict[str, Any]:
-        with httpx.Client(timeout=10.0) as c:
-            ro = c.post(f"{self.base}/orders", headers=self.headers, json=order); ro.raise_for_status()
-            row = ro.json()[0]
-            for it in items:
-                it["order_id"] = row["id"]
-            ri = c.post(f"{self.base}/order_items", headers=self.headers, json=items); ri.raise_for_status()
-            return row
-
-    def payment_session_create(self, order_id: str, amount: int, return_url: str) -> Dict[str, Any]:
-        with httpx.Client(timeout=10.0) as c:
-            r = c.post(f"{self.base}/payment_sessions", headers=self.headers,
-                       json={"order_id": order_id, "amount": amount, "return_url": return_url})
-            r.raise_for_status()
-            return r.json()[0]
+    def payment_session_create(self, order_id: str, amount: int, return_url: str):
+        return self._call("POST", "/payment_sessions", _one,
+                          json={"order_id": order_id, "amount": amount, "return_url": return_url})
 
     def payment_session_update(self, session_id: str, status: str):
-        with httpx.Client(timeout=10.0) as c:
-            r = c.patch(f"{self.base}/payment_sessions",
-                        headers=self.headers, params={"id":f"eq.{session_id}"},
-                        json={"status": status})
-            r.raise_for_status()
+        return self._call("PATCH", "/payment_sessions", _nothing,
+                          params={"id":f"eq.{session_id}"}, json={"status": status})
 
     def order_update_status(self, order_id: str, status: str,
                             receipt_code: str | None = None,
@@ -78,26 +230,306 @@ class SupabaseRepo:
             payload["receipt_code"] = receipt_code
         if paid_at is not None:
             payload["paid_at"] = paid_at
+        return self._call("PATCH", "/orders", _nothing, params={"id": f"eq.{order_id}"}, json=payload)
+
+    def _checkout_payload(self, order, items, return_url):
+        return {"p_order": order, "p_items": items, "p_return_url": return_url,
+                "p_hold_seconds": int(STOCK_HOLD_TTL)}
+
+    # ===== STOCK HOLDS (sql/stock_holds.sql) =====
+    def stock_holds_reap(self):
+        return self._call("POST", "/rpc/stock_holds_reap", _json, json={})
+
+    def order_with_items(self, order_id: str):
+        return self._call("GET", "/orders", _first,
+                          params={"select": "*,order_items(*)", "id": f"eq.{order_id}"})
+
+    def orders_with_items(self, ids: Iterable[str]):
+        """Varias órdenes con sus ítems en una sola consulta id=in.(...)."""
+        return self._call("GET", "/orders", _rows,
+                          params={"select": "*,order_items(*)", "id": _in_list(sorted(set(ids)))})
+
+    def close(self):
+        raise NotImplementedError
+
+class SupabaseRepo(_SupabaseBase):
+    def _new_client(self) -> httpx.Client:
+        return make_client()
+
+    def _call(self, method, path, parse, params=None, json=None, timeout=None, prefer=None):
+        retries = SUPABASE_RETRIES if method == "GET" else 0
+        for attempt in range(retries + 1):
+            self.breaker.before()  # abierto: CircuitOpen sin esperar el timeout
+            try:
+                t0, r = self._started(), None
+                try:
+                    r = self.client.request(method, f"{self.base}{path}", headers=self._headers(prefer),
+                                            params=params, json=json, timeout=self._timeout(method, timeout))
+                except httpx.TransportError:
+                    self._failed(t0)
+                    raise
+                finally:
+                    self._finished(t0, method, path, r)
+                if r.status_code in RETRY_STATUS and attempt < retries:
+                    time.sleep(_backoff(attempt))
+                    continue
+                r.raise_for_status()
+                return parse(r)
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise
+                time.sleep(_backoff(attempt))
+
+    def order_create(self, order: Dict[str, Any], items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        row = self._call("POST", "/orders", _one, json=order)
+        for it in items:
+            it["order_id"] = row["id"]
+        self._call("POST", "/order_items", _nothing, json=items)
+        return row
+
+    def checkout_create(self, order: Dict[str, Any], items: List[Dict[str, Any]], return_url: str) -> Dict[str, Any]:
+        try:
+            return self._call("POST", "/rpc/checkout_create", _rows,
+                              json=self._checkout_payload(order, items, return_url))
+        except httpx.HTTPStatusError as e:
+            raise _rpc_error(e) or e
+
+    def stock_holds_commit(self, order_id: str) -> List[str]:
+        try:
+            return self._call("POST", "/rpc/stock_holds_commit", _json, json={"p_order_id": order_id})
+        except httpx.HTTPStatusError as e:
+            raise _rpc_error(e, order_id) or e
+
+    def stock_holds_release(self, order_id: str):
+        try:
+            return self._call("POST", "/rpc/stock_holds_release", _json, json={"p_order_id": order_id})
+        except httpx.HTTPStatusError as e:
+            raise _rpc_error(e, order_id) or e
+
+    def close(self):
+        if self._owns_client:
+            self.client.close()
+
+class AsyncSupabaseRepo(_SupabaseBase):
+    remote = True  # órdenes y CRUD en Supabase; los métodos devuelven corrutinas
+
+    def _new_client(self) -> httpx.AsyncClient:
+        return make_async_client()
+
+    async def _call(self, method, path, parse, params=None, json=None, timeout=None, prefer=None):
+        retries = SUPABASE_RETRIES if method == "GET" else 0
+        for attempt in range(retries + 1):
+            self.breaker.before()  # abierto: CircuitOpen sin esperar el timeout
+            try:
+                t0, r = self._started(), None
+                try:
+                    r = await self.client.request(method, f"{self.base}{path}", headers=self._headers(prefer),
+                                                  params=params, json=json, timeout=self._timeout(method, timeout))
+                except httpx.TransportError:
+                    self._failed(t0)
+                    raise
+                finally:
+                    self._finished(t0, method, path, r)
+                if r.status_code in RETRY_STATUS and attempt < retries:
+                    await asyncio.sleep(_backoff(attempt))
+                    continue
+                r.raise_for_status()
+                return parse(r)
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise
+                await asyncio.sleep(_backoff(attempt))
+
+    async def checkout_create(self, order: Dict[str, Any], items: List[Dict[str, Any]], return_url: str) -> Dict[str, Any]:
+        try:
+            return await self._call("POST", "/rpc/checkout_create", _rows,
+                                    json=self._checkout_payload(order, items, return_url))
+        except httpx.HTTPStatusError as e:
+            raise _rpc_error(e) or e
+
+    async def stock_holds_commit(self, order_id: str) -> List[str]:
+        try:
+            return await self._call("POST", "/rpc/stock_holds_commit", _json, json={"p_order_id": order_id})
+        except httpx.HTTPStatusError as e:
+            raise _rpc_error(e, order_id) or e
+
+    async def stock_holds_release(self, order_id: str):
+        try:
+            return await self._call("POST", "/rpc/stock_holds_release", _json, json={"p_order_id": order_id})
+        except httpx.HTTPStatusError as e:
+            raise _rpc_error(e, order_id) or e
+
+    async def products_pages(self, page_size: int):
+        """Todo el catálogo en páginas por cursor (name, id), sin pasar por cache."""
+        after = None
+        while True:
+            page = await AsyncSupabaseRepo.products_list(self, None, None, page_size, 0, after=after)
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            after = (page[-1]["name"], page[-1]["id"])
+
+    async def rows_since_pages(self, table: str, column: str, since: Optional[str], page_size: int):
+        """Todo lo cambiado desde `since`, en páginas por cursor (column, id)."""
+        after = None
+        while True:
+            page = await AsyncSupabaseRepo.rows_since(self, table, column, since, page_size, after)
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            after = (page[-1][column], page[-1]["id"])
+
+    async def close(self):
+        if self._owns_client:
+            await self.client.aclose()
+
+def _freeze(v: Any) -> Any:
+    if isinstance(v, dict):
+        return tuple(sorted((k, _freeze(x)) for k, x in v.items()))
+    if isinstance(v, (list, tuple)):
+        return tuple(_freeze(x) for x in v)
+    return v
+
+class CachedSupabaseRepo(AsyncSupabaseRepo):
+    """Lecturas de productos con cache TTL/LRU, stale-while-revalidate y
+    single-flight. Las escrituras de productos invalidan el cache. Las órdenes
+    usan un cache aparte, de TTL corto y sin stale: el polling del front y la
+    espera de ?wait= se resuelven con una consulta por orden cada ORDER_CACHE_TTL."""
+
+    def __init__(self, url: str, key: str, client=None, max_entries: int = SUPABASE_CACHE_SIZE,
+                 ttl: float = SUPABASE_CACHE_TTL, stale: float = SUPABASE_CACHE_STALE,
+                 breaker: Optional[CircuitBreaker] = None):
+        super().__init__(url, key, client, breaker)
+        self.lists = TTLCache(max_entries, ttl, stale)
+        self.rows = TTLCache(max_entries * 8, ttl, stale)
+        self.orders = TTLCache(ORDER_CACHE_SIZE, ORDER_CACHE_TTL)
+        self.flight = SingleFlight()
+
+    async def products_list(self, q, category, limit, offset, **kw):
+        key = ("list", q, category, limit, offset, _freeze(kw))
+        fetch = lambda: super(CachedSupabaseRepo, self).products_list(q, category, limit, offset, **kw)
+        return await read_through(self.lists, self.flight, key, fetch)
+
+    async def product_get(self, pid: str):
+        fetch = lambda: super(CachedSupabaseRepo, self).product_get(pid)
+        return await read_through(self.rows, self.flight, pid, fetch)
+
+    async def get_many(self, ids: Iterable[str]) -> Dict[str, Product]:
+        """Cotización y checkout: precio y stock solo de filas frescas; las que
+        están en la ventana stale se vuelven a pedir (a diferencia de product_get)."""
+        out, missing = {}, []
+        for pid in set(ids):
+            row, state = self.rows.get(pid)
+            if state != FRESH:
+                missing.append(pid)
+            elif row is not None:
+                out[pid] = Product(**row)
+        if missing:
+            missing.sort()
+            tokens = {pid: self.rows.token(pid) for pid in missing}
+
+            async def load():
+                rows = await self._call("GET", "/products", _rows,
+                                        params={"select": "*", "id": _in_list(missing)})
+                found = {row["id"]: row for row in rows}
+                for pid in missing:
+                    self.rows.set(pid, found.get(pid), tokens[pid])
+                return found
+
+            found = await self.flight.do(("many", tuple(missing)), load)
+            out.update({pid: Product(**row) for pid, row in found.items()})
+        return out
+
+    async def order_with_items(self, order_id: str):
+        fetch = lambda: super(CachedSupabaseRepo, self).order_with_items(order_id)
+        return await read_through(self.orders, self.flight, ("order", order_id), fetch)
+
+    async def orders_with_items(self, ids: Iterable[str]) -> List[Dict[str, Any]]:
+        out, missing = [], []
+        for oid in set(ids):
+            row, state = self.orders.get(("order", oid))
+            if state is None:
+                missing.append(oid)
+            elif row is not None:
+                out.append(row)
+        if missing:
+            missing.sort()
+            tokens = {oid: self.orders.token(("order", oid)) for oid in missing}
+
+            async def load():
+                rows = await super(CachedSupabaseRepo, self).orders_with_items(missing)
+                found = {row["id"]: row for row in rows}
+                for oid in missing:
+                    self.orders.set(("order", oid), found.get(oid), tokens[oid])
+                return rows
+
+            out.extend(await self.flight.do(("orders", tuple(missing)), load))
+        return out
+
+    async def order_update_status(self, order_id: str, status: str, receipt_code: Optional[str] = None,
+                                  paid_at: Optional[str] = None):
+        try:
+            return await super().order_update_status(order_id, status, receipt_code=receipt_code, paid_at=paid_at)
+        finally:
+            self.orders.invalidate(("order", order_id))
+
+    async def stock_holds_reap(self):
+        released = await super().stock_holds_reap()
+        if released:  # alguna orden pasó a expired
+            self.orders.invalidate()
+        return released
+
+    def invalidate(self, pid: Optional[str] = None):
+        self.lists.invalidate()
+        self.rows.invalidate(pid)
+
+    async def product_create(self, payload: Dict[str, Any]):
+        row = await super().product_create(payload)
+        self.invalidate(row.get("id"))
+        return row
+
+    async def product_update(self, pid: str, payload: Dict[str, Any]):
+        try:
+            return await super().product_update(pid, payload)
+        finally:
+            self.invalidate(pid)
+
+    async def product_delete(self, pid: str):
+        try:
+            await super().product_delete(pid)
+        finally:
+            self.invalidate(pid)
+
+    async def products_upsert(self, rows: List[Dict[str, Any]], columns: Iterable[str]):
+        try:
+            await super().products_upsert(rows, columns)
+        finally:
+            self.invalidate()
+
+    async def checkout_create(self, order: Dict[str, Any], items: List[Dict[str, Any]], return_url: str) -> Dict[str, Any]:
+        try:
+            return await super().checkout_create(order, items, return_url)
+        finally:
+            for it in items:  # la reserva cambió (o no alcanzó): releer esas filas
+                self.rows.invalidate(it["product_id"])
+
+    async def stock_holds_commit(self, order_id: str) -> List[str]:
+        try:
+            ids = await super().stock_holds_commit(order_id)
+        finally:
+            self.orders.invalidate(("order", order_id))  # la RPC ya la dejó en paid
+        for pid in ids:  # el stock bajó
+            self.rows.invalidate(pid)
+        return ids
+
+    async def stock_holds_release(self, order_id: str):
+        try:
+            return await super().stock_holds_release(order_id)
+        finally:
+            self.orders.invalidate(("order", order_id))
 
-        with httpx.Client(timeout=10.0) as c:
-            r = c.patch(
-                f"{self.base}/orders",
-                headers=self.headers,
-                params={"id": f"eq.{order_id}"},
-                json=payload
-            )
-            r.raise_for_status()
-    
-    def order_with_items(self, order_id: str) -> dict | None:
-        with httpx.Client(timeout=10.0) as c:
-            r = c.get(
-                f"{self.base}/orders",
-                headers=self.headers,
-                params={
-                    "select": "*,order_items(*)",
-                    "id": f"eq.{order_id}"
-                }
-            )
-            r.raise_for_status()
-            arr = r.json()
-            return arr[0] if arr else None
\ No newline at end of file
+    def cache_stats(self) -> dict:
+        return {"lists": self.lists.stats(), "rows": self.rows.stats(), "orders": self.orders.stats(),
+                "coalesced": self.flight.coalesced}
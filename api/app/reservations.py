@@ -0,0 +1,135 @@
+import threading, time
+from typing import Callable, Dict, List, Optional, Tuple
+from .config import STOCK_HOLD_TTL, STOCK_LOCK_STRIPES
+
+class OutOfStock(Exception):
+    def __init__(self, product_id: str):
+        super().__init__(f"Stock insuficiente para {product_id}")
+        self.product_id = product_id
+
+class OrderClosed(Exception):
+    """La orden ya no está pendiente: el pago (o el rechazo) ya se resolvió antes."""
+
+    def __init__(self, order_id: str, status: str):
+        super().__init__(f"La orden {order_id} ya está {status}")
+        self.order_id = order_id
+        self.status = status
+
+class ReservationStore:
+    """Reservas de stock en memoria con locks por franja (hash del producto).
+    Una reserva toma las franjas de sus productos en orden fijo, así dos
+    checkouts con los mismos productos nunca se bloquean mutuamente y los que
+    no comparten productos no compiten por el mismo lock.
+
+    `stock_of(pid)` da el stock total (None = no se controla); disponible es
+    stock - vendido - apartado."""
+
+    def __init__(self, stock_of: Callable[[str], Optional[int]], ttl: float = STOCK_HOLD_TTL,
+                 stripes: int = STOCK_LOCK_STRIPES):
+        self.stock_of = stock_of
+        self.ttl = ttl
+        self._stripes = [threading.Lock() for _ in range(max(1, stripes))]
+        self._holds_lock = threading.Lock()
+        self.sold: Dict[str, int] = {}
+        self.held: Dict[str, int] = {}
+        # orden -> (vence, {producto: cantidad})
+        self.holds: Dict[str, Tuple[float, Dict[str, int]]] = {}
+        self.expired = 0
+
+    def _locks(self, pids) -> List[threading.Lock]:
+        n = len(self._stripes)
+        return [self._stripes[i] for i in sorted({hash(pid) % n for pid in pids})]
+
+    def _acquire(self, pids) -> List[threading.Lock]:
+        locks = self._locks(pids)
+        for lock in locks:
+            lock.acquire()
+        return locks
+
+    @staticmethod
+    def _release_all(locks: List[threading.Lock]):
+        for lock in reversed(locks):
+            lock.release()
+
+    def available(self, pid: str) -> Optional[int]:
+        stock = self.stock_of(pid)
+        if stock is None:
+            return None
+        return stock - self.sold.get(pid, 0) - self.held.get(pid, 0)
+
+    def reserve(self, order_id: str, wanted: Dict[str, int], ttl: Optional[float] = None):
+        """Aparta todo o nada; OutOfStock con el primer producto que no alcanza."""
+        locks = self._acquire(wanted)
+        try:
+            for pid, qty in sorted(wanted.items()):
+                avail = self.available(pid)
+                if avail is not None and avail < qty:
+                    raise OutOfStock(pid)
+            for pid, qty in wanted.items():
+                self.held[pid] = self.held.get(pid, 0) + qty
+        finally:
+            self._release_all(locks)
+        with self._holds_lock:
+            self.holds[order_id] = (time.time() + (self.ttl if ttl is None else ttl), dict(wanted))
+
+    def _take(self, order_id: str) -> Optional[Dict[str, int]]:
+        with self._holds_lock:
+            item = self.holds.pop(order_id, None)
+        return item[1] if item else None
+
+    def _unhold(self, wanted: Dict[str, int], sell: bool):
+        locks = self._acquire(wanted)
+        try:
+            for pid, qty in wanted.items():
+                self.held[pid] -= qty
+                if sell:
+                    self.sold[pid] = self.sold.get(pid, 0) + qty
+        finally:
+            self._release_all(locks)
+
+    def commit(self, order_id: str, wanted: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """Convierte la reserva en venta. Sin reserva solo se vende `wanted`
+        (la orden venció y su reserva se liberó): se intenta tomar el stock de
+        nuevo, OutOfStock si ya no alcanza. Quien llama decide si la orden
+        venció; sin reserva ni `wanted` no se vende nada. -> lo vendido"""
+        held = self._take(order_id)
+        if held is not None:
+            self._unhold(held, sell=True)
+            return held
+        if not wanted:
+            return {}
+        locks = self._acquire(wanted)
+        try:
+            for pid, qty in sorted(wanted.items()):
+                avail = self.available(pid)
+                if avail is not None and avail < qty:
+                    raise OutOfStock(pid)
+            for pid, qty in wanted.items():
+                self.sold[pid] = self.sold.get(pid, 0) + qty
+        finally:
+            self._release_all(locks)
+        return wanted
+
+    def release(self, order_id: str) -> bool:
+        held = self._take(order_id)
+        if held is None:
+            return False
+        self._unhold(held, sell=False)
+        return True
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        """Órdenes con la reserva vencida (aún sin liberar)."""
+        now = time.time() if now is None else now
+        with self._holds_lock:
+            return [oid for oid, (expires, _) in self.holds.items() if expires <= now]
+
+    def reap(self, now: Optional[float] = None) -> List[str]:
+        """Libera las reservas vencidas; devuelve las órdenes afectadas."""
+        released = [oid for oid in self.due(now) if self.release(oid)]
+        self.expired += len(released)
+        return released
+
+    def stats(self) -> dict:
+        return {"holds": len(self.holds), "held_units": sum(self.held.values()),
+                "sold_units": sum(self.sold.values()), "expired": self.expired,
+                "ttl": self.ttl, "stripes": len(self._stripes)}
@@ -0,0 +1,109 @@
+import gzip, hashlib, json, threading, time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from fastapi import Response
+from .config import RESPONSE_CACHE_SIZE
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli se sirve gzip
+    brotli = None
+
+MIN_COMPRESS = 512
+
+def encode_json(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+class EncodedBody:
+    __slots__ = ("etag", "identity", "gzip", "br", "expires")
+
+    def __init__(self, body: bytes, ttl: Optional[float] = None):
+        self.etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        self.identity = body
+        big = len(body) >= MIN_COMPRESS
+        self.gzip = gzip.compress(body, 6) if big else None
+        self.br = brotli.compress(body, quality=5) if big and brotli else None
+        self.expires = time.monotonic() + ttl if ttl else None
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        return etag_matches(self.etag, if_none_match)
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """Compara ignorando W/ y el sufijo de encoding (-gz, -br) de la misma representación."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    base = etag.strip('"')
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/").strip('"')
+        if tag.split("-", 1)[0] == base:
+            return True
+    return False
+
+def _accepts(accept_encoding: Optional[str], coding: str) -> bool:
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            q = params.strip()
+            try:
+                return not (q.startswith("q=") and float(q[2:] or 0) == 0)
+            except ValueError:
+                return False
+    return False
+
+def respond(entry: EncodedBody, accept_encoding: Optional[str], if_none_match: Optional[str],
+            cache_control: str, media_type: str = "application/json") -> Response:
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": cache_control}
+    if entry.br is not None and _accepts(accept_encoding, "br"):
+        body, headers["Content-Encoding"], suffix = entry.br, "br", "-br"
+    elif entry.gzip is not None and _accepts(accept_encoding, "gzip"):
+        body, headers["Content-Encoding"], suffix = entry.gzip, "gzip", "-gz"
+    else:
+        body, suffix = entry.identity, ""
+    headers["ETag"] = entry.etag[:-1] + suffix + '"'
+    if entry.matches(if_none_match):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+class ResponseCache:
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, EncodedBody]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[EncodedBody]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry.expires is not None and entry.expires < time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, obj: Any, ttl: Optional[float] = None) -> EncodedBody:
+        entry = EncodedBody(encode_json(obj), ttl)
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"entries": len(self._data), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+                "brotli": brotli is not None}
@@ -1,27 +1,16 @@
-from typing import List, Tuple
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
 from .models import Product, QuoteIn, QuoteOut
-from .config import COUPONS, SHIPPING_TABLE
-
-def _shipping_cost(city: str, method: str) -> int:
-    city_key = city.lower()
-    table = SHIPPING_TABLE.get(city_key, SHIPPING_TABLE["_default"])
-    return table.get(method, table["standard"])
-
-def _apply_coupon(code: str | None, subtotal: int, shipping: int) -> Tuple[int, int, str | None]:
-    if not code: return 0, shipping, None
-    c = COUPONS.get(code.upper())
-    if not c: return 0, shipping, None
-    if c["type"] == "percent":
-        return int(subtotal * c["value"] / 100), shipping, code.upper()
-    if c["type"] == "amount":
-        return min(subtotal, int(c["value"])), shipping, code.upper()
-    if c["type"] == "shipping_free":
-        return 0, 0, code.upper()
-    return 0, shipping, None
-
-def make_quote(items_in: List[dict], products: List[Product], payload: QuoteIn) -> QuoteOut:
-    id_map = {p.id: p for p in products}
-    items_out, warnings = [], []
+from .pricing_rules import PricingRules, default_rules
+from .cache import TTLCache
+from .search import normalize
+from .metrics import timed
+from .config import QUOTE_CACHE_SIZE, QUOTE_CACHE_TTL
+
+@timed("pricing_quote")
+def make_quote(items_in: List[dict], id_map: Dict[str, Product], payload: QuoteIn,
+               rules: Optional[PricingRules] = None) -> QuoteOut:
+    rules = rules or default_rules()
+    items_out, warnings, lines = [], [], []
     subtotal = 0
 
     for it in items_in:
@@ -35,15 +24,69 @@ def make_quote(items_in: List[dict], products: List[Product], payload: QuoteIn)
             qty = max(0, prod.stock or 0)
         line = prod.price * qty
         subtotal += line
+        lines.append((prod, line))
         items_out.append({
             "id": prod.id, "name": prod.name, "unit_price": prod.price,
             "qty": qty, "line": line, "img": prod.img
         })
 
-    shipping = _shipping_cost(payload.delivery_city or "bogota", payload.delivery_method or "standard")
-    discount, shipping, applied = _apply_coupon(payload.coupon, subtotal, shipping)
+    shipping = rules.shipping_cost(payload.delivery_city or "bogota", payload.delivery_method or "standard")
+    discount, shipping, applied, reason = rules.apply_coupon(payload.coupon, lines, subtotal, shipping)
+    if reason:
+        warnings.append(reason)
     total = max(0, subtotal - discount + shipping)
     return QuoteOut(
         items=items_out, subtotal=subtotal, discount=discount,
         shipping=shipping, total=total, warnings=warnings, applied_coupon=applied
     )
+
+def make_quotes(payloads: Iterable[QuoteIn], id_map: Dict[str, Product],
+                rules: Optional[PricingRules] = None) -> Iterator[QuoteOut]:
+    """Cotiza muchos carritos contra un único id_map ya resuelto."""
+    rules = rules or default_rules()
+    for payload in payloads:
+        yield make_quote([{"id": i.id, "qty": i.qty} for i in payload.items], id_map, payload, rules)
+
+def normalized(payload: QuoteIn) -> QuoteIn:
+    """Forma canónica del carrito para la clave del cache: cupón en mayúsculas y
+    ciudad/método como los resuelven las reglas. Los renglones quedan tal cual
+    (orden y repetidos): cotizar esto da lo mismo que cotizar el payload, así que
+    /quote y /checkout/start coinciden y `items` sigue los renglones pedidos."""
+    return QuoteIn(items=payload.items,
+                   coupon=payload.coupon.upper() if payload.coupon else None,
+                   delivery_city=normalize(payload.delivery_city or "bogota"),
+                   delivery_method=payload.delivery_method or "standard")
+
+class QuoteCache:
+    """Cotizaciones ya calculadas (LRU) por carrito normalizado, versión del
+    catálogo y estado de las reglas. Cuando cambia alguna versión las claves
+    viejas ya no se piden y se vacía el cache."""
+
+    def __init__(self, max_entries: int = QUOTE_CACHE_SIZE, ttl: float = QUOTE_CACHE_TTL):
+        self.enabled = max_entries > 0
+        self.cache = TTLCache(max(1, max_entries), ttl)
+        self.versions: Optional[Tuple[int, int]] = None
+        self.bypassed = 0
+
+    def key(self, cart: QuoteIn, catalog_version: Optional[int], rules: PricingRules) -> Optional[Hashable]:
+        """None si no se puede memoizar (catálogo sin versión: SUPABASE directo)."""
+        if not self.enabled or catalog_version is None:
+            self.bypassed += 1
+            return None
+        if self.versions != (catalog_version, rules.version):
+            if self.versions is not None:
+                self.cache.invalidate()
+            self.versions = (catalog_version, rules.version)
+        return (catalog_version, rules.version, rules.coupon_state(cart.coupon), cart.coupon,
+                cart.delivery_city, cart.delivery_method, tuple((i.id, i.qty) for i in cart.items))
+
+    def get(self, key: Hashable) -> Optional[QuoteOut]:
+        return self.cache.get(key)[0]
+
+    def put(self, key: Hashable, quote: QuoteOut):
+        self.cache.set(key, quote)
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "enabled": self.enabled, "bypassed": self.bypassed,
+                "catalog_version": self.versions[0] if self.versions else None,
+                "rules_version": self.versions[1] if self.versions else None}
@@ -0,0 +1,117 @@
+import asyncio, json, logging, os, time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from .metrics import observe_stage
+from .config import STARTUP_WARMUP, STARTUP_WARMUP_TIMEOUT
+
+log = logging.getLogger(__name__)
+
+def process_age() -> Optional[float]:
+    """Segundos desde que arrancó el proceso (intérprete, uvicorn y todo lo demás).
+    Solo Linux (/proc), con resolución de un tick; None si no se puede saber."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            start = int(f.read().rpartition(")")[2].split()[19])  # campo 22: starttime
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+class Startup:
+    """Tiempos del arranque hasta que el worker acepta requests: lo que tardó el
+    intérprete (con uvicorn), importar la app y cada fase del lifespan. Cada
+    fase va también a stage_duration_seconds como `startup_<fase>`."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}  # ms, en el orden en que ocurrieron
+        self.warmed: List[Tuple[str, Optional[int]]] = []
+        self.ready_at: Optional[float] = None
+        self.ready_after_ms: Optional[float] = None
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = round(seconds * 1000, 3)
+        observe_stage(f"startup_{name}", seconds)
+
+    def imported(self, seconds: float):
+        age = process_age()
+        if age is not None:
+            self.record("interpreter", max(0.0, age - seconds))
+        self.record("imports", seconds)
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def ready(self):
+        self.ready_at = time.time()
+        age = process_age()
+        self.ready_after_ms = round(age * 1000, 3) if age is not None else None
+        log.info("listo para recibir requests en %s ms (%s)", self.ready_after_ms,
+                 ", ".join(f"{k} {v:.0f} ms" for k, v in self.phases.items()))
+
+    def stats(self) -> dict:
+        return {"ready": self.ready_at is not None, "ready_at": self.ready_at,
+                "ready_after_ms": self.ready_after_ms, "phases": self.phases,
+                "warmed": [{"path": p, "status": s} for p, s in self.warmed]}
+
+STARTUP = Startup()
+
+async def _call(app, method: str, path: str, body: bytes = b"") -> Tuple[int, bytes]:
+    """Un request en proceso por toda la pila ASGI (middlewares incluidos), sin socket."""
+    raw_path, _, query = path.partition("?")
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+             "scheme": "http", "path": raw_path, "raw_path": raw_path.encode(), "query_string": query.encode(),
+             "root_path": "", "client": ("warmup", 0), "server": ("warmup", 0),
+             "headers": [(b"host", b"warmup"), (b"content-type", b"application/json"),
+                         (b"content-length", str(len(body)).encode())]}
+    sent = False
+    status, chunks = None, []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # no hay desconexión: el request termina antes
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+async def _warm(app, paths: List[str]):
+    first: Optional[str] = None
+    for path in paths:
+        status, body = await _call(app, "GET", path)
+        STARTUP.warmed.append((path, status))
+        if first is None and status == 200 and body:
+            doc = json.loads(body)
+            items = doc.get("items") if isinstance(doc, dict) else None
+            first = items[0]["id"] if items else None
+    if first is not None:
+        # cotización de un producto: deja listos el motor de reglas y el modelo de QuoteIn/QuoteOut
+        cart = json.dumps({"items": [{"id": first, "qty": 1}]}).encode()
+        status, _ = await _call(app, "POST", "/v1/pricing/quote", cart)
+        STARTUP.warmed.append(("/v1/pricing/quote", status))
+
+async def warmup(app, paths: str = STARTUP_WARMUP, timeout: float = STARTUP_WARMUP_TIMEOUT):
+    """Antes de declarar el worker listo: pasa por los caminos calientes (índice o
+    snapshot, cache de respuestas ya comprimidas, srcset de las imágenes, conexiones a
+    Supabase, cotización) para que el primer request real no pague el arranque.
+    Un error o el tope de tiempo solo se registran: no detienen el arranque."""
+    todo = paths.split()
+    if not todo:
+        return
+    try:
+        await asyncio.wait_for(_warm(app, todo), timeout)
+    except Exception as e:
+        log.warning("warmup incompleto: %r", e)
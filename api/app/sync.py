@@ -0,0 +1,231 @@
+import asyncio, hashlib, json, logging, os, time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from starlette.concurrency import run_in_threadpool
+from .catalog import CatalogSnapshot, write_atomic
+from .models import Product
+from .repository import ProductsRepoJSON
+from .metrics import observe_stage
+from .config import (CATALOG_SNAPSHOT_FILE, CATALOG_SYNC_INTERVAL, CATALOG_SYNC_PAGE, CATALOG_SYNC_COLUMN,
+                     CATALOG_SYNC_DELETES, CATALOG_SYNC_OVERLAP, CATALOG_SYNC_PERSIST)
+
+log = logging.getLogger(__name__)
+
+Row = Dict[str, Any]
+
+def _ts(v: str) -> datetime:
+    return datetime.fromisoformat(v)
+
+def _back(mark: str, seconds: float) -> str:
+    return (_ts(mark) - timedelta(seconds=seconds)).isoformat(timespec="microseconds")
+
+def _latest(marks) -> Optional[str]:
+    marks = [m for m in marks if m]
+    return max(marks, key=_ts) if marks else None
+
+class SyncedCatalog:
+    """Lo que ProductsRepoJSON usa de Catalog: el snapshot vigente, que aquí
+    publica CatalogSync en vez de un archivo vigilado."""
+
+    def __init__(self, snap: CatalogSnapshot):
+        self._snap = snap
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        return self._snap
+
+class CatalogSync:
+    """Copia local del catálogo de Supabase puesta al día en forma incremental
+    (sql/catalog_sync.sql): cada ronda pide por páginas solo las filas con
+    `column` desde la última marca y las lápidas de `deletes`, y publica un
+    CatalogSnapshot nuevo si algún producto cambió. La versión solo crece y
+    con ella cambian las claves del cache de /v1/products y el `since` del
+    export. Misma interfaz que CatalogFallback: con el circuito abierto se
+    sigue sirviendo la última copia, y se guarda en disco para el reinicio."""
+
+    def __init__(self, path: str = CATALOG_SNAPSHOT_FILE, page_size: int = CATALOG_SYNC_PAGE,
+                 column: str = CATALOG_SYNC_COLUMN, deletes: str = CATALOG_SYNC_DELETES,
+                 overlap: float = CATALOG_SYNC_OVERLAP, persist: float = CATALOG_SYNC_PERSIST):
+        self.path = path
+        self.state_path = path + ".sync.json"
+        self.page_size = page_size
+        self.column = column
+        self.deletes = deletes
+        self.overlap = overlap
+        self.persist = persist
+        self.rows: Dict[str, Row] = {}
+        self.products: Dict[str, Product] = {}
+        self.mark: Optional[str] = None          # mayor `column` ya aplicado
+        self.deleted_mark: Optional[str] = None  # mayor deleted_at ya aplicado
+        self.version = 0
+        self.repo: Optional[ProductsRepoJSON] = None
+        self.rounds = self.full_syncs = self.applied = self.removed = self.errors = 0
+        self.sync_ms = 0.0
+        self.last_error: Optional[str] = None
+        self.last_sync_at: Optional[float] = None
+        self._dirty = False
+        self._saved_at = time.time()
+        self._lock = asyncio.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        if os.path.exists(path):
+            try:
+                self._load()
+            except Exception as e:  # copia corrupta: se reemplaza con una sincronización completa
+                self.last_error = repr(e)
+                self.rows, self.products, self.mark = {}, {}, None
+
+    # --- disco ---
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        state: Dict[str, Any] = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        self.rows = {r["id"]: r for r in rows}
+        self.products = {pid: Product(**r) for pid, r in self.rows.items()}
+        if state.get("column") == self.column:
+            # sin estado (p. ej. el snapshot de CatalogFallback) se sirve la copia y se resincroniza todo
+            self.mark, self.deleted_mark = state.get("mark"), state.get("deleted_mark")
+            self.version = state.get("version", 0) - 1
+        if self.rows:
+            self._publish()
+
+    def save(self):
+        """Filas primero y marca después: un corte entre ambos solo hace releer de más."""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        write_atomic(self.path, json.dumps(list(self.rows.values()), ensure_ascii=False).encode())
+        write_atomic(self.state_path, json.dumps({"column": self.column, "mark": self.mark,
+                                                  "deleted_mark": self.deleted_mark,
+                                                  "version": self.version}).encode())
+        self._dirty = False
+        self._saved_at = time.time()
+
+    # --- aplicar (threadpool) ---
+
+    def _publish(self):
+        t0 = time.perf_counter()
+        products = sorted(self.products.values(), key=lambda p: (p.name, p.id))
+        # microsegundos de la marca: dos workers al día con Supabase publican la misma versión
+        latest = _latest((self.mark, self.deleted_mark))
+        self.version = max(self.version + 1, int(_ts(latest).timestamp() * 1_000_000) if latest else 0)
+        etag = hashlib.md5(f"{self.mark}|{self.deleted_mark}|{len(products)}".encode()).hexdigest()
+        prev = self.repo.catalog.snapshot if self.repo else None
+        snap = CatalogSnapshot(self.version, etag, products, 0.0, prev)
+        snap.load_ms = (time.perf_counter() - t0) * 1000
+        if self.repo is None:
+            self.repo = ProductsRepoJSON(SyncedCatalog(snap))
+        else:
+            self.repo.catalog._snap = snap  # swap atómico, como en Catalog
+
+    def _apply(self, changed: List[Row], tombstones: List[Row], full: bool) -> int:
+        """Mezcla lo descargado y publica si cambió algún producto. -> productos tocados"""
+        touched, marks = 0, (self.mark, self.deleted_mark)
+        if full:
+            fresh = {r["id"] for r in changed}
+            for pid in [pid for pid in self.rows if pid not in fresh]:
+                del self.rows[pid]
+                self.products.pop(pid, None)
+                self.removed += 1
+                touched += 1
+        for row in changed:
+            pid = row["id"]
+            if self.rows.get(pid) == row:  # la ventana de overlap trae de nuevo lo ya aplicado
+                continue
+            self.rows[pid] = row
+            self._dirty = True
+            product = Product(**row)
+            if self.products.get(pid) != product:
+                self.products[pid] = product
+                touched += 1
+        for t in tombstones:
+            row = self.rows.get(t["id"])
+            # si se volvió a insertar después del borrado, la fila manda
+            if row is not None and _ts(row[self.column]) <= _ts(t["deleted_at"]):
+                del self.rows[t["id"]]
+                self.products.pop(t["id"], None)
+                self.removed += 1
+                touched += 1
+        self.mark = _latest([self.mark] + [r[self.column] for r in changed[-1:]])
+        self.deleted_mark = _latest([self.deleted_mark] + [t["deleted_at"] for t in tombstones[-1:]])
+        if full:
+            # las lápidas anteriores a la copia completa ya no tienen fila que borrar
+            self.deleted_mark = _latest((self.deleted_mark, self.mark))
+        self.applied += touched
+        self._dirty = self._dirty or touched > 0 or marks != (self.mark, self.deleted_mark)
+        if touched or self.repo is None:
+            self._publish()
+        return touched
+
+    # --- rondas ---
+
+    async def _pull(self, source, table: str, column: str, since: Optional[str]) -> List[Row]:
+        rows: List[Row] = []
+        async for page in source.rows_since_pages(table, column, since, self.page_size):
+            rows.extend(page)
+        return rows
+
+    async def refresh(self, source) -> bool:
+        """Una ronda contra `source` (AsyncSupabaseRepo). La primera (o sin marca
+        guardada) descarga todo; un error conserva la copia anterior."""
+        async with self._lock:
+            t0 = time.perf_counter()
+            full = self.mark is None
+            try:
+                since = None if full else _back(self.mark, self.overlap)
+                changed = await self._pull(source, "products", self.column, since)
+                if full and not changed:
+                    raise ValueError("Supabase devolvió un catálogo vacío")
+                if changed and self.column not in changed[0]:
+                    raise ValueError(f"products no tiene la columna {self.column} (aplicar sql/catalog_sync.sql)")
+                tombstones: List[Row] = []
+                if self.deletes and not full:
+                    tombstones = await self._pull(source, self.deletes, "deleted_at",
+                                                  _back(self.deleted_mark, self.overlap) if self.deleted_mark else None)
+                await run_in_threadpool(self._apply, changed, tombstones, full)
+                if time.time() - self._saved_at >= self.persist:
+                    await run_in_threadpool(self.save)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = repr(e)
+                log.warning("no se pudo sincronizar el catálogo: %r", e)
+                return False
+            self.rounds += 1
+            self.full_syncs += full
+            self.sync_ms = (time.perf_counter() - t0) * 1000
+            self.last_sync_at = time.time()
+            observe_stage("catalog_sync", self.sync_ms / 1000)
+            return True
+
+    def poke(self):
+        """Adelanta la próxima ronda (tras una escritura de productos en este worker)."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self, source, interval: float = CATALOG_SYNC_INTERVAL):
+        """Bucle de sincronización: cada `interval` segundos o al ser avisado;
+        con el circuito abierto no sale a la red y sigue sirviendo la copia."""
+        self._wake = asyncio.Event()
+        while True:
+            if not source.breaker.is_open:
+                await self.refresh(source)
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def stats(self) -> dict:
+        out = {"path": self.path, "available": self.repo is not None, "mode": "incremental",
+               "column": self.column, "mark": self.mark, "deleted_mark": self.deleted_mark,
+               "rounds": self.rounds, "full_syncs": self.full_syncs, "applied": self.applied,
+               "removed": self.removed, "sync_ms": round(self.sync_ms, 3), "last_sync_at": self.last_sync_at,
+               "errors": self.errors, "last_error": self.last_error}
+        if self.repo is not None:
+            snap = self.repo.catalog.snapshot
+            out.update(version=snap.version, products=len(snap.products),
+                       age_seconds=round(time.time() - snap.loaded_at, 3))
+        return out
@@ -0,0 +1,60 @@
+"""Suite de benchmarks.
+
+    cd api && python -m bench micro [--sizes 1000,10000,100000] [--formats objects,mmap]
+    cd api && python -m bench load [--modes JSON,SUPABASE] [--size 10000] [-c 32] [-d 5]
+    cd api && python -m bench all --out var/bench.json --baseline bench/baseline.json --threshold 0.25
+    cd api && python -m bench compare var/bench.json --baseline bench/baseline.json
+
+Sale con código 1 si alguna métrica empeora más que `--threshold` frente a la base.
+"""
+import argparse, os, platform, sys, time
+from . import compare as cmp
+
+def _meta(args) -> dict:
+    return {"created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "command": args.command,
+            "sizes": args.sizes, "load": {"modes": args.modes, "size": args.size,
+                                          "concurrency": args.concurrency, "duration": args.duration}}
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m bench")
+    ap.add_argument("command", choices=("micro", "load", "all", "compare"))
+    ap.add_argument("results", nargs="?", help="archivo de resultados (solo para compare)")
+    ap.add_argument("--sizes", default="1000,10000,100000", help="tamaños de catálogo para micro (1000000 para 1M)")
+    ap.add_argument("--formats", default="objects", help="formatos de catálogo para micro: objects,mmap")
+    ap.add_argument("--budget", type=float, default=0.25, help="segundos por micro-benchmark")
+    ap.add_argument("--modes", default="JSON,SUPABASE")
+    ap.add_argument("--size", type=int, default=10_000, help="tamaño del catálogo para load")
+    ap.add_argument("-c", "--concurrency", type=int, default=32)
+    ap.add_argument("-d", "--duration", type=float, default=5.0, help="segundos por endpoint")
+    ap.add_argument("--url", help="API ya levantada; no se arranca ninguna")
+    ap.add_argument("--out", help="guarda los resultados en JSON")
+    ap.add_argument("--baseline", help="resultados previos para comparar")
+    ap.add_argument("--threshold", type=float, default=0.25, help="empeoramiento relativo tolerado")
+    args = ap.parse_args(argv)
+
+    if args.command == "compare":
+        if not args.results or not args.baseline:
+            ap.error("compare necesita un archivo de resultados y --baseline")
+        results = cmp.load(args.results)["results"]
+    else:
+        results = {}
+        if args.command in ("micro", "all"):
+            from . import micro
+            results.update(micro.run([int(s) for s in args.sizes.split(",") if s], args.budget,
+                                     formats=[f for f in args.formats.split(",") if f]))
+        if args.command in ("load", "all"):
+            from . import load
+            results.update(load.run(tuple(m.strip().upper() for m in args.modes.split(",")), args.size,
+                                    args.concurrency, args.duration, args.url))
+        if args.out:
+            os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+            cmp.save(args.out, {"meta": _meta(args), "results": results})
+    if args.baseline and os.path.exists(args.baseline):
+        rows = cmp.compare(results, cmp.load(args.baseline)["results"], args.threshold)
+        return 1 if cmp.report(rows, args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
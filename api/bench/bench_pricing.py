@@ -0,0 +1,64 @@
+"""Microbenchmark del motor de reglas de precios.
+
+    cd api && PYTHONPATH=. python bench/bench_pricing.py [--coupons 5000] [--cities 2000]
+"""
+import argparse, time
+from app.models import Product, QuoteIn
+from app.pricing_rules import RulesEngine
+from app.services import make_quote
+
+def build_raw(n_coupons: int, n_cities: int) -> dict:
+    shipping = {f"Ciudad {i}": {"standard": 8000 + i, "express": 15000 + i} for i in range(n_cities)}
+    shipping["_default"] = {"standard": 12000, "express": 20000}
+    kinds = ("percent", "amount", "shipping_free")
+    coupons = []
+    for i in range(n_coupons):
+        c = {"code": f"PROMO{i}", "type": kinds[i % 3], "value": 10 if i % 3 == 0 else 5000}
+        if i % 4 == 1:
+            c["categories"] = ["camisetas"]
+        if i % 5 == 2:
+            c["clubs"] = ["Real Madrid", "Barcelona"]
+        if i % 7 == 3:
+            c["min_subtotal"] = 100000
+        if i % 11 == 4:
+            c["valid_until"] = "2099-01-01T00:00:00Z"
+        coupons.append(c)
+    return {"shipping": shipping, "coupons": coupons}
+
+def timeit(label: str, fn, n: int):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    us = (time.perf_counter() - t0) / n * 1e6
+    print(f"{label:<28} {us:9.2f} µs/op  ({n} ops)")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--coupons", type=int, default=5000)
+    ap.add_argument("--cities", type=int, default=2000)
+    ap.add_argument("-n", type=int, default=50000)
+    args = ap.parse_args()
+
+    engine = RulesEngine()
+    raw = build_raw(args.coupons, args.cities)
+    t0 = time.perf_counter()
+    rules = engine.install(raw, "bench")
+    print(f"compilación: {(time.perf_counter() - t0) * 1000:.1f} ms "
+          f"({len(rules.coupons)} cupones, {len(rules.shipping)} ciudades)")
+
+    p1 = Product(id="p1", name="Camiseta", price=250000, category="camisetas", club="Real Madrid", stock=10)
+    p2 = Product(id="p2", name="Balón", price=90000, category="balones", club="Barcelona", stock=10)
+    lines = [(p1, 500000), (p2, 90000)]
+    id_map = {"p1": p1, "p2": p2}
+    items = [{"id": "p1", "qty": 2}, {"id": "p2", "qty": 1}]
+    payload = QuoteIn(items=items, delivery_city="Ciudad 1500", delivery_method="express", coupon="PROMO2502")
+
+    timeit("shipping_cost", lambda: rules.shipping_cost("Ciudad 1500", "express"), args.n)
+    timeit("apply_coupon (percent)", lambda: rules.apply_coupon("PROMO3", lines, 590000, 15000), args.n)
+    timeit("apply_coupon (club)", lambda: rules.apply_coupon("PROMO2502", lines, 590000, 15000), args.n)
+    timeit("apply_coupon (no existe)", lambda: rules.apply_coupon("NOPE", lines, 590000, 15000), args.n)
+    timeit("make_quote", lambda: make_quote(items, id_map, payload, rules), args.n // 5)
+
+if __name__ == "__main__":
+    main()
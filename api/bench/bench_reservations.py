@@ -0,0 +1,126 @@
+"""Prueba de contención de reservas de stock: miles de checkouts concurrentes
+sobre pocos productos con stock limitado; verifica que nunca se vende de más.
+
+    cd api && PYTHONPATH=. python bench/bench_reservations.py [--checkouts 5000] [--threads 64]
+    # contra el stub de PostgREST (o Supabase con sql/stock_holds.sql aplicado):
+    cd api && PYTHONPATH=. python bench/bench_reservations.py --supabase http://localhost:54321
+"""
+import argparse, asyncio, random, threading, time
+from collections import Counter
+from app.models import Product
+from app.checkout_local import LocalCheckoutStore
+from app.reservations import OutOfStock
+
+def make_catalog(n_products: int, stock: int):
+    return {f"p{i}": Product(id=f"p{i}", name=f"P{i}", price=1000, stock=stock) for i in range(n_products)}
+
+def random_cart(rng: random.Random, ids):
+    picked = rng.sample(ids, rng.randint(1, min(3, len(ids))))
+    return [{"product_id": pid, "name": pid, "unit_price": 1000, "qty": rng.randint(1, 3), "line": 0}
+            for pid in picked]
+
+def order_for(items):
+    return {"subtotal": 0, "discount": 0, "shipping": 0, "total": 0}
+
+def run_local(args):
+    catalog = make_catalog(args.products, args.stock)
+    store = LocalCheckoutStore(catalog.get)
+    ids = sorted(catalog)
+    ok, rejected, paid = Counter(), Counter(), Counter()
+    per_thread = args.checkouts // args.threads
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        for _ in range(per_thread):
+            items = random_cart(rng, ids)
+            try:
+                created = store.checkout_create(order_for(items), items, "")
+            except OutOfStock:
+                rejected[seed] += 1
+                continue
+            ok[seed] += 1
+            oid = created["order"]["id"]
+            if rng.random() < args.pay_ratio:
+                store.stock_holds_commit(oid)
+                store.order_update_status(oid, "paid")
+                paid[seed] += 1
+            elif rng.random() < 0.5:
+                store.stock_holds_release(oid)
+                store.order_update_status(oid, "rejected")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    dt = time.perf_counter() - t0
+    store.stock.reap(now=time.time() + store.stock.ttl + 1)  # vence todo lo pendiente
+
+    total = per_thread * args.threads
+    print(f"JSON: {total} checkouts en {dt:.2f}s ({total / dt:.0f}/s), {args.threads} hilos, "
+          f"{len(store.stock._stripes)} franjas")
+    print(f"  aceptados={sum(ok.values())} sin stock={sum(rejected.values())} pagados={sum(paid.values())}")
+    oversold = {pid: store.stock.sold.get(pid, 0) for pid in ids if store.stock.sold.get(pid, 0) > args.stock}
+    leaked = {pid: n for pid, n in store.stock.held.items() if n}
+    print(f"  vendido por producto: {dict(sorted(store.stock.sold.items()))}")
+    assert not oversold, f"sobreventa: {oversold}"
+    assert not leaked, f"reservas sin liberar: {leaked}"
+    print("  OK: sin sobreventa, reservas liberadas")
+
+async def run_supabase(args):
+    from app.repository_supabase import AsyncSupabaseRepo
+    repo = AsyncSupabaseRepo(args.supabase, args.key)
+    for i in range(args.products):
+        await repo.product_create({"id": f"bench-{i}", "name": f"Bench {i}", "price": 1000,
+                                   "stock": args.stock, "reserved": 0})
+    ids = [f"bench-{i}" for i in range(args.products)]
+    rng = random.Random(1)
+    sem = asyncio.Semaphore(args.threads)
+    accepted = rejected = 0
+
+    async def one():
+        nonlocal accepted, rejected
+        items = random_cart(rng, ids)
+        async with sem:
+            try:
+                created = await repo.checkout_create(order_for(items), items, "")
+            except OutOfStock:
+                rejected += 1
+                return
+            accepted += 1
+            if rng.random() < args.pay_ratio:
+                await repo.stock_holds_commit(created["order"]["id"])
+            else:
+                await repo.stock_holds_release(created["order"]["id"])
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.checkouts)))
+    dt = time.perf_counter() - t0
+    rows = await repo.get_many(ids)
+    print(f"SUPABASE: {args.checkouts} checkouts en {dt:.2f}s ({args.checkouts / dt:.0f}/s), "
+          f"concurrencia {args.threads}; aceptados={accepted} sin stock={rejected}")
+    print(f"  stock final: {{{', '.join(f'{p}: {rows[p].stock}' for p in ids)}}}")
+    assert all(rows[p].stock >= 0 for p in ids), "sobreventa"
+    print("  OK: sin sobreventa")
+    for pid in ids:
+        await repo.product_delete(pid)
+    await repo.close()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--checkouts", type=int, default=5000)
+    ap.add_argument("--threads", type=int, default=64)
+    ap.add_argument("--products", type=int, default=5)
+    ap.add_argument("--stock", type=int, default=200)
+    ap.add_argument("--pay-ratio", type=float, default=0.7)
+    ap.add_argument("--supabase", help="URL de Supabase o del stub de PostgREST")
+    ap.add_argument("--key", default="stub")
+    args = ap.parse_args()
+    if args.supabase:
+        asyncio.run(run_supabase(args))
+    else:
+        run_local(args)
+
+if __name__ == "__main__":
+    main()
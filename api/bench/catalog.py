@@ -0,0 +1,61 @@
+"""Catálogos sintéticos con la forma de data/products.json (1k a 1M productos).
+
+    cd api && python -m bench.catalog 100000 > /tmp/catalog-100k.json
+"""
+import json, os, random, sys
+from typing import Any, Dict, List
+
+SEED_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "products.json")
+CATEGORIES = ("Ropa", "Balones", "Calzado", "Accesorios", "Entrenamiento")
+STYLES = ("Home", "Away", "Third", "Portero", "Entreno")
+COLORS = ("Blanco", "Azul", "Rojo", "Negro", "Amarillo", "Verde", "Celeste", "Azulgrana")
+SEASONS = ("22/23", "23/24", "24/25", "25/26")
+TAGS = ("nuevo", "top", "más-vendido", "edición-limitada", "oferta", "retro")
+SIZES = (["S", "M", "L", "XL"], ["XS", "S", "M"], ["38", "39", "40", "41", "42"], ["5"], [])
+
+def _seed() -> List[Dict[str, Any]]:
+    with open(SEED_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def generate(n: int, seed: int = 42, stock_max: int = 60) -> List[Dict[str, Any]]:
+    """`n` productos deterministas para `seed`. Clubes, ligas y nombres salen del
+    catálogo real con variantes, así la distribución de tokens y facetas se parece
+    a la de producción (muchos productos por club, pocas ligas)."""
+    rng = random.Random(seed)
+    base = _seed()
+    clubs = sorted({(p["club"], p["league"]) for p in base})
+    n_clubs = max(len(clubs), min(2000, n // 50))
+    out = []
+    for i in range(n):
+        k = rng.randrange(n_clubs)
+        club, league = clubs[k % len(clubs)]
+        if k >= len(clubs):
+            club = f"{club} {k}"
+        style, season = rng.choice(STYLES), rng.choice(SEASONS)
+        category = rng.choice(CATEGORIES)
+        sku = f"SYN-{i:07d}"
+        out.append({
+            "id": f"syn-{i:07d}",
+            "name": f"{club} {'Camiseta' if category == 'Ropa' else category} {style} {season}",
+            "price": rng.randrange(29_000, 900_000, 1000),
+            "img": f"/img/syn-{i % 97}.webp",
+            "category": category,
+            "club": club,
+            "league": league,
+            "season": season,
+            "variant": {"style": style, "color": rng.choice(COLORS)},
+            "sizes": list(rng.choice(SIZES)),
+            "stock": rng.randint(0, stock_max) if stock_max else None,
+            "tags": rng.sample(TAGS, rng.randint(0, 2)),
+            "rating": round(rng.uniform(3.0, 5.0), 1),
+            "sku": sku,
+        })
+    return out
+
+def write(path: str, n: int, seed: int = 42, stock_max: int = 60) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(generate(n, seed, stock_max), f, ensure_ascii=False)
+    return path
+
+if __name__ == "__main__":
+    json.dump(generate(int(sys.argv[1]) if len(sys.argv) > 1 else 1000), sys.stdout, ensure_ascii=False)
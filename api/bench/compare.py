@@ -0,0 +1,40 @@
+"""Compara resultados contra una línea base guardada y marca regresiones."""
+import json
+from typing import Dict, List, Tuple
+
+def load(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save(path: str, doc: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict],
+            threshold: float) -> List[Tuple[str, float, float, float, bool]]:
+    """-> [(nombre, base, actual, cambio relativo, regresión)]. El cambio es
+    positivo cuando empeora, sea la métrica de "menor es mejor" o al revés.
+    Las tasas de error se comparan en absoluto: una base de 0 no admite
+    divisiones, y cualquier error nuevo por encima del umbral cuenta."""
+    rows = []
+    for name, cur in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        b, c = base["value"], cur["value"]
+        if cur.get("unit") == "ratio":
+            change = c - b
+        elif b == 0:
+            continue
+        else:
+            change = (c - b) / b if cur.get("better", "lower") == "lower" else (b - c) / b
+        rows.append((name, b, c, change, change > threshold))
+    return rows
+
+def report(rows, threshold: float, log=print) -> int:
+    regressions = [r for r in rows if r[4]]
+    for name, b, c, change, bad in rows:
+        log(f"{'REGRESIÓN' if bad else 'ok':<10} {name:<44} {b:>12.3f} → {c:>12.3f}  {change:+.1%}")
+    log(f"{len(rows)} métricas comparadas, {len(regressions)} regresiones (umbral {threshold:.0%})")
+    return len(regressions)
@@ -0,0 +1,150 @@
+"""Carga de punta a punta con httpx contra uvicorn: /v1/products,
+/v1/pricing/quote y /v1/checkout/start. Levanta la API (y el stub de PostgREST
+en modo SUPABASE) sobre un catálogo sintético, o apunta a `--url`."""
+import asyncio, json, os, random, socket, subprocess, sys, tempfile, time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+import httpx
+from . import catalog as synth
+from .timing import percentiles
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"el proceso terminó con código {proc.returncode} antes de responder en {url}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {timeout:.0f}s")
+
+def _spawn(module: str, port: int, env: Dict[str, str], ready_path: str) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env={**os.environ, "PYTHONPATH": ROOT, **env},
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        _wait_ready(f"http://127.0.0.1:{port}{ready_path}", proc)
+    except Exception:
+        proc.kill()
+        raise RuntimeError(proc.stderr.read().decode(errors="replace")[-2000:])
+    return proc
+
+@contextmanager
+def serve(mode: str, products_file: str):
+    """API local en `mode` (JSON | SUPABASE) sobre `products_file`; devuelve la URL base."""
+    procs: List[subprocess.Popen] = []
+    env = {"DATA_MODE": mode, "PRODUCTS_FILE": products_file, "CATALOG_WATCH_INTERVAL": "0",
+           "PRICING_RULES_WATCH_INTERVAL": "0",
+           "CHECKOUT_RATE": "0", "QUOTE_RATE": "0"}  # un solo cliente: sin rate limit por IP
+    try:
+        if mode == "SUPABASE":
+            stub_port = _free_port()
+            procs.append(_spawn("stubs.postgrest:app", stub_port,
+                                {"STUB_SEED_FILE": products_file}, "/products?limit=1"))
+            env.update(SUPABASE_URL=f"http://127.0.0.1:{stub_port}", SUPABASE_SERVICE_ROLE="bench",
+                       SUPABASE_HTTP2="0")
+        port = _free_port()
+        procs.append(_spawn("app.main:app", port, env, "/health"))
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            try:
+                p.wait(5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+Request = Callable[[random.Random], Tuple[str, str, Optional[dict], Dict[str, str]]]
+
+def scenarios(ids: List[str]) -> Dict[str, Request]:
+    queries = ("camiseta", "balon", "real", "home", "nike", "")
+    sorts = ("", "&sort=price", "&sort=-price", "&sort=name")
+
+    def products(rng):
+        q = rng.choice(queries)
+        params = f"?limit=24&q={q}{rng.choice(sorts)}" if q else f"?limit=24&offset={rng.randrange(0, 500)}"
+        return "GET", "/v1/products" + params, None, {}
+
+    def cart(rng):
+        return {"items": [{"id": pid, "qty": rng.randint(1, 3)} for pid in rng.sample(ids, rng.randint(1, 5))],
+                "coupon": rng.choice((None, "HOLA10")), "delivery_city": "bogota",
+                "delivery_method": rng.choice(("standard", "express"))}
+
+    def quote(rng):
+        return "POST", "/v1/pricing/quote", cart(rng), {}
+
+    def checkout(rng):
+        return "POST", "/v1/checkout/start", cart(rng), {}
+
+    return {"products": products, "quote": quote, "checkout": checkout}
+
+async def drive(base: str, make: Request, concurrency: int, duration: float, seed: int = 1) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30.0) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker(n: int):
+            nonlocal errors
+            rng = random.Random(seed * 1000 + n)
+            while time.perf_counter() < deadline:
+                method, path, body, headers = make(rng)
+                t0 = time.perf_counter()
+                try:
+                    r = await client.request(method, path, json=body, headers=headers)
+                    ok = r.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append((time.perf_counter() - t0) * 1000)
+                errors += not ok
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+    pct = percentiles(latencies)
+    return {"requests": len(latencies), "rps": len(latencies) / elapsed,
+            "error_rate": errors / len(latencies) if latencies else 0.0, **pct}
+
+def _result(value: float, unit: str, better: str = "lower") -> dict:
+    return {"value": round(value, 3), "unit": unit, "better": better}
+
+def run(modes=("JSON",), size: int = 10_000, concurrency: int = 32, duration: float = 5.0,
+        url: Optional[str] = None, log=print) -> Dict[str, dict]:
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "products.json")
+    synth.write(path, size, stock_max=0)  # sin control de stock: el checkout no se agota durante la carga
+    with open(path, "r", encoding="utf-8") as f:
+        ids = [p["id"] for p in json.load(f)]
+    out: Dict[str, dict] = {}
+    targets = [("url", None)] if url else [(m.lower(), m) for m in modes]
+    for label, mode in targets:
+        log(f"load: {label} · {size} productos · c={concurrency} · {duration:.0f}s por endpoint")
+        ctx = serve(mode, path) if mode else None
+        base = ctx.__enter__() if ctx else url.rstrip("/")
+        try:
+            for name, make in scenarios(ids).items():
+                asyncio.run(drive(base, make, concurrency, min(1.0, duration)))  # calentamiento
+                r = asyncio.run(drive(base, make, concurrency, duration))
+                key = f"load.{name}[{label}]"
+                out[f"{key}.rps"] = _result(r["rps"], "req/s", "higher")
+                out[f"{key}.p50"] = _result(r["p50"], "ms")
+                out[f"{key}.p99"] = _result(r["p99"], "ms")
+                out[f"{key}.error_rate"] = _result(r["error_rate"], "ratio")
+                log(f"  {key:<28} {r['rps']:>9.1f} req/s  p50 {r['p50']:.2f} ms  p95 {r['p95']:.2f} ms"
+                    f"  p99 {r['p99']:.2f} ms  errores {r['error_rate']:.2%}")
+        finally:
+            if ctx:
+                ctx.__exit__(None, None, None)
+    os.unlink(path)
+    return out
@@ -0,0 +1,85 @@
+"""Micro-benchmarks de los caminos calientes, en proceso y sin red:
+búsqueda del repositorio JSON, cotización y serialización de respuestas."""
+import json, os, random, tempfile
+from typing import Dict, Iterable
+from app.catalog import Catalog
+from app.models import QuoteIn
+from app.pricing_rules import RulesEngine
+from app.repository import ProductsRepoJSON
+from app.response_cache import EncodedBody, encode_json
+from app.services import make_quote, make_quotes
+from . import catalog as synth
+from .timing import once, per_op
+
+def _result(value: float, unit: str, better: str = "lower") -> dict:
+    return {"value": round(value, 3), "unit": unit, "better": better}
+
+def run_size(n: int, budget: float = 0.25, log=print, fmt: str = "objects") -> Dict[str, dict]:
+    out: Dict[str, dict] = {}
+    tag = f"{n // 1000}k" if n < 1_000_000 else f"{n // 1_000_000}M"
+    if fmt != "objects":
+        tag += f",{fmt}"
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "products.json")
+    synth.write(path, n)
+
+    holder = {}
+    out[f"catalog.load[{tag}]"] = _result(once(lambda: holder.update(c=Catalog(path, interval=0, format=fmt))), "ms")
+    if fmt == "mmap":  # la primera carga construye el .fscat; un worker nuevo solo lo mapea
+        out[f"catalog.open[{tag}]"] = _result(once(lambda: holder.update(c=Catalog(path, interval=0, format=fmt))), "ms")
+    repo = ProductsRepoJSON(holder["c"])
+    products = repo.catalog.snapshot.products
+    rng = random.Random(7)
+    sample = products[len(products) // 2]
+    club = sample.club
+
+    cases = {
+        "search.all": dict(),
+        "search.q_prefix": dict(q="cam"),
+        "search.q_two_tokens": dict(q=f"{club.split()[0]} home"),
+        "search.club_in_stock_price": dict(filters={"club": [club]}, in_stock=True, sort="price"),
+        "search.facets": dict(facets=("club", "league", "tags", "sizes")),
+        "search.q_facets": dict(q="camiseta", filters={"league": [sample.league]},
+                                facets=("club", "league", "tags")),
+        "search.deep_offset": dict(sort="name", offset=min(5000, n // 2)),
+        "search.cursor": dict(after=(sample.name, sample.id)),
+    }
+    for name, kw in cases.items():
+        out[f"{name}[{tag}]"] = _result(per_op(lambda: repo.search(**kw), budget), "us/op")
+    out[f"get_many.20[{tag}]"] = _result(
+        per_op(lambda ids=[p.id for p in rng.sample(products, 20)]: repo.get_many(ids), budget), "us/op")
+
+    rules = RulesEngine().current
+    picked = rng.sample(products, 5)
+    id_map = {p.id: p for p in picked}
+    payload = QuoteIn(items=[{"id": p.id, "qty": 1 + i % 3} for i, p in enumerate(picked)],
+                      coupon="HOLA10", delivery_city="Medellín", delivery_method="express")
+    items = [i.model_dump() for i in payload.items]
+    out[f"quote.make_quote[{tag}]"] = _result(per_op(lambda: make_quote(items, id_map, payload, rules), budget), "us/op")
+    batch = [payload] * 100
+    out[f"quote.batch_100[{tag}]"] = _result(
+        per_op(lambda: list(make_quotes(batch, id_map, rules)), budget), "us/op")
+
+    page, _, facets = repo.search(limit=50, facets=("club", "league"))
+    body = {"items": [p.model_dump() for p in page], "count": len(page), "total": n, "facets": facets}
+    out[f"serialize.page_dump[{tag}]"] = _result(per_op(lambda: [p.model_dump() for p in page], budget), "us/op")
+    out[f"serialize.page_json[{tag}]"] = _result(per_op(lambda: encode_json(body), budget), "us/op")
+    raw = encode_json(body)
+    out[f"serialize.encoded_body[{tag}]"] = _result(per_op(lambda: EncodedBody(raw), budget), "us/op")
+    out[f"serialize.export_1k[{tag}]"] = _result(
+        per_op(lambda: [p.model_dump_json() for p in products[:1000]], budget), "us/op")
+
+    for k, v in out.items():
+        if k.endswith(f"[{tag}]"):
+            log(f"  {k:<40} {v['value']:>12.3f} {v['unit']}")
+    for f in os.listdir(os.path.dirname(path)):
+        os.unlink(os.path.join(os.path.dirname(path), f))
+    return out
+
+def run(sizes: Iterable[int], budget: float = 0.25, log=print,
+        formats: Iterable[str] = ("objects",)) -> Dict[str, dict]:
+    out: Dict[str, dict] = {}
+    for fmt in formats:
+        for n in sizes:
+            log(f"micro: catálogo de {n} productos ({fmt})")
+            out.update(run_size(n, budget, log, fmt))
+    return out
@@ -0,0 +1,38 @@
+import statistics, time
+from typing import Callable, Dict, List
+
+def per_op(fn: Callable[[], object], budget: float = 0.25, rounds: int = 5) -> float:
+    """Microsegundos por operación: mejor de `rounds` rondas de ~budget/rounds s
+    (la mejor ronda es la menos afectada por ruido del sistema)."""
+    target = budget / rounds
+    fn()
+    n = 1
+    while True:  # calibrar cuántas llamadas entran en una ronda
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        dt = time.perf_counter() - t0
+        if dt >= target / 4 or n >= 1 << 20:
+            break
+        n *= 2
+    n = max(1, int(n * target / max(dt, 1e-9)))
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / n)
+    return best * 1e6
+
+def once(fn: Callable[[], object]) -> float:
+    """Milisegundos de una sola ejecución (para cargas/builds)."""
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))]
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "mean": statistics.fmean(s)}
@@ -0,0 +1,56 @@
+-- Feed de cambios del catálogo para la sincronización incremental (CATALOG_SYNC=1).
+-- La API pide solo las filas con updated_at posterior a su marca y los ids
+-- borrados desde entonces:
+--   GET /rest/v1/products?updated_at=gte.<marca>&order=updated_at.asc,id.asc&limit=1000
+--   GET /rest/v1/products_deleted?deleted_at=gte.<marca>&order=deleted_at.asc,id.asc&limit=1000
+-- now() es la hora de inicio de la transacción: una transacción larga puede
+-- confirmar filas con updated_at anterior a la marca ya leída. Por eso la API
+-- vuelve a pedir una ventana de CATALOG_SYNC_OVERLAP segundos hacia atrás.
+
+alter table products add column if not exists updated_at timestamptz not null default now();
+create index if not exists products_updated_at on products(updated_at, id);
+
+-- solo cambios visibles en el catálogo: `reserved` se mueve en cada checkout
+-- (sql/stock_holds.sql) y no debe hacer que todos los workers relean la fila
+create or replace function public.products_touch()
+returns trigger
+language plpgsql
+as $$
+begin
+  if (to_jsonb(new) - 'reserved' - 'updated_at') is distinct from (to_jsonb(old) - 'reserved' - 'updated_at') then
+    new.updated_at := now();
+  else
+    new.updated_at := old.updated_at;
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists products_touch on products;
+create trigger products_touch before update on products
+  for each row execute function public.products_touch();
+
+-- lápidas: un id borrado vuelve a aparecer si se inserta de nuevo (updated_at > deleted_at)
+create table if not exists products_deleted (
+  id         text primary key,
+  deleted_at timestamptz not null default now()
+);
+create index if not exists products_deleted_at on products_deleted(deleted_at, id);
+
+create or replace function public.products_tombstone()
+returns trigger
+language plpgsql
+as $$
+begin
+  insert into products_deleted (id, deleted_at) values (old.id, now())
+  on conflict (id) do update set deleted_at = excluded.deleted_at;
+  return old;
+end;
+$$;
+
+drop trigger if exists products_tombstone on products;
+create trigger products_tombstone after delete on products
+  for each row execute function public.products_tombstone();
+
+-- las lápidas solo hacen falta mientras algún worker pueda estar atrasado
+-- delete from products_deleted where deleted_at < now() - interval '30 days';
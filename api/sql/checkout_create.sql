@@ -0,0 +1,58 @@
+-- Checkout atómico en un solo round trip: orden + items + sesión de pago,
+-- con reserva de stock (sql/stock_holds.sql) en la misma transacción.
+-- Aplicar en Supabase (SQL editor o migración) y exponer vía PostgREST:
+--   POST /rest/v1/rpc/checkout_create {"p_order": {...}, "p_items": [...], "p_return_url": "..."}
+
+drop function if exists public.checkout_create(jsonb, jsonb, text);
+
+create or replace function public.checkout_create(p_order jsonb, p_items jsonb, p_return_url text,
+                                                  p_hold_seconds integer default 900)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_order   orders;
+  v_session payment_sessions;
+  v_item    jsonb;
+begin
+  insert into orders (email, delivery_city, delivery_method, coupon, subtotal, discount, shipping, total, status)
+  select r.email, r.delivery_city, r.delivery_method, r.coupon, r.subtotal, r.discount, r.shipping, r.total,
+         coalesce(r.status, 'pending')
+  from jsonb_populate_record(null::orders, p_order) r
+  returning * into v_order;
+
+  -- orden estable por producto para que dos checkouts concurrentes no se bloqueen mutuamente
+  -- renglones sin cantidad no reservan (stock_holds.qty > 0)
+  -- update condicional: aparta solo si stock - reserved alcanza (null = sin control)
+  for v_item in
+    select jsonb_build_object('product_id', x.product_id, 'qty', sum(x.qty))
+      from jsonb_to_recordset(p_items) as x(product_id text, qty int)
+     group by x.product_id having sum(x.qty) > 0 order by x.product_id
+  loop
+    update products
+       set reserved = reserved + (v_item->>'qty')::int
+     where id = v_item->>'product_id'
+       and (stock is null or stock - reserved >= (v_item->>'qty')::int);
+    if not found then
+      raise exception 'insufficient_stock:%', v_item->>'product_id' using errcode = 'P0001';
+    end if;
+    insert into stock_holds (order_id, product_id, qty, expires_at)
+    values (v_order.id, v_item->>'product_id', (v_item->>'qty')::int,
+            now() + make_interval(secs => p_hold_seconds));
+  end loop;
+
+  insert into order_items (order_id, product_id, name, unit_price, qty, line)
+  select v_order.id, x.product_id, x.name, x.unit_price, x.qty, x.line
+  from jsonb_to_recordset(p_items) as x(product_id text, name text, unit_price int, qty int, line int);
+
+  insert into payment_sessions (order_id, amount, return_url)
+  values (v_order.id, v_order.total, p_return_url)
+  returning * into v_session;
+
+  return jsonb_build_object('order', to_jsonb(v_order), 'session', to_jsonb(v_session));
+end;
+$$;
+
+grant execute on function public.checkout_create(jsonb, jsonb, text, integer) to service_role;
@@ -0,0 +1,37 @@
+-- Tablas que lee el motor de reglas de precios con PRICING_RULES_SOURCE=supabase.
+-- Las reglas se recompilan en la API cada PRICING_RULES_REFRESH segundos.
+
+create table if not exists public.coupons (
+  code          text primary key,
+  type          text not null check (type in ('percent', 'amount', 'shipping_free')),
+  value         integer not null default 0,
+  max_discount  integer,
+  min_subtotal  integer not null default 0,
+  categories    text[],
+  clubs         text[],
+  valid_from    timestamptz,
+  valid_until   timestamptz,
+  max_uses      integer,
+  used          integer not null default 0,
+  active        boolean not null default true
+);
+
+create table if not exists public.shipping_rates (
+  city    text not null,          -- '_default' para el resto del país
+  method  text not null,          -- standard | express
+  cost    integer not null,
+  primary key (city, method)
+);
+
+insert into public.coupons (code, type, value) values
+  ('HOLA10', 'percent', 10),
+  ('ENVIOFREE', 'shipping_free', 0),
+  ('RM-20K', 'amount', 20000)
+on conflict (code) do nothing;
+
+insert into public.shipping_rates (city, method, cost) values
+  ('bogota', 'standard', 9000), ('bogota', 'express', 16000),
+  ('medellin', 'standard', 10000), ('medellin', 'express', 18000),
+  ('cali', 'standard', 11000), ('cali', 'express', 19000),
+  ('_default', 'standard', 12000), ('_default', 'express', 20000)
+on conflict (city, method) do nothing;
@@ -0,0 +1,145 @@
+-- Reservas de stock con vencimiento. Aplicar antes de checkout_create.sql.
+--   products.reserved: unidades apartadas por checkouts aún sin pagar
+--   disponible = stock - reserved (stock null = no se controla)
+-- RPC:
+--   POST /rest/v1/rpc/stock_holds_commit  {"p_order_id": "..."}  pago aprobado: reserva -> venta y orden 'paid' (devuelve los ids)
+--   POST /rest/v1/rpc/stock_holds_release {"p_order_id": "..."}  pago rechazado: libera y orden 'rejected'
+-- Las dos fallan con 'order_closed:<estado>' si la orden ya se pagó o se rechazó.
+--   POST /rest/v1/rpc/stock_holds_reap    {}                     libera las vencidas (tarea periódica)
+
+alter table products add column if not exists reserved integer not null default 0;
+
+create table if not exists stock_holds (
+  order_id   uuid not null references orders(id) on delete cascade,
+  product_id text not null references products(id),
+  qty        integer not null check (qty > 0),
+  expires_at timestamptz not null,
+  primary key (order_id, product_id)
+);
+create index if not exists stock_holds_expires on stock_holds(expires_at);
+
+-- devuelve la reserva al stock disponible (sin tocar la orden)
+create or replace function public.stock_holds_free(p_order_id uuid)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_count integer;
+begin
+  with gone as (
+    delete from stock_holds where order_id = p_order_id returning product_id, qty
+  )
+  update products p
+     set reserved = p.reserved - g.qty
+    from gone g
+   where p.id = g.product_id;
+  get diagnostics v_count = row_count;
+  return v_count;
+end;
+$$;
+
+-- pago rechazado: libera y cierra la orden en la misma transacción
+drop function if exists public.stock_holds_release(uuid);
+create or replace function public.stock_holds_release(p_order_id uuid, p_status text default 'rejected')
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_status text;
+  v_count  integer;
+begin
+  select status into v_status from orders where id = p_order_id for update;
+  if v_status is not null and v_status not in ('pending', 'expired') then
+    raise exception 'order_closed:%', v_status using errcode = 'P0001';
+  end if;
+  v_count := stock_holds_free(p_order_id);
+  update orders set status = p_status where id = p_order_id;
+  return v_count;
+end;
+$$;
+
+-- pago aprobado: reserva -> venta y la orden queda 'paid' en la misma transacción.
+-- Un segundo aprobado (otra Idempotency-Key, otro worker, el estado todavía en la
+-- cola write-behind) encuentra la orden cerrada y no vende dos veces. Sin reserva,
+-- solo una orden 'expired' vuelve a tomar el stock; una 'pending' no vende nada.
+create or replace function public.stock_holds_commit(p_order_id uuid)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_status text;
+  v_item   record;
+  v_ids    jsonb := '[]'::jsonb;
+begin
+  select status into v_status from orders where id = p_order_id for update;
+  if v_status is null or v_status not in ('pending', 'expired') then
+    raise exception 'order_closed:%', coalesce(v_status, 'missing') using errcode = 'P0001';
+  end if;
+
+  if v_status = 'pending' then
+    with gone as (
+      delete from stock_holds where order_id = p_order_id returning product_id, qty
+    ), sold as (
+      update products p
+         set reserved = p.reserved - g.qty,
+             stock = case when p.stock is null then null else p.stock - g.qty end
+        from gone g
+       where p.id = g.product_id
+      returning p.id
+    )
+    select coalesce(jsonb_agg(id), '[]'::jsonb) into v_ids from sold;
+  else
+    -- la reserva venció: se intenta tomar el stock de nuevo
+    for v_item in
+      select product_id, sum(qty)::int as qty from order_items
+       where order_id = p_order_id group by product_id order by product_id
+    loop
+      update products
+         set stock = stock - v_item.qty
+       where id = v_item.product_id
+         and (stock is null or stock - reserved >= v_item.qty);
+      if not found then
+        raise exception 'insufficient_stock:%', v_item.product_id using errcode = 'P0001';
+      end if;
+      v_ids := v_ids || to_jsonb(v_item.product_id);
+    end loop;
+  end if;
+
+  update orders set status = 'paid' where id = p_order_id;
+  return v_ids;
+end;
+$$;
+
+create or replace function public.stock_holds_reap()
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_order uuid;
+  v_count integer := 0;
+begin
+  for v_order in
+    select o.id from orders o
+     where exists (select 1 from stock_holds h where h.order_id = o.id and h.expires_at <= now())
+       for update skip locked  -- una orden a mitad del pago no vence
+  loop
+    perform stock_holds_free(v_order);
+    update orders set status = 'expired' where id = v_order and status = 'pending';
+    v_count := v_count + 1;
+  end loop;
+  return v_count;
+end;
+$$;
+
+grant execute on function public.stock_holds_free(uuid) to service_role;
+grant execute on function public.stock_holds_release(uuid, text) to service_role;
+grant execute on function public.stock_holds_commit(uuid) to service_role;
+grant execute on function public.stock_holds_reap() to service_role;
@@ -0,0 +1,305 @@
+"""Servidor PostgREST mínimo en memoria para desarrollo, pruebas y carga.
+
+    uvicorn stubs.postgrest:app --port 54321
+    SUPABASE_URL=http://localhost:54321 DATA_MODE=SUPABASE uvicorn app.main:app
+
+Soporta el subconjunto de la sintaxis de PostgREST que usa `SupabaseRepo`.
+Imita los triggers de sql/catalog_sync.sql: `products.updated_at` y las
+lápidas de `products_deleted`.
+`STUB_LATENCY_MS` agrega una latencia artificial por petición.
+"""
+import asyncio, json, os, re, time, uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, Request, Response
+
+SEED_FILE = os.getenv("STUB_SEED_FILE", os.path.join(os.path.dirname(__file__), "..", "data", "products.json"))
+LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+def _seed() -> Dict[str, List[Dict[str, Any]]]:
+    with open(SEED_FILE, "r", encoding="utf-8") as f:
+        products = json.load(f)
+    seeded = _now()
+    for p in products:
+        p.setdefault("updated_at", seeded)
+    return {"products": products, "products_deleted": [], "orders": [], "order_items": [], "payment_sessions": [], "stock_holds": []}
+
+TABLES = _seed()
+EMBEDS = {"order_items": ("order_id", "id")}  # tabla hija -> (fk, pk del padre)
+
+def reset(tables: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+    TABLES.clear()
+    TABLES.update(tables if tables is not None else _seed())
+
+def _touch(table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    if table == "products":
+        row["updated_at"] = _now()
+    return row
+
+def _split_top(s: str) -> List[str]:
+    parts, depth, cur, quoted, esc = [], 0, "", False, False
+    for ch in s:
+        if quoted:
+            cur += ch
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                quoted = False
+            continue
+        if ch == '"':
+            quoted = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append(cur); cur = ""
+        else:
+            cur += ch
+    if cur:
+        parts.append(cur)
+    return parts
+
+def _unquote(v: str) -> str:
+    if len(v) >= 2 and v[0] == v[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', v[1:-1])
+    return v
+
+def _cmp_value(a: Any, b: str) -> Any:
+    if isinstance(a, bool):
+        return b == "true"
+    if isinstance(a, (int, float)):
+        try:
+            return type(a)(float(b)) if isinstance(a, int) else float(b)
+        except ValueError:
+            return b
+    return b
+
+def _match(row: Dict[str, Any], col: str, expr: str) -> bool:
+    neg = expr.startswith("not.")
+    if neg:
+        expr = expr[4:]
+    op, _, val = expr.partition(".")
+    a = row.get(col)
+    if op == "is":
+        ok = a is None if val == "null" else a == (val == "true")
+    elif op == "in":
+        ok = str(a) in {_unquote(v) for v in _split_top(val.strip("()"))}
+    elif op in ("ilike", "like"):
+        pat = re.escape(_unquote(val)).replace(r"\*", ".*").replace("%", ".*")
+        ok = a is not None and re.fullmatch(pat, str(a), re.I if op == "ilike" else 0) is not None
+    elif op in ("cs", "ov"):
+        want = json.loads(val) if val.startswith("[") else [_unquote(v) for v in _split_top(val.strip("{}"))]
+        ok = isinstance(a, list) and (all if op == "cs" else any)(w in a for w in want)
+    elif a is None:
+        ok = False
+    else:
+        b = _cmp_value(a, _unquote(val))
+        ok = {"eq": a == b, "neq": a != b, "gt": a > b, "gte": a >= b,
+              "lt": a < b, "lte": a <= b}.get(op, False)
+    return not ok if neg else ok
+
+def _match_logic(row: Dict[str, Any], kind: str, body: str) -> bool:
+    results = []
+    for cond in _split_top(body[1:-1] if body.startswith("(") else body):
+        m = re.match(r"^(and|or)(\(.*\))$", cond)
+        if m:
+            results.append(_match_logic(row, m.group(1), m.group(2)))
+        else:
+            col, _, expr = cond.partition(".")
+            results.append(_match(row, col, expr))
+    return all(results) if kind == "and" else any(results)
+
+RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+def _filter(rows: List[Dict[str, Any]], params) -> List[Dict[str, Any]]:
+    out = rows
+    for k, v in params.multi_items():
+        if k in RESERVED:
+            continue
+        if k in ("or", "and"):
+            out = [r for r in out if _match_logic(r, k, v)]
+        else:
+            out = [r for r in out if _match(r, k, v)]
+    return out
+
+def _order(rows: List[Dict[str, Any]], spec: Optional[str]) -> List[Dict[str, Any]]:
+    if not spec:
+        return rows
+    for part in reversed(spec.split(",")):
+        col, _, direction = part.partition(".")
+        desc = direction.startswith("desc")
+        rows = sorted(rows, key=lambda r: (r.get(col) is None, r.get(col) if r.get(col) is not None else 0), reverse=desc)
+    return rows
+
+def _embed(table: str, rows: List[Dict[str, Any]], select: Optional[str]) -> List[Dict[str, Any]]:
+    if not select:
+        return rows
+    out = rows
+    for child in re.findall(r"(\w+)\(\*\)", select):
+        fk, pk = EMBEDS.get(child, (f"{table.rstrip('s')}_id", "id"))
+        out = [{**r, child: [c for c in TABLES.get(child, []) if c.get(fk) == r.get(pk)]} for r in out]
+    return out
+
+app = FastAPI(title="PostgREST stub")
+
+@app.middleware("http")
+async def latency(request: Request, call_next):
+    if LATENCY_MS:
+        await asyncio.sleep(LATENCY_MS / 1000)
+    return await call_next(request)
+
+def _json(data: Any, status: int = 200) -> Response:
+    return Response(json.dumps(data, ensure_ascii=False), status_code=status, media_type="application/json")
+
+def _table(name: str) -> List[Dict[str, Any]]:
+    return TABLES.setdefault(name, [])
+
+@app.get("/rest/v1/{table}")
+async def select(table: str, request: Request):
+    p = request.query_params
+    rows = _order(_filter(_table(table), p), p.get("order"))
+    offset = int(p.get("offset", 0))
+    limit = int(p["limit"]) if "limit" in p else None
+    rows = rows[offset: offset + limit if limit is not None else None]
+    return _json(_embed(table, rows, p.get("select")))
+
+@app.post("/rest/v1/{table}")
+async def insert(table: str, request: Request):
+    body = await request.json()
+    rows = body if isinstance(body, list) else [body]
+    prefer = request.headers.get("prefer", "")
+    key = request.query_params.get("on_conflict", "id")
+    data, out = _table(table), []
+    index = {r.get(key): r for r in data}
+    for row in rows:
+        if "merge-duplicates" in prefer and row.get(key) in index:
+            index[row[key]].update(row)
+            out.append(_touch(table, index[row[key]]))
+            continue
+        new = _touch(table, {"id": str(uuid.uuid4()), "created_at": _now(), **row})
+        data.append(new)
+        index[new.get(key)] = new
+        out.append(new)
+    if "return=minimal" in prefer:
+        return Response(status_code=201)
+    return _json(out, 201)
+
+@app.patch("/rest/v1/{table}")
+async def update(table: str, request: Request):
+    body = await request.json()
+    rows = _filter(_table(table), request.query_params)
+    for r in rows:
+        _touch(table, r).update(body)
+    return _json(rows)
+
+@app.delete("/rest/v1/{table}")
+async def delete(table: str, request: Request):
+    gone = _filter(_table(table), request.query_params)
+    doomed = {id(r) for r in gone}
+    TABLES[table] = [r for r in _table(table) if id(r) not in doomed]
+    if table == "products" and gone:
+        ids = {r["id"] for r in gone}
+        TABLES["products_deleted"] = [t for t in _table("products_deleted") if t["id"] not in ids]
+        _table("products_deleted").extend({"id": i, "deleted_at": _now()} for i in sorted(ids))
+    return Response(status_code=204)
+
+def _free(p: Dict[str, Any]) -> Optional[int]:
+    return None if p.get("stock") is None else p["stock"] - p.get("reserved", 0)
+
+@app.post("/rest/v1/rpc/checkout_create")
+async def rpc_checkout_create(request: Request):
+    body = await request.json()
+    order, items = body["p_order"], body["p_items"]
+    products = {p["id"]: p for p in _table("products")}
+    wanted: Dict[str, int] = {}
+    for it in items:
+        wanted[it["product_id"]] = wanted.get(it["product_id"], 0) + it["qty"]
+    wanted = {pid: qty for pid, qty in wanted.items() if qty > 0}
+    for pid, qty in sorted(wanted.items()):
+        p = products.get(pid)
+        if p is None or (_free(p) is not None and _free(p) < qty):
+            return _json({"code": "P0001", "message": f"insufficient_stock:{pid}"}, 400)
+    row = {"id": str(uuid.uuid4()), "created_at": _now(), **order, "status": order.get("status") or "pending"}
+    expires = time.time() + body.get("p_hold_seconds", 900)
+    for pid, qty in wanted.items():
+        products[pid]["reserved"] = products[pid].get("reserved", 0) + qty
+        _table("stock_holds").append({"order_id": row["id"], "product_id": pid, "qty": qty, "expires_at": expires})
+    _table("orders").append(row)
+    _table("order_items").extend({"id": str(uuid.uuid4()), **it, "order_id": row["id"]} for it in items)
+    sess = {"id": str(uuid.uuid4()), "created_at": _now(), "order_id": row["id"], "amount": row["total"],
+            "return_url": body.get("p_return_url"), "status": "pending"}
+    _table("payment_sessions").append(sess)
+    return _json({"order": row, "session": sess})
+
+def _take_holds(order_id: str) -> List[Dict[str, Any]]:
+    mine = [h for h in _table("stock_holds") if h["order_id"] == order_id]
+    TABLES["stock_holds"] = [h for h in _table("stock_holds") if h["order_id"] != order_id]
+    return mine
+
+def _order_row(order_id: str) -> Optional[Dict[str, Any]]:
+    return next((o for o in _table("orders") if o["id"] == order_id), None)
+
+def _closed(order: Optional[Dict[str, Any]]) -> Response:
+    return _json({"code": "P0001", "message": f"order_closed:{order['status'] if order else 'missing'}"}, 400)
+
+@app.post("/rest/v1/rpc/stock_holds_release")
+async def rpc_stock_holds_release(request: Request):
+    body = await request.json()
+    order = _order_row(body["p_order_id"])
+    if order is not None and order["status"] not in ("pending", "expired"):
+        return _closed(order)
+    products = {p["id"]: p for p in _table("products")}
+    holds = _take_holds(body["p_order_id"])
+    for h in holds:
+        products[h["product_id"]]["reserved"] -= h["qty"]
+    if order is not None:
+        order["status"] = body.get("p_status", "rejected")
+    return _json(len(holds))
+
+@app.post("/rest/v1/rpc/stock_holds_commit")
+async def rpc_stock_holds_commit(request: Request):
+    order_id = (await request.json())["p_order_id"]
+    order = _order_row(order_id)
+    if order is None or order["status"] not in ("pending", "expired"):
+        return _closed(order)
+    products = {p["id"]: p for p in _table("products")}
+    if order["status"] == "pending":
+        holds = _take_holds(order_id)  # sin reserva (ya resuelta) no se vende nada
+        for h in holds:
+            p = products[h["product_id"]]
+            p["reserved"] -= h["qty"]
+            if p.get("stock") is not None:
+                _touch("products", p)["stock"] -= h["qty"]
+        order["status"] = "paid"
+        return _json(sorted(h["product_id"] for h in holds))
+    wanted: Dict[str, int] = {}
+    for it in _table("order_items"):
+        if it["order_id"] == order_id:
+            wanted[it["product_id"]] = wanted.get(it["product_id"], 0) + it["qty"]
+    for pid, qty in sorted(wanted.items()):
+        if _free(products[pid]) is not None and _free(products[pid]) < qty:
+            return _json({"code": "P0001", "message": f"insufficient_stock:{pid}"}, 400)
+    for pid, qty in wanted.items():
+        if products[pid].get("stock") is not None:
+            _touch("products", products[pid])["stock"] -= qty
+    order["status"] = "paid"
+    return _json(sorted(wanted))
+
+@app.post("/rest/v1/rpc/stock_holds_reap")
+async def rpc_stock_holds_reap():
+    now = time.time()
+    products = {p["id"]: p for p in _table("products")}
+    expired = sorted({h["order_id"] for h in _table("stock_holds") if h["expires_at"] <= now})
+    for order_id in expired:
+        for h in _take_holds(order_id):
+            products[h["product_id"]]["reserved"] -= h["qty"]
+        for o in _table("orders"):
+            if o["id"] == order_id and o["status"] == "pending":
+                o["status"] = "expired"
+    return _json(len(expired))
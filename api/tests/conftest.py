@@ -0,0 +1,6 @@
+import os, sys
+
+# la configuración se lee al importar app.config: se fija antes de cualquier import de la app
+os.environ.update({"DATA_MODE": "JSON", "CHECKOUT_RATE": "0", "QUOTE_RATE": "0", "PAYMENT_WRITE_BEHIND": "0",
+                   "IDEMPOTENCY_BACKEND": "memory", "STARTUP_WARMUP": "", "CATALOG_WATCH_INTERVAL": "0"})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
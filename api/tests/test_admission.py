@@ -0,0 +1,137 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import FastAPI
+from app import admission as admission_mod
+from app.admission import (Admission, AdmissionMiddleware, Bulkhead, MemoryBuckets, Overloaded, Policy,
+                           SQLiteBuckets, client_key)
+from app.metrics import Registry
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_memory_bucket_refills_at_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission_mod.time, "monotonic", clock)
+    b = MemoryBuckets()
+    assert b.take("a", 2.0, 2) == 0 and b.take("a", 2.0, 2) == 0
+    assert b.take("a", 2.0, 2) == pytest.approx(0.5)
+    clock.now += 0.25
+    assert b.take("a", 2.0, 2) == pytest.approx(0.25)  # medio token: todavía no alcanza
+    clock.now += 0.25
+    assert b.take("a", 2.0, 2) == 0
+    assert b.take("b", 2.0, 2) == 0  # cada cliente con su bucket
+    clock.now += 60  # el bucket no acumula más que `burst`
+    assert [b.take("a", 2.0, 2) for _ in range(3)][-1] > 0
+
+def test_memory_buckets_are_bounded():
+    b = MemoryBuckets(max_keys=2)
+    for key in ("a", "b", "c"):
+        b.take(key, 1.0, 1)
+    assert len(b) == 2
+    assert b.take("a", 1.0, 1) == 0  # desalojado: vuelve lleno
+
+def test_sqlite_bucket_refills_and_is_shared(tmp_path, monkeypatch):
+    clock = Clock(1_700_000_000.0)
+    monkeypatch.setattr(admission_mod.time, "time", clock)
+    path = str(tmp_path / "buckets.db")
+    one, two = SQLiteBuckets(path), SQLiteBuckets(path)  # dos workers
+    assert one.take("k", 1.0, 2) == 0 and two.take("k", 1.0, 2) == 0
+    assert one.take("k", 1.0, 2) == pytest.approx(1.0)
+    clock.now += 1
+    assert two.take("k", 1.0, 2) == 0
+    clock.now += 7200
+    two.take("otro", 1.0, 2)
+    assert one.purge() == 1 and len(one) == 1
+
+def test_bulkhead_queues_then_sheds():
+    async def run():
+        bh = Bulkhead(limit=1, queue=1, timeout=1)
+        await bh.acquire()
+        waiter = asyncio.create_task(bh.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as e:
+            await bh.acquire()
+        assert e.value.reason == "queue_full" and bh.shed == 1
+        bh.release(0.1)  # el cupo pasa al que esperaba
+        await waiter
+        assert bh.inflight == 1 and bh.stats()["waiting"] == 0
+        bh.release(0.1)
+        assert bh.inflight == 0 and bh.admitted == 2
+    asyncio.run(run())
+
+def test_bulkhead_queue_timeout():
+    async def run():
+        bh = Bulkhead(limit=1, queue=5, timeout=0.01)
+        await bh.acquire()
+        with pytest.raises(Overloaded) as e:
+            await bh.acquire()
+        assert e.value.reason == "queue_timeout" and e.value.retry_after >= 1
+        bh.release(0.0)
+        assert bh.inflight == 0 and bh.timeouts == 1
+    asyncio.run(run())
+
+def _app(monkeypatch, policy):
+    monkeypatch.setattr(admission_mod, "REGISTRY", Registry())  # no pisar los gauges de la app
+    release = asyncio.Event()
+    api = FastAPI()
+
+    @api.post("/limited")
+    async def limited():
+        await release.wait()
+        return {"ok": True}
+
+    @api.get("/free")
+    def free():
+        return {"ok": True}
+    api.add_middleware(AdmissionMiddleware, admission=Admission({"/limited": policy}, MemoryBuckets()))
+    return api, release
+
+def test_rate_limit_answers_429_with_retry_after(monkeypatch):
+    api, release = _app(monkeypatch, Policy("g", 0, 0, rate=0.5, burst=1))
+    release.set()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api), base_url="http://t") as c:
+            ok = await c.post("/limited")
+            limited = await c.post("/limited")
+            free = [await c.get("/free") for _ in range(3)]
+        return ok, limited, free
+    ok, limited, free = asyncio.run(run())
+    assert ok.status_code == 200
+    assert limited.status_code == 429 and limited.headers["Retry-After"] == "2"
+    assert all(r.status_code == 200 for r in free)
+
+def test_full_queue_answers_503(monkeypatch):
+    api, release = _app(monkeypatch, Policy("g", 1, 0, rate=0, burst=1))
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api), base_url="http://t") as c:
+            first = asyncio.create_task(c.post("/limited"))
+            await asyncio.sleep(0.05)
+            shed = await c.post("/limited")
+            release.set()
+            return await first, shed
+    first, shed = asyncio.run(run())
+    assert first.status_code == 200
+    assert shed.status_code == 503 and int(shed.headers["Retry-After"]) >= 1
+
+def _scope(headers=(), client=("10.0.0.1", 1234)):
+    return {"headers": [(k.encode(), v.encode()) for k, v in headers], "client": client}
+
+def test_client_key_trusts_forwarded_for_only_behind_a_proxy(monkeypatch):
+    spoofed = _scope([("x-forwarded-for", "1.2.3.4, 10.0.0.9")])
+    assert client_key(spoofed) == "ip:10.0.0.1"
+    monkeypatch.setattr(admission_mod, "RATE_LIMIT_TRUST_PROXY", True)
+    assert client_key(spoofed) == "ip:1.2.3.4"
+
+def test_client_key_prefers_known_api_keys(monkeypatch):
+    monkeypatch.setattr(admission_mod, "_API_KEYS", {"secreta"})
+    header = admission_mod.RATE_LIMIT_KEY_HEADER.lower()
+    known = client_key(_scope([(header, "secreta")]))
+    assert known.startswith("key:") and "secreta" not in known
+    assert client_key(_scope([(header, "inventada")])) == "ip:10.0.0.1"
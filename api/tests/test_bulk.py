@@ -0,0 +1,72 @@
+import asyncio, json
+import httpx
+from fastapi.testclient import TestClient
+from app import main
+from app.bulk import BadBody, iter_documents
+from app.catalog import Catalog
+from app.repository_supabase import AsyncSupabaseRepo
+from stubs import postgrest
+
+def _docs(body: bytes, ndjson: bool, size: int = 1):
+    async def chunks():
+        for i in range(0, len(body), size):
+            yield body[i:i + size]
+
+    async def run():
+        out = []
+        try:
+            async for doc in iter_documents(chunks(), ndjson):
+                out.append(doc)
+        except BadBody as e:
+            out.append(e)
+        return out
+    return asyncio.run(run())
+
+def test_array_is_decoded_across_any_chunk_boundary():
+    rows = [{"id": "ñandú", "price": 123456, "tags": ["más-vendido"]}, {"id": "b", "price": 7, "rating": 4.5}, 12]
+    body = json.dumps(rows, ensure_ascii=False).encode()
+    for size in (1, 2, 3, 7, len(body)):
+        assert _docs(body, ndjson=False, size=size) == rows
+
+def test_bad_ndjson_line_does_not_stop_the_rest():
+    docs = _docs(b'{"id": "a"}\n{"id": \n\n{"id": "c"}', ndjson=True, size=4)
+    assert docs[0] == {"id": "a"} and isinstance(docs[1], BadBody) and docs[2] == {"id": "c"}
+
+def test_malformed_array_raises():
+    assert isinstance(_docs(b'[{"id": "a"}, {"id"', ndjson=False)[-1], BadBody)
+    assert isinstance(_docs(b'{"id": "a"}', ndjson=False)[-1], BadBody)
+    assert isinstance(_docs(b'[{"id": "a"}] x', ndjson=False)[-1], BadBody)
+
+def test_catalog_upsert_merges_rows_and_reloads(tmp_path):
+    path = tmp_path / "products.json"
+    path.write_text(json.dumps([{"id": "a", "name": "A", "price": 10}, {"id": "b", "name": "B", "price": 20}]))
+    catalog = Catalog(str(path), interval=0, format="objects")
+    assert catalog.upsert([{"id": "a", "price": 1}, {"id": "c", "name": "C", "price": 30}]) == (1, 1)
+    snap = catalog.snapshot
+    assert (snap.by_id["a"].name, snap.by_id["a"].price) == ("A", 1) and sorted(snap.by_id) == ["a", "b", "c"]
+
+def test_bulk_endpoint_batches_supabase_writes(monkeypatch):
+    monkeypatch.setattr(main, "PRODUCTS_BULK_BATCH", 2)
+    existing = postgrest.TABLES["products"][0]
+    rows = [{"id": "bulk-1", "name": "Nuevo", "price": 1000},
+            {"id": "bulk-2", "name": "Sin precio"},                      # inválida: falta price
+            {"id": existing["id"], "name": existing["name"], "price": 1},  # solo esas columnas
+            {"id": "bulk-1", "name": "Nuevo", "price": 2000}]            # mismo id en otro lote
+    before = dict(existing)
+    repo = AsyncSupabaseRepo("http://stub", "key", client=httpx.AsyncClient(transport=httpx.ASGITransport(app=postgrest.app)))
+    main.app.dependency_overrides[main.get_repo] = lambda: repo
+    try:
+        with TestClient(main.app) as c:
+            r = c.post("/v1/products:bulk", content="\n".join(json.dumps(x) for x in rows),
+                       headers={"Content-Type": "application/x-ndjson"})
+        stored = {p["id"]: dict(p) for p in postgrest.TABLES["products"]}
+    finally:
+        main.app.dependency_overrides.clear()
+        postgrest.TABLES["products"] = [p for p in postgrest.TABLES["products"] if not p["id"].startswith("bulk-")]
+        existing.clear()
+        existing.update(before)
+    out = r.json()
+    assert (out["received"], out["upserted"], out["failed"], out["batches"]) == (4, 3, 1, 2)
+    assert [(e["index"], e["id"]) for e in out["errors"]] == [(1, "bulk-2")]
+    assert stored["bulk-1"]["price"] == 2000 and "bulk-2" not in stored
+    assert stored[existing["id"]]["price"] == 1 and stored[existing["id"]]["stock"] == before["stock"]
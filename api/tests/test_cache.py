@@ -0,0 +1,48 @@
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+from app.cache import TTLCache
+from app.repository_supabase import CachedSupabaseRepo
+from stubs import postgrest
+
+def test_invalidating_one_key_keeps_other_loads():
+    cache = TTLCache(10, ttl=60)
+    a, b = cache.token("a"), cache.token("b")
+    cache.invalidate("a")  # escritura de "a" mientras ambas cargas están en vuelo
+    cache.set("a", "viejo", a)
+    cache.set("b", "nuevo", b)
+    assert cache.get("a") == (None, None)
+    assert cache.get("b")[0] == "nuevo"
+
+def test_clear_discards_every_load_in_flight():
+    cache = TTLCache(10, ttl=60)
+    b = cache.token("b")
+    cache.invalidate()
+    cache.set("b", "viejo", b)
+    assert cache.get("b") == (None, None)
+
+def test_get_many_refetches_stale_rows():
+    async def run():
+        transport = httpx.ASGITransport(app=postgrest.app)
+        async with httpx.AsyncClient(transport=transport) as client:
+            repo = CachedSupabaseRepo("http://stub", "key", client=client, ttl=0, stale=300)
+            row = postgrest.TABLES["products"][0]
+            first = (await repo.get_many([row["id"]]))[row["id"]].stock
+            row["stock"] = first - 1  # otro worker vendió; este no recibe invalidación
+            again = (await repo.get_many([row["id"]]))[row["id"]].stock
+            row["stock"] = first
+            return first, again
+    first, again = asyncio.run(run())
+    assert again == first - 1
+
+def test_quote_matches_checkout_and_keeps_request_lines():
+    from app.main import app
+    lines = [{"id": "kit-rm-away-26", "qty": 1}, {"id": "kit-rm-home-26", "qty": 1}, {"id": "kit-rm-away-26", "qty": 2}]
+    with TestClient(app) as c:
+        first = c.post("/v1/pricing/quote", json={"items": lines, "coupon": "hola10"})
+        again = c.post("/v1/pricing/quote", json={"items": lines, "coupon": "HOLA10"})
+        assert again.headers["X-Quote-Cache"] == "HIT" and again.json() == first.json()
+        quote = first.json()
+        assert [(it["id"], it["qty"]) for it in quote["items"]] == [(it["id"], it["qty"]) for it in lines]
+        oid = c.post("/v1/checkout/start", json={"items": lines, "coupon": "hola10"}).json()["order_id"]
+        assert c.app.state.json_repo.orders.order_with_items(oid)["total"] == quote["total"]
@@ -0,0 +1,62 @@
+import json, os, shutil, time
+from app.catalog import Catalog
+
+SOURCE = os.path.join(os.path.dirname(__file__), "..", "data", "products.json")
+
+def _copy(tmp_path) -> str:
+    path = str(tmp_path / "products.json")
+    shutil.copy(SOURCE, path)
+    return path
+
+def _rename_first(path: str, name: str):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data[0]["name"] = name
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+def test_since_from_before_a_restart_gets_a_full_export(tmp_path):
+    path = _copy(tmp_path)
+    before = Catalog(path, interval=0, format="objects").snapshot.version
+    _rename_first(path, "Otro nombre")
+    restarted = Catalog(path, interval=0, format="objects").snapshot  # el proceso nuevo arranca de cero
+    assert restarted.version > before and restarted.changes_since(before) is None
+
+def test_since_from_a_newer_worker_gets_a_full_export(tmp_path):
+    path = _copy(tmp_path)
+    slow = Catalog(path, interval=0, format="objects")
+    _rename_first(path, "Otro nombre")
+    fresh = Catalog(path, interval=0, format="objects").snapshot
+    assert slow.snapshot.changes_since(fresh.version) is None
+
+def test_reload_delta_lists_only_what_changed(tmp_path):
+    path = _copy(tmp_path)
+    catalog = Catalog(path, interval=0, format="objects")
+    since = catalog.snapshot.version
+    _rename_first(path, "Otro nombre")
+    catalog.reload(force=True)
+    changed, deleted = catalog.snapshot.changes_since(since)
+    assert [p.name for p in changed] == ["Otro nombre"] and deleted == []
+
+def test_watcher_picks_up_a_changed_file(tmp_path):
+    path = _copy(tmp_path)
+    catalog = Catalog(path, interval=0.05, format="objects")
+    first = catalog.snapshot
+    catalog.start()
+    try:
+        _rename_first(path, "Recargado")
+        deadline = time.time() + 5
+        while catalog.snapshot is first and time.time() < deadline:
+            time.sleep(0.02)
+    finally:
+        catalog.stop()
+    assert catalog.snapshot.products[0].name == "Recargado" and catalog.reloads == 2
+
+def test_invalid_file_keeps_the_last_good_snapshot(tmp_path):
+    path = _copy(tmp_path)
+    catalog = Catalog(path, interval=0, format="objects")
+    good = catalog.snapshot
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('[{"id": "a", ')  # escritura a medias
+    assert catalog.check() is False
+    assert catalog.snapshot is good and catalog.reload_errors == 1
@@ -0,0 +1,71 @@
+import json, os
+import pytest
+from bench.catalog import generate
+from app.catalog import Catalog
+from app.catalog_mmap import MappedSnapshot, bin_path, ensure_built, read_meta
+
+@pytest.fixture(scope="module")
+def catalogs(tmp_path_factory):
+    path = tmp_path_factory.mktemp("mmap") / "products.json"
+    path.write_text(json.dumps(generate(800, seed=11), ensure_ascii=False), encoding="utf-8")
+    return Catalog(str(path), interval=0, format="objects"), Catalog(str(path), interval=0, format="mmap")
+
+def test_round_trip_matches_the_object_catalog(catalogs):
+    objects, mapped = (c.snapshot for c in catalogs)
+    assert isinstance(mapped, MappedSnapshot)
+    assert mapped.etag == objects.etag
+    assert [p.model_dump() for p in mapped.products] == [p.model_dump() for p in objects.products]
+    assert [p.id for p in mapped.products[3:6]] == [p.id for p in objects.products[3:6]]
+    assert mapped.products[-1] == objects.products[-1]
+    for p in objects.products[::37]:
+        assert p.id in mapped.by_id and mapped.by_id[p.id] == p
+    assert "no-existe" not in mapped.by_id and mapped.by_id.get("no-existe") is None
+    assert list(mapped.by_id) == [p.id for p in objects.products]
+
+@pytest.mark.parametrize("kw", [
+    dict(q="camis", sort="name"),
+    dict(filters={"club": ["Real Madrid"], "sizes": ["XL"]}, in_stock=True, sort="-price"),
+    dict(min_price=100_000, max_price=300_000, sort="rating"),
+    dict(q="home", facets=("club", "league", "tags")),
+])
+def test_mapped_search_gives_the_same_results(catalogs, kw):
+    objects, mapped = (c.snapshot for c in catalogs)
+    want, want_total, want_facets = objects.index.search(limit=30, offset=3, **kw)
+    got, total, facets = mapped.index.search(limit=30, offset=3, **kw)
+    assert total == want_total and facets == want_facets
+    assert [p.id for p in got] == [p.id for p in want]
+
+def test_mapped_cursor_pagination(catalogs):
+    objects, mapped = (c.snapshot for c in catalogs)
+    first, _, _ = objects.index.search(q="camiseta", sort="name", limit=20)
+    after = (first[-1].name, first[-1].id)
+    assert [p.id for p in mapped.index.search(q="camiseta", limit=20, after=after)[0]] == \
+        [p.id for p in objects.index.search(q="camiseta", limit=20, after=after)[0]]
+
+def test_rebuild_only_when_the_content_changes(tmp_path):
+    source = tmp_path / "products.json"
+    rows = generate(50, seed=3)
+    source.write_text(json.dumps(rows), encoding="utf-8")
+    path, built = ensure_built(str(source))
+    assert built and path == bin_path(str(source))
+    generation = read_meta(path)["generation"]
+    assert ensure_built(str(source)) == (path, False)
+
+    os.utime(source, (1, 1))  # copiado a otra imagen: mismo contenido, otro mtime -> vale el sha256
+    assert ensure_built(str(source)) == (path, False)
+
+    rows[0]["name"] = "Otro nombre"
+    source.write_text(json.dumps(rows), encoding="utf-8")
+    _, built = ensure_built(str(source))
+    assert built and read_meta(path)["generation"] > generation
+    assert MappedSnapshot(path).by_id[rows[0]["id"]].name == "Otro nombre"
+
+def test_truncated_snapshot_is_rebuilt(tmp_path):
+    source = tmp_path / "products.json"
+    source.write_text(json.dumps(generate(20, seed=5)), encoding="utf-8")
+    path, _ = ensure_built(str(source))
+    with open(path, "r+b") as f:
+        f.truncate(10)
+    assert read_meta(path) is None
+    assert ensure_built(str(source))[1]
+    assert len(MappedSnapshot(path).products) == 20
@@ -0,0 +1,130 @@
+import asyncio, json
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from app import breaker as breaker_mod
+from app.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from app.health import DEGRADED, OK, UNAVAILABLE, CatalogFallback, status_of
+from app.repository_supabase import AsyncSupabaseRepo
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(breaker_mod.time, "monotonic", c)
+    return c
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    b = CircuitBreaker(failures=3, error_rate=1.1, reset=5)
+    for _ in range(2):
+        b.record(False, 0.01)
+    assert b.state == CLOSED
+    b.record(False, 0.01)
+    assert b.state == OPEN and b.trips == 1
+    clock.now += 2
+    with pytest.raises(CircuitOpen) as e:
+        b.before()
+    assert e.value.retry_after == pytest.approx(3)
+    assert b.rejected == 1
+
+def test_half_open_lets_one_probe_through(clock):
+    b = CircuitBreaker(failures=1, reset=5)
+    b.record(False, 0.01)
+    clock.now += 5
+    b.before()  # la prueba
+    assert b.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        b.before()  # una sola a la vez
+    b.record(True, 0.01)
+    assert b.state == CLOSED
+    b.before()
+
+def test_failed_probe_reopens(clock):
+    b = CircuitBreaker(failures=1, reset=5)
+    b.record(False, 0.01)
+    clock.now += 5
+    b.before()
+    b.record(False, 0.01)
+    assert b.state == OPEN and b.trips == 2
+    with pytest.raises(CircuitOpen):
+        b.before()
+
+def test_breaker_trips_on_error_rate(clock):
+    b = CircuitBreaker(failures=100, error_rate=0.5, min_calls=4, window=10)
+    for ok in (True, False, True):
+        b.record(ok, 0.01)
+    assert b.state == CLOSED  # todavía no hay min_calls
+    b.record(False, 0.01)
+    assert b.state == OPEN
+
+def test_old_errors_leave_the_window(clock):
+    b = CircuitBreaker(failures=100, error_rate=0.5, min_calls=2, window=10)
+    b.record(False, 0.01)
+    clock.now += 11
+    b.record(True, 0.01)
+    b.record(True, 0.01)
+    assert b.state == CLOSED and b.stats()["recent"]["calls"] == 2
+
+def test_open_circuit_fails_without_calling_supabase():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            repo = AsyncSupabaseRepo("http://stub", "key", client=client,
+                                     breaker=CircuitBreaker(failures=1, reset=60))
+            with pytest.raises(httpx.HTTPStatusError):
+                await repo.product_create({"id": "x"})
+            with pytest.raises(CircuitOpen):
+                await repo.products_list(None, None, 10, 0)
+    asyncio.run(run())
+    assert calls == ["/rest/v1/products"]
+
+class Pages:
+    def __init__(self, rows=None, error=None):
+        self.rows, self.error = rows, error
+
+    async def products_pages(self, page_size):
+        if self.error:
+            raise self.error
+        yield self.rows
+
+def test_fallback_keeps_the_last_good_snapshot(tmp_path):
+    path = tmp_path / "snapshot.json"
+    fb = CatalogFallback(str(path))
+    assert fb.repo is None
+    rows = [{"id": "a", "name": "A", "price": 10, "stock": 1}]
+    assert asyncio.run(fb.refresh(Pages(rows)))
+    assert [p.id for p in fb.repo.catalog.snapshot.products] == ["a"]
+    assert not asyncio.run(fb.refresh(Pages(error=httpx.ConnectError("caído"))))
+    assert not asyncio.run(fb.refresh(Pages([])))  # vacío tampoco pisa el snapshot
+    assert fb.errors == 2 and json.loads(path.read_text()) == rows
+    again = CatalogFallback(str(path))  # sobrevive al reinicio
+    assert again.stats()["available"] and again.stats()["products"] == 1
+
+def test_status_of():
+    snapshot = lambda available: {"available": available}
+    supabase = lambda state: {"breaker": {"state": state}}
+    assert status_of({"catalog": {"stale": False}}) == OK
+    assert status_of({"catalog": {"stale": True}}) == DEGRADED
+    assert status_of({"supabase": supabase(CLOSED), "snapshot": snapshot(False)}) == OK
+    assert status_of({"supabase": supabase(OPEN), "snapshot": snapshot(True)}) == DEGRADED
+    assert status_of({"supabase": supabase(HALF_OPEN), "snapshot": snapshot(False)}) == UNAVAILABLE
+
+def test_health_endpoints_in_json_mode():
+    from app.main import app
+    with TestClient(app) as c:
+        assert c.get("/health/live").json() == {"ok": True}
+        r = c.get("/health/ready")
+    body = r.json()
+    assert r.status_code == 200 and body["status"] == OK and body["ready"]
+    assert body["checks"]["catalog"]["products"] > 0
@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+from app.idempotency import NEW, REPLAY, MemoryIdempotencyStore, SQLiteIdempotencyStore, StoredResponse
+
+CART = {"items": [{"id": "kit-rm-away-26", "qty": 1}]}
+
+def test_checkout_replay_returns_the_same_order():
+    from app.main import app
+    with TestClient(app) as c:
+        orders = c.app.state.json_repo.orders
+        before = len(orders.orders)
+        headers = {"Idempotency-Key": "compra-1"}
+        first = c.post("/v1/checkout/start", json=CART, headers=headers)
+        again = c.post("/v1/checkout/start", json=CART, headers=headers)
+        assert first.status_code == again.status_code == 200
+        assert again.json() == first.json()
+        assert len(orders.orders) == before + 1  # ni otra orden ni otra reserva
+        other = c.post("/v1/checkout/start", json={**CART, "coupon": "HOLA10"}, headers=headers)
+        assert other.status_code == 422
+
+def test_sqlite_store_replays_across_workers(tmp_path):
+    path = str(tmp_path / "idem.sqlite3")
+    a, b = SQLiteIdempotencyStore(path), SQLiteIdempotencyStore(path)
+    assert a.begin("k", "fp")[0] != REPLAY
+    a.complete("k", "fp", StoredResponse(200, {"content-type": "application/json"}, b'{"order_id":"o1"}'))
+    state, stored = b.begin("k", "fp")
+    assert state == REPLAY and stored.body == b'{"order_id":"o1"}'
+
+def test_purge_drops_expired_keys(tmp_path):
+    ok = StoredResponse(200, {}, b"{}")
+    for store in (MemoryIdempotencyStore(ttl=0), SQLiteIdempotencyStore(str(tmp_path / "idem.sqlite3"), ttl=0)):
+        store.begin("vieja", "fp")
+        store.complete("vieja", "fp", ok)
+        store.ttl = 60
+        store.begin("viva", "fp")
+        store.complete("viva", "fp", ok)
+        assert store.purge() == 1 and store.purge() == 0
+        assert store.begin("viva", "fp")[0] == REPLAY and store.begin("vieja", "fp")[0] == NEW
+
+def test_mockpay_replay_with_another_action_is_a_conflict():
+    from app.main import app
+    with TestClient(app) as c:
+        r = c.post("/v1/checkout/start", json=CART).json()
+        form = {"session_id": r["session_id"], "order_id": r["order_id"], "return": "http://x/r"}
+        first = c.post("/v1/payment/mock/submit", data={**form, "action": "reject"}, follow_redirects=False)
+        assert first.status_code == 302
+        again = c.post("/v1/payment/mock/submit", data={**form, "action": "approve"}, follow_redirects=False)
+        assert again.status_code == 422
+        same = c.post("/v1/payment/mock/submit", data={**form, "action": "reject"}, follow_redirects=False)
+        assert same.headers["location"] == first.headers["location"]
@@ -0,0 +1,63 @@
+import functools, io, os
+from urllib.parse import urlsplit
+import pytest
+from fastapi.testclient import TestClient
+from app import images
+
+pytestmark = pytest.mark.skipif(not images.FORMATS, reason="Pillow sin codificadores AVIF/WebP")
+
+def _png(path, width, height, color=(200, 30, 30)):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    images.Image.new("RGB", (width, height), color).save(path, "PNG")
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    public = tmp_path / "public"
+    _png(public / "img" / "camiseta.png", 400, 200)
+    (public / "img" / "notas.png").write_bytes(b"no es una imagen")
+    monkeypatch.setattr(images, "source", functools.partial(images.source, root=str(public)))
+    monkeypatch.setattr(images, "IMAGES_CACHE_DIR", str(tmp_path / "cache"))
+    return public
+
+def _path(url):
+    return urlsplit(url).path
+
+def test_source_stays_inside_the_root(root):
+    assert images.source("/img/camiseta.png").width == 400
+    for img in ("/img/falta.png", "/img/notas.png", "../../etc/passwd", None):
+        assert images.source(img) is None
+
+def test_srcset_never_upscales(root):
+    items = [{"id": "a", "img": "/img/camiseta.png"}, {"id": "b", "img": "/img/falta.png"}]
+    out = images.with_srcset(items)
+    assert "img_srcset" not in items[0] and out[1] is items[1]
+    sets = out[0]["img_srcset"]
+    assert set(sets) == set(images.FORMATS)
+    assert [entry.rsplit(" ", 1)[1] for entry in sets["webp"].split(", ")] == ["160w", "320w"]
+
+def test_variant_is_rendered_once_and_revalidated(root):
+    from app.main import app
+    url = _path(images.srcset("/img/camiseta.png")["webp"].split(", ")[1].split(" ")[0])
+    with TestClient(app) as c:
+        r = c.get(url)
+        assert r.status_code == 200 and r.headers["content-type"] == "image/webp"
+        assert r.headers["Cache-Control"] == images.CACHE_CONTROL
+        with images.Image.open(io.BytesIO(r.content)) as im:
+            assert im.size == (320, 160)
+        files = [f for _, _, fs in os.walk(images.IMAGES_CACHE_DIR) for f in fs]
+        assert len(files) == 1
+        again = c.get(url, headers={"If-None-Match": r.headers["ETag"]})
+        assert again.status_code == 304 and again.content == b""
+        assert c.get(url.replace("320-std", "300-std")).status_code == 404
+        assert c.get(url.replace("320-std", "320-ultra")).status_code == 404
+
+def test_changed_original_redirects_to_the_new_url(root):
+    from app.main import app
+    old = _path(images.srcset("/img/camiseta.png")["webp"].split(" ")[0])
+    _png(root / "img" / "camiseta.png", 400, 200, color=(0, 90, 200))
+    os.utime(root / "img" / "camiseta.png", ns=(1, 1))  # mismo tamaño posible: forzar otra firma
+    new = _path(images.srcset("/img/camiseta.png")["webp"].split(" ")[0])
+    assert new != old
+    with TestClient(app) as c:
+        r = c.get(old, follow_redirects=False)
+    assert r.status_code == 308 and _path(r.headers["Location"]) == new
@@ -0,0 +1,46 @@
+from fastapi.testclient import TestClient
+from app import metrics
+from app.metrics import Counter, Histogram, Registry
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("lat", "Latencia", ("route",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 3.0):
+        h.observe(v, "/a")
+    lines = list(h.render())
+    assert lines[:2] == ["# HELP lat Latencia", "# TYPE lat histogram"]
+    assert 'lat_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'lat_bucket{route="/a",le="1.0"} 3' in lines
+    assert 'lat_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'lat_sum{route="/a"} 4.05' in lines and 'lat_count{route="/a"} 4' in lines
+
+def test_label_values_are_escaped():
+    c = Counter("hits", "Hits", ("path",))
+    c.inc('a"b\\c\nd')
+    c.inc('a"b\\c\nd', value=2)
+    assert list(c.render())[-1] == 'hits{path="a\\"b\\\\c\\nd"} 3.0'
+
+def test_registry_skips_broken_gauges():
+    reg = Registry()
+    reg.register(Counter("ok_total", "Ok")).inc()
+    reg.register(metrics.Gauges("broken", "Roto", (), lambda: 1 / 0))
+    out = reg.render()
+    assert "ok_total 1.0" in out and "broken" not in out
+
+def test_endpoint_labels_requests_by_route_template():
+    from app.main import app
+    with TestClient(app) as c:
+        c.get("/v1/orders/no-existe")
+        c.get("/v1/products")
+        body = c.get("/metrics").text
+    assert 'http_request_duration_seconds_count{route="/v1/orders/{order_id}",method="GET"' in body
+    assert "no-existe" not in body
+    assert 'http_request_duration_seconds_count{route="/v1/products",method="GET",status="200"}' in body
+
+def test_observe_stage_feeds_the_stage_histogram():
+    metrics.observe_stage("prueba", 0.002)
+    with metrics.stage("prueba"):
+        pass
+    body = metrics.REGISTRY.render()
+    assert 'stage_duration_seconds_bucket{stage="prueba",le="0.0025"}' in body
+    assert any(l.startswith('stage_duration_seconds_count{stage="prueba"}') and int(l.split()[-1]) >= 2
+               for l in body.splitlines())
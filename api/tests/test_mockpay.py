@@ -0,0 +1,33 @@
+from fastapi.testclient import TestClient
+from app import mockpay
+from app.mockpay import Template
+
+def test_template_escapes_fields_and_inlines_static_ones():
+    t = Template("<a href='{{ href }}'>{{name}}</a>{{ css }}", {"css": "x&y"})
+    assert t.fields == ["href", "name"]
+    assert t.render(href="'/x'", name="<b>") == b"<a href='&#x27;/x&#x27;'>&lt;b&gt;</a>x&amp;y"
+
+def test_page_is_rendered_and_revalidated():
+    from app.main import app
+    with TestClient(app) as c:
+        r = c.get("/mockpay/s<1>", params={"order_id": "o1", "return": "http://front/r?a=1&b=2"})
+        assert r.status_code == 200 and r.headers["Cache-Control"] == mockpay.PAGE_CACHE_CONTROL
+        assert "s&lt;1&gt;" in r.text and "s<1>" not in r.text
+        assert "http://front/r?a=1&amp;b=2" in r.text
+        assert mockpay.STATIC_PREFIX + mockpay.CSS.name in r.text
+        same = c.get("/mockpay/s<1>", params={"order_id": "o1", "return": "http://front/r?a=1&b=2"},
+                     headers={"If-None-Match": r.headers["ETag"]})
+        assert same.status_code == 304 and same.content == b""
+        other = c.get("/mockpay/s<1>", params={"order_id": "o2", "return": "http://front/r?a=1&b=2"},
+                      headers={"If-None-Match": r.headers["ETag"]})
+        assert other.status_code == 200 and other.headers["ETag"] != r.headers["ETag"]
+
+def test_hashed_stylesheet_is_immutable_and_compressed():
+    from app.main import app
+    url = mockpay.STATIC_PREFIX + mockpay.CSS.name
+    with TestClient(app) as c:
+        r = c.get(url, headers={"Accept-Encoding": "gzip"})
+        assert r.status_code == 200 and r.headers["Cache-Control"] == mockpay.ASSET_CACHE_CONTROL
+        assert r.content == mockpay._read("static/mockpay.css")
+        assert c.get(url, headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+        assert c.get(mockpay.STATIC_PREFIX + "mockpay.css").status_code == 404
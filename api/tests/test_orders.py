@@ -0,0 +1,105 @@
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from app.orders import OrderWatch
+from app.repository_supabase import CachedSupabaseRepo
+from stubs import postgrest
+
+class Counting(httpx.AsyncBaseTransport):
+    def __init__(self):
+        self.inner = httpx.ASGITransport(app=postgrest.app)
+        self.gets = []
+
+    async def handle_async_request(self, request):
+        if request.method == "GET":
+            self.gets.append(request.url.params.get("id"))
+        return await self.inner.handle_async_request(request)
+
+@pytest.fixture
+def orders():
+    rows = [{"id": f"ord-{i}", "status": "pending", "total": 1000} for i in range(3)]
+    postgrest.TABLES["orders"].extend(rows)
+    yield [r["id"] for r in rows]
+    postgrest.TABLES["orders"] = [o for o in postgrest.TABLES["orders"] if not o["id"].startswith("ord-")]
+
+def _cached(fn):
+    transport = Counting()
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await fn(CachedSupabaseRepo("http://stub", "key", client=client))
+    return asyncio.run(run()), transport.gets
+
+def test_order_reads_are_cached_until_the_status_changes(orders):
+    oid = orders[0]
+
+    async def scenario(repo):
+        first = await repo.order_with_items(oid)
+        again = await repo.order_with_items(oid)
+        await repo.order_update_status(oid, "paid")
+        return first, again, await repo.order_with_items(oid)
+    (first, again, after), gets = _cached(scenario)
+    assert first["status"] == again["status"] == "pending" and after["status"] == "paid"
+    assert gets == [f"eq.{oid}", f"eq.{oid}"]
+
+def test_batch_only_fetches_the_orders_not_in_cache(orders):
+    async def scenario(repo):
+        await repo.order_with_items(orders[0])
+        rows = await repo.orders_with_items([orders[0], orders[1], "ord-falta"])
+        again = await repo.orders_with_items([orders[1], "ord-falta"])  # también se cachea que no existe
+        return rows, again
+    (rows, again), gets = _cached(scenario)
+    assert sorted(r["id"] for r in rows) == orders[:2] and [r["id"] for r in again] == [orders[1]]
+    assert gets == [f"eq.{orders[0]}", 'in.("ord-1","ord-falta")']
+
+def test_notify_wakes_a_long_poll_before_the_next_read():
+    async def run():
+        watch = OrderWatch(poll=30)
+        state = {"status": "pending"}
+
+        async def read():
+            return dict(state)
+
+        async def pay():
+            await asyncio.sleep(0.02)
+            state["status"] = "paid"
+            watch.notify("o1")
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        _, data = await asyncio.gather(pay(), watch.until_changed("o1", read, "pending", timeout=5))
+        return data, loop.time() - t0, watch.stats()
+    data, elapsed, stats = asyncio.run(run())
+    assert data["status"] == "paid" and elapsed < 1
+    assert stats["notified"] == 1 and stats["waiting"] == 0
+
+def test_long_poll_gives_up_with_the_current_status():
+    async def read():
+        return {"id": "o1", "status": "pending"}
+    data = asyncio.run(OrderWatch(poll=0.01).until_changed("o1", read, "pending", timeout=0.05))
+    assert data["status"] == "pending"
+
+def test_events_stream_ends_on_a_terminal_status():
+    statuses = iter(["pending", "pending", "paid"])
+
+    async def read():
+        return {"id": "o1", "status": next(statuses)}
+
+    async def collect():
+        return [e async for e in OrderWatch(poll=0).events("o1", read, heartbeat=0)]
+    events = asyncio.run(collect())
+    assert events[0].startswith("event: order") and '"pending"' in events[0]
+    assert events[1] == ": keep-alive\n\n"
+    assert events[2].startswith("event: order") and '"paid"' in events[2] and len(events) == 3
+
+def test_batch_endpoint_keeps_the_requested_order():
+    from app.main import app
+    with TestClient(app) as c:
+        ids = [c.post("/v1/checkout/start", json={"items": [{"id": "kit-rm-home-26", "qty": 1}]}).json()["order_id"]
+               for _ in range(2)]
+        r = c.get("/v1/orders", params={"ids": f"{ids[1]},falta,{ids[0]},{ids[1]}"})
+        assert r.status_code == 200
+        assert [o["id"] for o in r.json()["orders"]] == [ids[1], ids[0]] and r.json()["missing"] == ["falta"]
+        waited = c.get(f"/v1/orders/{ids[0]}", params={"wait": 5, "status": "paid"})  # ya no es paid: sin espera
+        assert waited.json()["status"] == "pending"
+        assert c.get("/v1/orders/falta").status_code == 404
@@ -0,0 +1,79 @@
+import asyncio, types
+import httpx
+from app.checkout_local import LocalCheckoutStore
+from app.main import _mockpay_submit
+from app.models import Product
+from app.outbox import DEAD, PaymentOutbox
+
+class Target:
+    """Repositorio de órdenes falso: registra las escrituras y falla a pedido."""
+
+    def __init__(self, fail=None):
+        self.calls = []
+        self.fail = fail or {}
+
+    def _do(self, op, key, **args):
+        err = self.fail.pop((op, key), None)
+        if err is not None:
+            raise err
+        self.calls.append((op, key, args.get("status")))
+
+    def payment_session_update(self, session_id, status):
+        self._do("payment_session_update", session_id, status=status)
+
+    def order_update_status(self, order_id, status, receipt_code=None, paid_at=None):
+        self._do("order_update_status", order_id, status=status)
+
+def _outbox(tmp_path) -> PaymentOutbox:
+    return PaymentOutbox(str(tmp_path / "outbox.sqlite3"), retry_base=0, retry_max=0)
+
+def _writes(key: str, *statuses: str):
+    return [("order_update_status", {"order_id": key, "status": s}) for s in statuses]
+
+def test_writes_of_a_key_apply_in_order(tmp_path):
+    box, target = _outbox(tmp_path), Target()
+    box.enqueue("o1", _writes("o1", "paid"))
+    box.enqueue("o2", _writes("o2", "rejected"))
+    box.enqueue("o1", _writes("o1", "refunded"))
+    while asyncio.run(box.flush(target)):
+        pass
+    assert [c for c in target.calls if c[1] == "o1"] == [("order_update_status", "o1", "paid"),
+                                                        ("order_update_status", "o1", "refunded")]
+    assert box.stats()["depth"] == 0
+
+def test_transient_error_blocks_only_its_key_and_retries(tmp_path):
+    box = _outbox(tmp_path)
+    target = Target({("order_update_status", "o1"): httpx.ConnectError("caído")})
+    box.enqueue("o1", _writes("o1", "paid", "refunded"))
+    box.enqueue("o2", _writes("o2", "paid"))
+    asyncio.run(box.flush(target))
+    assert target.calls == [("order_update_status", "o2", "paid")]  # lo de o1 espera a su cabeza
+    assert box.stats()["retrying"] == 1
+    while asyncio.run(box.flush(target)):
+        pass
+    assert [c[2] for c in target.calls if c[1] == "o1"] == ["paid", "refunded"]
+
+def test_permanent_error_is_dead_lettered_and_the_key_continues(tmp_path):
+    box = _outbox(tmp_path)
+    bad = httpx.HTTPStatusError("422", request=httpx.Request("PATCH", "http://x"),
+                                response=httpx.Response(422))
+    target = Target({("order_update_status", "o1"): bad})
+    box.enqueue("o1", _writes("o1", "paid", "refunded"))
+    while asyncio.run(box.flush(target)):
+        pass
+    stats = box.stats()
+    assert stats["dead"] == 1 and stats["depth"] == 0 and box.discarded == 1
+    assert target.calls == [("order_update_status", "o1", "refunded")]
+
+def test_second_approve_before_flush_does_not_sell_twice(tmp_path):
+    store = LocalCheckoutStore({"p1": Product(id="p1", name="P1", price=1000, stock=5)}.get)
+    created = store.checkout_create({"total": 1000}, [{"product_id": "p1", "name": "P1", "unit_price": 1000,
+                                                       "qty": 1, "line": 1000}], "")
+    oid, sid = created["order"]["id"], created["session"]["id"]
+    box, repo = _outbox(tmp_path), types.SimpleNamespace(orders=store, remote=False)
+    for _ in range(2):  # la cola no se vacía entre los dos
+        asyncio.run(_mockpay_submit(sid, oid, "approve", "http://x/r", repo, box))
+    assert store.stock.sold == {"p1": 1}
+    assert store.order_with_items(oid)["status"] == "paid"
+    ops = [op for op, _ in box._conn().execute("select op, key from outbox order by seq")]
+    assert ops == ["payment_session_update", "order_update_status", "payment_session_update"]  # el segundo no toca la orden
@@ -0,0 +1,35 @@
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+from app.repository_supabase import AsyncSupabaseRepo
+from stubs import postgrest
+
+def test_cursor_pages_cover_the_catalog_once():
+    from app.main import app
+    with TestClient(app) as c:
+        every = [p["id"] for p in c.get("/v1/products", params={"sort": "name", "limit": 200}).json()["items"]]
+        seen, params = [], {"sort": "name", "limit": 3}
+        while True:
+            body = c.get("/v1/products", params=params).json()
+            seen += [p["id"] for p in body["items"]]
+            if "next_cursor" not in body:
+                break
+            params = {"limit": 3, "cursor": body["next_cursor"]}
+    assert seen == every and len(set(seen)) == len(seen)
+
+def test_stub_pages_break_name_ties_by_id():
+    base = dict(postgrest.TABLES["products"][0])
+    twins = [{**base, "id": f"gemelo-{i}", "name": "Camiseta gemela"} for i in range(5)]
+    postgrest.TABLES["products"].extend(twins)
+
+    async def run():
+        transport = httpx.ASGITransport(app=postgrest.app)
+        async with httpx.AsyncClient(transport=transport) as client:
+            repo = AsyncSupabaseRepo("http://stub", "key", client=client)
+            return [p["id"] async for page in repo.products_pages(2) for p in page]
+    try:
+        ids = asyncio.run(run())
+    finally:
+        del postgrest.TABLES["products"][-len(twins):]
+    rows = sorted(postgrest.TABLES["products"] + twins, key=lambda r: (r["name"], r["id"]))
+    assert ids == [r["id"] for r in rows]
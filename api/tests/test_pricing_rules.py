@@ -0,0 +1,75 @@
+import json
+import pytest
+from app.models import Product
+from app.pricing_rules import PricingRules, RulesEngine, RulesFile, rows_to_raw
+
+def _rules(shipping: dict) -> PricingRules:
+    return PricingRules({"shipping": shipping, "coupons": []}, 1, "test", {})
+
+def test_city_without_standard_falls_back_to_default_table():
+    rules = _rules({"_default": {"standard": 12000, "express": 20000}, "Cali": {"express": 15000}})
+    assert rules.shipping_cost("cali", "express") == 15000
+    assert rules.shipping_cost("cali", "standard") == 12000
+    assert rules.shipping_cost("cali", "pickup") == 12000
+
+def test_default_table_without_standard_is_rejected():
+    with pytest.raises(ValueError):
+        _rules({"_default": {"express": 20000}})
+
+def _p(pid: str, price: int, category: str = "Ropa", club: str = "Real Madrid") -> Product:
+    return Product(id=pid, name=pid, price=price, category=category, club=club)
+
+def _apply(coupon: dict, lines, shipping: int = 10000, uses=None, now=None):
+    rules = PricingRules({"coupons": [{"code": "C", **coupon}]}, 1, "test", uses or {})
+    subtotal = sum(line for _, line in lines)
+    return rules.apply_coupon("c", lines, subtotal, shipping, now)
+
+def test_coupon_kinds():
+    lines = [(_p("a", 100000), 100000)]
+    assert _apply({"type": "percent", "value": 10}, lines) == (10000, 10000, "C", None)
+    assert _apply({"type": "percent", "value": 50, "max_discount": 20000}, lines)[0] == 20000
+    assert _apply({"type": "amount", "value": 500000}, lines)[0] == 100000  # nunca más que la base
+    assert _apply({"type": "shipping_free"}, lines) == (0, 0, "C", None)
+
+def test_coupon_restricted_to_categories_and_clubs():
+    lines = [(_p("a", 100000, "Ropa"), 100000), (_p("b", 50000, "Balones", "FC Barcelona"), 50000)]
+    assert _apply({"type": "percent", "value": 10, "categories": ["ropa"]}, lines)[0] == 10000
+    assert _apply({"type": "percent", "value": 10, "clubs": ["fc barcelona"]}, lines)[0] == 5000
+    discount, _, applied, reason = _apply({"type": "percent", "value": 10, "categories": ["Calzado"]}, lines)
+    assert (discount, applied) == (0, None) and "no aplica" in reason
+
+def test_coupon_conditions_give_a_reason():
+    lines = [(_p("a", 100000), 100000)]
+    assert "mínimo" in _apply({"type": "amount", "value": 1, "min_subtotal": 200000}, lines)[3]
+    assert "vigente" in _apply({"type": "amount", "value": 1, "valid_from": "2999-01-01T00:00:00"}, lines)[3]
+    assert "venció" in _apply({"type": "amount", "value": 1, "valid_until": "2000-01-01T00:00:00"}, lines)[3]
+    assert "agotó" in _apply({"type": "amount", "value": 1, "max_uses": 3, "used": 1}, lines, uses={"C": 2})[3]
+    assert _apply({"type": "amount", "value": 1, "active": False}, lines) == (0, 10000, None, None)
+
+def test_unknown_coupon_type_is_rejected():
+    with pytest.raises(ValueError):
+        PricingRules({"coupons": [{"code": "X", "type": "gratis"}]}, 1, "test", {})
+
+def test_uses_survive_a_hot_swap():
+    engine = RulesEngine({"coupons": [{"code": "UNO", "type": "amount", "value": 1, "max_uses": 1}]})
+    engine.redeem("uno")
+    swapped = engine.install({"coupons": [{"code": "UNO", "type": "amount", "value": 2, "max_uses": 1}]}, "test")
+    assert swapped.version == 2 and engine.current is swapped
+    assert "agotó" in swapped.apply_coupon("UNO", [], 100, 0)[3]
+
+def test_rules_file_keeps_the_last_good_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"coupons": [{"code": "A", "type": "percent", "value": 5}]}))
+    engine = RulesEngine()
+    watcher = RulesFile(engine, str(path), interval=0)
+    good = engine.current
+    assert "A" in good.coupons
+    path.write_text(json.dumps({"coupons": [{"code": "B", "type": "nope"}]}))
+    assert watcher.check() is False and engine.current is good and watcher.reload_errors == 1
+
+def test_supabase_rows_compile_like_the_file():
+    raw = rows_to_raw([{"code": "HOLA", "type": "percent", "value": 10}],
+                      [{"city": "_default", "method": "standard", "cost": 9000},
+                       {"city": "Bogotá", "method": "express", "cost": 15000}])
+    rules = PricingRules(raw, 1, "supabase", {})
+    assert rules.shipping_cost("BOGOTA", "express") == 15000 and rules.shipping_cost("Pasto", "standard") == 9000
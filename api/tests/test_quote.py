@@ -0,0 +1,57 @@
+import asyncio, json
+from fastapi.testclient import TestClient
+from app import main
+from app.models import QuoteIn
+
+class _Repo:
+    """Repo remoto de mentira: registra cada get_many (id=in.(...) en Supabase)."""
+    remote = True
+
+    def __init__(self, products):
+        self.products, self.calls = products, []
+
+    async def get_many(self, ids):
+        self.calls.append(list(ids))
+        return {pid: self.products[pid] for pid in ids if pid in self.products}
+
+def test_quote_fetches_only_the_cart_ids_in_chunks(monkeypatch):
+    with TestClient(main.app) as c:
+        catalog = c.app.state.json_repo.catalog.snapshot.by_id
+    ids = sorted(catalog)[:5]
+    repo = _Repo({pid: catalog[pid] for pid in ids})
+    monkeypatch.setattr(main, "GET_MANY_CHUNK", 2)
+    cart = QuoteIn(items=[{"id": pid, "qty": 1} for pid in ids + [ids[0], "no-existe"]])
+    quote = asyncio.run(main._quote(cart, repo, main.RulesEngine()))
+    assert sorted(i for call in repo.calls for i in call) == sorted(ids + ["no-existe"])
+    assert all(len(call) <= 2 for call in repo.calls)
+    assert quote.subtotal == sum(catalog[pid].price for pid in ids + [ids[0]])
+    assert quote.warnings == ["Producto no-existe no existe."]
+
+def _ndjson(r):
+    return [json.loads(line) for line in r.text.splitlines()]
+
+def test_batch_matches_single_quotes_in_order():
+    carts = [{"items": [{"id": "kit-rm-home-26", "qty": 2}], "coupon": "HOLA10"},
+             {"items": [{"id": "kit-col-home-25", "qty": 1}], "delivery_city": "Medellín", "delivery_method": "express"},
+             {"items": [{"id": "kit-rm-home-26", "qty": 0}]},  # qty inválida: error en su renglón
+             {"items": [{"id": "no-existe", "qty": 1}]}]
+    with TestClient(main.app) as c:
+        as_json = c.post("/v1/pricing/quote:batch", json=carts)
+        as_ndjson = c.post("/v1/pricing/quote:batch", content="\n".join(json.dumps(x) for x in carts),
+                           headers={"Content-Type": "application/x-ndjson"})
+        singles = [c.post("/v1/pricing/quote", json=x) for x in carts]
+    assert as_json.headers["content-type"].startswith("application/x-ndjson")
+    rows = _ndjson(as_json)
+    assert rows == _ndjson(as_ndjson) and [r["index"] for r in rows] == [0, 1, 2, 3]
+    for row, single in zip(rows, singles):
+        if single.status_code == 200:
+            assert row["quote"] == single.json()
+        else:
+            assert "error" in row and single.status_code == 422
+
+def test_batch_limits(monkeypatch):
+    monkeypatch.setattr(main, "BATCH_QUOTE_MAX", 2)
+    with TestClient(main.app) as c:
+        assert c.post("/v1/pricing/quote:batch", json=[{"items": []}] * 3).status_code == 413
+        assert c.post("/v1/pricing/quote:batch", json={"items": []}).status_code == 400
+        assert c.post("/v1/pricing/quote:batch", content=b"{", headers={"Content-Type": "application/json"}).status_code == 400
@@ -0,0 +1,82 @@
+import asyncio
+import httpx
+import pytest
+from app import repository_supabase
+from app.repository_supabase import AsyncSupabaseRepo
+from app.reservations import OutOfStock
+from stubs import postgrest
+
+def _with_stub(fn):
+    async def run():
+        transport = httpx.ASGITransport(app=postgrest.app)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await fn(AsyncSupabaseRepo("http://stub", "key", client=client))
+    return asyncio.run(run())
+
+def test_search_values_are_quoted():
+    base = dict(postgrest.TABLES["products"][0])
+    odd = {**base, "id": "raro", "name": 'Camiseta "Retro", (edición 90)', "tags": ['a,b)', 'c"d']}
+    postgrest.TABLES["products"].append(odd)
+    try:
+        by_q = _with_stub(lambda repo: repo.products_list('"Retro", (edición', None, 50, 0))
+        by_tag = _with_stub(lambda repo: repo.products_list(None, None, 50, 0, filters={"tags": ['c"d']}))
+        other = _with_stub(lambda repo: repo.products_list(None, None, 50, 0, filters={"tags": ["a", "b)"]}))
+    finally:
+        postgrest.TABLES["products"].remove(odd)
+    assert [p["id"] for p in by_q] == ["raro"]
+    assert [p["id"] for p in by_tag] == ["raro"]
+    assert "raro" not in [p["id"] for p in other]
+
+def _flaky(failures, monkeypatch):
+    """Repo contra un transporte que falla con `failures` (status o excepción) y después responde []."""
+    monkeypatch.setattr(repository_supabase, "_backoff", lambda attempt: 0)
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        if len(calls) <= len(failures):
+            fail = failures[len(calls) - 1]
+            if isinstance(fail, Exception):
+                raise fail
+            return httpx.Response(fail)
+        return httpx.Response(200, json=[])
+
+    async def run(fn):
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await fn(AsyncSupabaseRepo("http://stub", "key", client=client))
+    return run, calls
+
+def test_reads_are_retried_on_5xx_and_transport_errors(monkeypatch):
+    run, calls = _flaky([503, httpx.ConnectError("caído")], monkeypatch)
+    assert asyncio.run(run(lambda repo: repo.products_list(None, None, 10, 0))) == []
+    assert calls == ["GET", "GET", "GET"]
+
+def test_writes_are_not_retried(monkeypatch):
+    run, calls = _flaky([503], monkeypatch)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(run(lambda repo: repo.product_create({"id": "x"})))
+    assert calls == ["POST"]
+
+def test_reads_give_up_after_the_retry_budget(monkeypatch):
+    run, calls = _flaky([503] * 10, monkeypatch)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(run(lambda repo: repo.products_list(None, None, 10, 0)))
+    assert len(calls) == repository_supabase.SUPABASE_RETRIES + 1
+
+def test_checkout_rpc_is_all_or_nothing():
+    a, b = postgrest.TABLES["products"][:2]
+    tables = ("orders", "order_items", "payment_sessions", "stock_holds")
+    before = {t: len(postgrest.TABLES.get(t, [])) for t in tables}
+    reserved = a.get("reserved", 0)
+    line = lambda p, qty: {"product_id": p["id"], "name": p["name"], "unit_price": p["price"], "qty": qty,
+                           "line": p["price"] * qty}
+    with pytest.raises(OutOfStock) as e:
+        _with_stub(lambda repo: repo.checkout_create({"total": 1}, [line(a, 1), line(b, b["stock"] + 1)], ""))
+    assert e.value.product_id == b["id"]
+    assert {t: len(postgrest.TABLES.get(t, [])) for t in tables} == before and a.get("reserved", 0) == reserved
+    created = _with_stub(lambda repo: repo.checkout_create({"total": 1}, [line(a, 1), line(b, 1)], ""))
+    oid = created["order"]["id"]
+    assert created["session"]["order_id"] == oid
+    order = _with_stub(lambda repo: repo.order_with_items(oid))
+    assert sorted(i["product_id"] for i in order["order_items"]) == sorted([a["id"], b["id"]])
+    _with_stub(lambda repo: repo.stock_holds_release(oid))
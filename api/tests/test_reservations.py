@@ -0,0 +1,102 @@
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app.checkout_local import LocalCheckoutStore
+from app.models import Product
+from app.reservations import OrderClosed, OutOfStock
+from stubs import postgrest
+
+def _store(stock: int = 5) -> LocalCheckoutStore:
+    return LocalCheckoutStore({"p1": Product(id="p1", name="P1", price=1000, stock=stock)}.get)
+
+def _checkout(store: LocalCheckoutStore, qty: int = 2) -> str:
+    items = [{"product_id": "p1", "name": "P1", "unit_price": 1000, "qty": qty, "line": 1000 * qty}]
+    return store.checkout_create({"total": 1000 * qty}, items, "")["order"]["id"]
+
+def test_second_approve_does_not_sell_twice():
+    store = _store()
+    oid = _checkout(store)
+    assert store.stock_holds_commit(oid) == ["p1"]
+    with pytest.raises(OrderClosed) as e:
+        store.stock_holds_commit(oid)
+    assert e.value.status == "paid"
+    assert store.stock.sold == {"p1": 2} and store.available("p1") == 3
+
+def test_approve_after_reject_sells_nothing():
+    store = _store()
+    oid = _checkout(store)
+    store.stock_holds_release(oid)
+    with pytest.raises(OrderClosed):
+        store.stock_holds_commit(oid)
+    assert store.stock.sold == {} and store.available("p1") == 5
+
+def test_pending_order_without_holds_commits_nothing():
+    store = _store()
+    oid = _checkout(store)
+    store.stock.release(oid)  # reserva resuelta por fuera; la orden sigue pending
+    assert store.stock_holds_commit(oid) == []
+    assert store.stock.sold == {} and store.order_with_items(oid)["status"] == "paid"
+
+def test_expired_order_takes_stock_again_or_fails():
+    store = _store(stock=3)
+    oid = _checkout(store)
+    store.stock.holds[oid] = (time.time() - 1, store.stock.holds[oid][1])
+    assert store.stock_holds_reap() == 1 and store.order_with_items(oid)["status"] == "expired"
+    other = _checkout(store)  # se lleva 2 de las 3 unidades liberadas
+    with pytest.raises(OutOfStock):
+        store.stock_holds_commit(oid)
+    store.stock_holds_release(other)
+    assert store.stock_holds_commit(oid) == ["p1"] and store.stock.sold == {"p1": 2}
+
+def test_stub_rpc_second_approve_is_closed():
+    with TestClient(postgrest.app) as c:
+        pid = postgrest.TABLES["products"][0]["id"]
+        stock = postgrest.TABLES["products"][0]["stock"]
+        created = c.post("/rest/v1/rpc/checkout_create", json={
+            "p_order": {"total": 1}, "p_items": [{"product_id": pid, "qty": 1, "unit_price": 1, "name": "x", "line": 1}],
+            "p_return_url": ""}).json()
+        oid = created["order"]["id"]
+        assert c.post("/rest/v1/rpc/stock_holds_commit", json={"p_order_id": oid}).json() == [pid]
+        again = c.post("/rest/v1/rpc/stock_holds_commit", json={"p_order_id": oid})
+        assert again.status_code == 400 and again.json()["message"] == "order_closed:paid"
+        assert postgrest.TABLES["products"][0]["stock"] == stock - 1
+
+def test_mockpay_approve_twice_with_different_keys_sells_once():
+    from app.main import app
+    with TestClient(app) as c:
+        stock = c.app.state.json_repo.orders.stock
+        before = stock.sold.get("kit-rm-home-26", 0)
+        r = c.post("/v1/checkout/start", json={"items": [{"id": "kit-rm-home-26", "qty": 1}]}).json()
+        form = {"session_id": r["session_id"], "order_id": r["order_id"], "action": "approve", "return": "http://x/r"}
+        for key in ("a", "b"):
+            res = c.post("/v1/payment/mock/submit", data=form, headers={"Idempotency-Key": key}, follow_redirects=False)
+            assert "status=success" in res.headers["location"]
+        assert stock.sold.get("kit-rm-home-26", 0) == before + 1
+
+def test_coupon_use_is_counted_on_approval_only():
+    from app.main import app
+    with TestClient(app) as c:
+        uses = c.app.state.rules.uses
+        cart = {"items": [{"id": "kit-rm-home-26", "qty": 1}], "coupon": "hola10"}
+        rejected = c.post("/v1/checkout/start", json=cart).json()
+        approved = c.post("/v1/checkout/start", json=cart).json()
+        assert uses.get("HOLA10", 0) == 0
+        for r, action in ((rejected, "reject"), (approved, "approve")):
+            form = {"session_id": r["session_id"], "order_id": r["order_id"], "action": action, "return": "http://x/r"}
+            c.post("/v1/payment/mock/submit", data=form, follow_redirects=False)
+        assert uses.get("HOLA10", 0) == 1
+
+def test_checkout_of_a_sold_out_line_is_409():
+    from app.main import app
+    with TestClient(app) as c:
+        repo = c.app.state.json_repo
+        by_id, pid = repo.catalog.snapshot.by_id, "kit-fcb-home-26"
+        prev = by_id[pid]
+        by_id[pid] = prev.model_copy(update={"stock": 0})  # la cotización deja el renglón en qty 0
+        try:
+            before = len(repo.orders.orders)
+            r = c.post("/v1/checkout/start", json={"items": [{"id": pid, "qty": 1}]})
+            assert r.status_code == 409 and pid in r.json()["detail"]
+            assert len(repo.orders.orders) == before
+        finally:
+            by_id[pid] = prev
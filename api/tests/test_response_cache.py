@@ -0,0 +1,45 @@
+import gzip
+from fastapi.testclient import TestClient
+from app.response_cache import ResponseCache, etag_matches
+
+def test_products_are_compressed_and_revalidated():
+    from app.main import app
+    with TestClient(app) as c:
+        plain = c.get("/v1/products", headers={"Accept-Encoding": "identity"})
+        zipped = c.get("/v1/products", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in plain.headers and zipped.headers["Content-Encoding"] == "gzip"
+        assert zipped.json() == plain.json()  # httpx ya descomprimió
+        assert zipped.headers["ETag"] == plain.headers["ETag"][:-1] + '-gz"'
+        assert zipped.headers["Vary"] == "Accept-Encoding"
+        for tag in (zipped.headers["ETag"], plain.headers["ETag"], "W/" + plain.headers["ETag"]):
+            r = c.get("/v1/products", headers={"Accept-Encoding": "gzip", "If-None-Match": tag})
+            assert r.status_code == 304 and r.content == b"" and "Content-Encoding" not in r.headers
+        other = c.get("/v1/products", params={"sort": "price"}, headers={"If-None-Match": plain.headers["ETag"]})
+        assert other.status_code == 200 and other.headers["ETag"] != plain.headers["ETag"]
+
+def test_gzip_refused_with_q_zero():
+    from app.main import app
+    with TestClient(app) as c:
+        r = c.get("/v1/products", headers={"Accept-Encoding": "gzip;q=0"})
+        assert "Content-Encoding" not in r.headers
+
+def test_small_bodies_are_not_compressed():
+    entry = ResponseCache(4).put("k", {"ok": True})
+    assert entry.gzip is None and entry.br is None
+    big = ResponseCache(4).put("k", {"items": ["x" * 100] * 20})
+    assert gzip.decompress(big.gzip) == big.identity
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    cache = ResponseCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)  # desaloja b, el menos usado
+    assert cache.get("b") is None and cache.get("a") is not None
+    cache.put("t", 4, ttl=-1)
+    assert cache.get("t") is None
+
+def test_etag_matches_lists_and_star():
+    assert etag_matches('"abc"', '"zzz", W/"abc-br"')
+    assert etag_matches('"abc"', "*")
+    assert not etag_matches('"abc"', '"abcd"')
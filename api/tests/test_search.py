@@ -0,0 +1,71 @@
+import random
+import pytest
+from bench.catalog import generate
+from app.models import Product
+from app.search import SearchIndex, normalize, tokenize
+
+PRODUCTS = [Product(**row) for row in generate(3000, seed=7)]
+INDEX = SearchIndex(PRODUCTS)
+
+def _brute(q=None, filters=None, min_price=None, max_price=None, in_stock=False):
+    def words(p):
+        out = set(tokenize(p.name))
+        for field in ("category", "club", "league", "season", "tags", "variant", "sku"):
+            v = getattr(p, field)
+            for x in (v.values() if isinstance(v, dict) else v if isinstance(v, list) else [v]):
+                out.update(tokenize(x))
+        return out
+
+    def facet(p, f):
+        v = getattr(p, f)
+        return {normalize(x) for x in (v if isinstance(v, list) else [v]) if x}
+    out = []
+    for p in PRODUCTS:
+        w = words(p)
+        if q and not all(any(x.startswith(t) for x in w) for t in tokenize(q)):
+            continue
+        if any(vals and not facet(p, f) & {normalize(v) for v in vals} for f, vals in (filters or {}).items()):
+            continue
+        if (min_price is not None and p.price < min_price) or (max_price is not None and p.price > max_price):
+            continue
+        if in_stock and not (p.stock or 0) > 0:
+            continue
+        out.append(p)
+    return out
+
+CASES = [
+    dict(in_stock=True),  # resultado denso: recorre el orden precalculado
+    dict(q="camis"),
+    dict(q="SELECCIÓN colom"),
+    dict(filters={"club": ["Real Madrid", "Liverpool"]}, in_stock=True),
+    dict(filters={"league": ["laliga"], "tags": ["top", "retro"]}, min_price=100_000, max_price=400_000),
+    dict(q="home 25/26", filters={"sizes": ["XL"]}),
+]
+
+@pytest.mark.parametrize("kw", CASES)
+@pytest.mark.parametrize("sort", [None, "name", "-price", "rating"])
+def test_search_matches_a_full_scan(kw, sort):
+    want = _brute(**kw)
+    items, total, _ = INDEX.search(sort=sort, limit=20, offset=5, **kw)
+    assert total == len(want)
+    if sort:
+        field, desc = sort.lstrip("-"), sort.startswith("-")
+        key = {"name": lambda p: (normalize(p.name), p.id), "price": lambda p: (p.price, p.id),
+               "rating": lambda p: (p.rating or 0, p.id)}[field]
+        want = sorted(want, key=key, reverse=desc)
+    assert [p.id for p in items] == [p.id for p in want[5:25]]
+
+def test_facet_counts_ignore_their_own_filter():
+    filters = {"club": ["Real Madrid"], "league": ["LaLiga"]}
+    _, total, counts = INDEX.search(filters=filters, facets=("club", "league"))
+    assert counts["club"]["Real Madrid"] == total
+    assert sum(counts["club"].values()) == len(_brute(filters={"league": ["LaLiga"]}))
+    assert counts["league"] == {"LaLiga": total}
+
+def test_cursor_after_continues_in_name_order():
+    first, total, _ = INDEX.search(q="camiseta", sort="name", limit=50)
+    last = first[-1]
+    rest, again, _ = INDEX.search(q="camiseta", limit=50, after=(last.name, last.id))
+    assert again == total
+    full, _, _ = INDEX.search(q="camiseta", sort="name", limit=100)
+    assert [p.id for p in first + rest] == [p.id for p in full]
@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app import startup
+from app.startup import Startup, warmup
+
+@pytest.fixture
+def fresh(monkeypatch):
+    s = Startup()
+    monkeypatch.setattr(startup, "STARTUP", s)
+    return s
+
+def test_warmup_goes_through_the_hot_paths(fresh):
+    from app.main import app
+    with TestClient(app):  # lifespan: catálogo y reglas cargados
+        asyncio.run(warmup(app, "/v1/products?limit=5 /health/ready", timeout=10))
+    assert fresh.warmed == [("/v1/products?limit=5", 200), ("/health/ready", 200), ("/v1/pricing/quote", 200)]
+
+def test_warmup_never_stops_the_startup(fresh):
+    async def broken(scope, receive, send):
+        raise RuntimeError("sin catálogo")
+
+    async def hangs(scope, receive, send):
+        await asyncio.sleep(60)
+    asyncio.run(warmup(broken, "/v1/products", timeout=1))
+    asyncio.run(warmup(hangs, "/v1/products", timeout=0.05))
+    asyncio.run(warmup(broken, "", timeout=1))
+    assert fresh.warmed == []
+
+def test_phases_are_recorded_in_order_even_on_error():
+    s = Startup()
+    with s.phase("catalog"):
+        pass
+    with pytest.raises(ValueError):
+        with s.phase("rules"):
+            raise ValueError("regla rota")
+    assert list(s.phases) == ["catalog", "rules"] and all(v >= 0 for v in s.phases.values())
+    assert not s.stats()["ready"]
+    s.ready()
+    assert s.stats()["ready"] and s.ready_at is not None
+
+def test_admin_startup_reports_the_lifespan_phases():
+    from app.main import app
+    with TestClient(app) as c:
+        body = c.get("/admin/startup").json()
+    assert body["ready"]
+    assert {"imports", "catalog", "rules", "warmup"} <= set(body["phases"])
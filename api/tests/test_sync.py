@@ -0,0 +1,31 @@
+import json, os
+from app.sync import CatalogSync
+
+def _row(pid: str, at: str) -> dict:
+    with open(os.path.join(os.path.dirname(__file__), "..", "data", "products.json"), "r", encoding="utf-8") as f:
+        base = json.load(f)[0]
+    return {**base, "id": pid, "name": pid, "updated_at": at}
+
+def _sync(tmp_path) -> CatalogSync:
+    sync = CatalogSync(path=str(tmp_path / "catalog.json"), column="updated_at")
+    sync._apply([_row("a", "2026-01-01T00:00:00"), _row("b", "2026-01-01T00:00:00")], [], full=True)
+    return sync
+
+def test_tombstone_removes_the_row(tmp_path):
+    sync = _sync(tmp_path)
+    assert sync._apply([], [{"id": "a", "deleted_at": "2026-01-02T00:00:00"}], full=False) == 1
+    assert sorted(sync.products) == ["b"] and sync.repo.get_many(["a"]) == {}
+
+def test_reinsert_after_delete_wins_over_tombstone(tmp_path):
+    sync = _sync(tmp_path)
+    # la misma ronda trae la lápida y la fila insertada de nuevo después del borrado
+    sync._apply([_row("a", "2026-01-03T00:00:00")], [{"id": "a", "deleted_at": "2026-01-02T00:00:00"}], full=False)
+    assert sorted(sync.products) == ["a", "b"]
+    # y la lápida vuelve a llegar por la ventana de overlap: tampoco borra
+    sync._apply([], [{"id": "a", "deleted_at": "2026-01-02T00:00:00"}], full=False)
+    assert "a" in sync.repo.get_many(["a"])
+
+def test_delete_after_reinsert_removes_it(tmp_path):
+    sync = _sync(tmp_path)
+    sync._apply([_row("a", "2026-01-03T00:00:00")], [{"id": "a", "deleted_at": "2026-01-04T00:00:00"}], full=False)
+    assert sorted(sync.products) == ["b"]
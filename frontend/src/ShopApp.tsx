@@ -1,9 +1,10 @@
-import { useEffect, useMemo, useState } from 'react'
+import { useEffect, useMemo, useRef, useState } from 'react'
 import { useCart, type Product } from './store/cart'
 import { supabase } from './lib/supabase'
 import './App.css'
 
-type ProdEx = Product & { category?: string }
+// img_srcset: derivados de la API por formato (avif, webp), ya en el orden de preferencia
+type ProdEx = Product & { category?: string; img_srcset?: Record<string, string> }
 
 
 const API_URL = (import.meta as any).env?.VITE_API_URL || 'http://localhost:8000'
@@ -72,6 +73,8 @@ export default function ShopApp() {
 
   const waLink = `https://wa.me/573136833122?text=${waText}`
 
+  const checkoutKey = useRef<{ payload: string; key: string } | null>(null)
+
   async function startCheckout() {
     try {
       const body = {
@@ -81,10 +84,16 @@ export default function ShopApp() {
         delivery_method: 'standard'
       }
 
+      // misma clave mientras el carrito no cambie: reintentos y doble click no duplican la orden
+      const payload = JSON.stringify(body)
+      if (checkoutKey.current?.payload !== payload) {
+        checkoutKey.current = { payload, key: crypto.randomUUID() }
+      }
+
       const res = await fetch(`${API_URL}/v1/checkout/start`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(body)
+        headers: { 'Content-Type': 'application/json', 'Idempotency-Key': checkoutKey.current.key },
+        body: payload
       })
 
       if (!res.ok) throw new Error('Error en checkout')
@@ -145,7 +154,14 @@ export default function ShopApp() {
           {filtered.map(p => (
             <article key={p.id} className="card pro">
               <div className="thumb ar-4-3">
-                {p.img ? <img src={p.img} alt={p.name} /> : <div className="ph" />}
+                {p.img ? (
+                  <picture>
+                    {Object.entries(p.img_srcset ?? {}).map(([fmt, set]) => (
+                      <source key={fmt} type={`image/${fmt}`} srcSet={set} sizes="(max-width: 600px) 100vw, 360px" />
+                    ))}
+                    <img src={p.img} alt={p.name} loading="lazy" decoding="async" />
+                  </picture>
+                ) : <div className="ph" />}
               </div>
               <h3>{p.name}</h3>
               <div className="muted">{p.category}</div>
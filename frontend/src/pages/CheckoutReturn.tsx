@@ -53,7 +53,8 @@ export default function CheckoutReturn() {
 
     const load = async () => {
       try {
-        const res = await fetch(`${API_URL}/v1/orders/${orderId}`)
+        // long-poll: si el pago aún figura pendiente, la API responde apenas cambie
+        const res = await fetch(`${API_URL}/v1/orders/${orderId}?wait=10`)
         if (!res.ok) throw new Error('No se encontró la orden')
         const data = await res.json()
         setOrder(data as Order)